@@ -0,0 +1,191 @@
+"""
+Fake Pool - In-process Stratum v1 server for tests and benchmarks
+
+Speaks enough of the protocol for PoolClient: configure (version
+rolling), subscribe, authorize, set_difficulty, notify and submit.
+Submitted shares are checked the way a
+real pool checks them (rebuilt header, share target, known job, no
+duplicates), so end-to-end runs exercise the full header path.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+try:
+    from .stratum import VERSION_ROLLING_MASK, build_header, difficulty_to_target, header_hash_value
+except ImportError:
+    from stratum import VERSION_ROLLING_MASK, build_header, difficulty_to_target, header_hash_value  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+
+class FakePool:
+    """Stratum v1 pool on localhost"""
+
+    def __init__(self, difficulty: float = 1.0, extranonce2_size: int = 4, reply_delay: float = 0.0,
+                 version_mask: int = VERSION_ROLLING_MASK):
+        self.difficulty = difficulty
+        self.extranonce2_size = extranonce2_size
+        # Version bits clients may roll; 0 answers mining.configure like a
+        # pool without BIP 310
+        self.version_mask = version_mask
+        # Artificial pool latency, applied to every reply
+        self.reply_delay = reply_delay
+
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.port = 0
+        self.clients: Dict[asyncio.StreamWriter, str] = {}
+        self.version_masks: Dict[asyncio.StreamWriter, int] = {}
+        self.jobs: Dict[str, Dict] = {}
+        self.job: Optional[Dict] = None
+        self._job_counter = 0
+        self._extranonce1_counter = 0
+
+        self.accepted: List[Tuple] = []
+        self.rejected: List[Tuple] = []
+        self._seen: Set[Tuple] = set()
+
+    async def start(self, host: str = '127.0.0.1') -> int:
+        """Listen on a free port and return it"""
+        self.new_job(clean=True, announce=False)
+        self.server = await asyncio.start_server(self._serve, host, 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.port
+
+    @property
+    def url(self) -> str:
+        """pool_url for a PoolClient config"""
+        return f"stratum+tcp://127.0.0.1:{self.port}"
+
+    async def stop(self):
+        """Close the server and all client connections"""
+        for writer in list(self.clients):
+            writer.close()
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    def new_job(self, clean: bool = False, announce: bool = True) -> Dict:
+        """Create a job with random coinbase and merkle branch"""
+        self._job_counter += 1
+        job: Dict[str, Any] = {
+            'job_id': format(self._job_counter, 'x'),
+            'prevhash': os.urandom(32).hex(),
+            'coinb1': '01000000010000' + os.urandom(20).hex(),
+            'coinb2': os.urandom(24).hex() + 'ffffffff',
+            'merkle_branch': [os.urandom(32).hex() for _ in range(2)],
+            'version': '20000000',
+            'nbits': '1d00ffff',
+            'ntime': format(int(time.time()), '08x'),
+            'clean_jobs': clean
+        }
+        if clean:
+            self.jobs.clear()
+        self.jobs[job['job_id']] = job
+        self.job = job
+        if announce:
+            for writer in self.clients:
+                self._notify(writer, job)
+        return job
+
+    def set_difficulty(self, difficulty: float):
+        """Change the share difficulty for all clients"""
+        self.difficulty = difficulty
+        for writer in self.clients:
+            self._send(writer, {'id': None, 'method': 'mining.set_difficulty', 'params': [difficulty]})
+
+    def _notify(self, writer: asyncio.StreamWriter, job: Dict):
+        params = [job['job_id'], job['prevhash'], job['coinb1'], job['coinb2'], job['merkle_branch'],
+                  job['version'], job['nbits'], job['ntime'], job['clean_jobs']]
+        self._send(writer, {'id': None, 'method': 'mining.notify', 'params': params})
+
+    @staticmethod
+    def _send(writer: asyncio.StreamWriter, message: Dict):
+        writer.write(json.dumps(message).encode() + b'\n')
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._extranonce1_counter += 1
+        self.clients[writer] = format(self._extranonce1_counter, '08x')
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                self._handle(writer, json.loads(line))
+                await writer.drain()
+        except (ConnectionError, ValueError) as e:
+            logger.debug(f"Fake pool client dropped: {e}")
+        finally:
+            self.clients.pop(writer, None)
+            self.version_masks.pop(writer, None)
+            writer.close()
+
+    def _handle(self, writer: asyncio.StreamWriter, request: Dict):
+        method, params, request_id = request.get('method'), request.get('params') or [], request.get('id')
+        result: Any = None
+        error: Optional[List] = None
+        if method == 'mining.configure' and self.version_mask:
+            extensions, options = (params + [[], {}])[:2]
+            result = {}
+            if 'version-rolling' in extensions:
+                mask = int(options.get('version-rolling.mask', 'ffffffff'), 16) & self.version_mask
+                self.version_masks[writer] = mask
+                result = {'version-rolling': True, 'version-rolling.mask': format(mask, '08x')}
+        elif method == 'mining.subscribe':
+            result = [[['mining.notify', 'fake']], self.clients[writer], self.extranonce2_size]
+        elif method == 'mining.authorize':
+            result = True
+        elif method == 'mining.submit':
+            error = self._check_share(self.clients[writer], params, self.version_masks.get(writer, 0))
+            result = error is None
+        else:
+            error = [20, f"Unknown method {method}", None]
+
+        replies = [{'id': request_id, 'result': result, 'error': error}]
+        if method == 'mining.authorize':
+            replies.append({'id': None, 'method': 'mining.set_difficulty', 'params': [self.difficulty]})
+        if self.reply_delay:
+            # Every reply is delayed by the same amount, so they keep their
+            # order and requests still overlap like on a real link
+            asyncio.get_running_loop().call_later(self.reply_delay, self._send_all, writer, replies,
+                                                  method == 'mining.authorize')
+        else:
+            self._send_all(writer, replies, method == 'mining.authorize')
+
+    def _send_all(self, writer: asyncio.StreamWriter, replies: List[Dict], notify: bool):
+        if writer.is_closing():
+            return
+        for reply in replies:
+            self._send(writer, reply)
+        if notify and self.job is not None:
+            self._notify(writer, self.job)
+
+    def _check_share(self, extranonce1: str, params: List, version_mask: int = 0) -> Optional[List]:
+        """Pool-side share validation; returns a Stratum error or None"""
+        _, job_id, extranonce2, ntime, nonce = params[:5]
+        version_bits = int(params[5], 16) if len(params) > 5 else 0
+        share = (job_id, extranonce1, extranonce2, ntime, nonce, version_bits)
+        job = self.jobs.get(job_id)
+        if job is None:
+            error = [21, "Job not found", None]
+        elif share in self._seen:
+            error = [22, "Duplicate share", None]
+        elif version_bits & ~version_mask:
+            error = [20, "Version bits outside mask", None]
+        else:
+            version = (int(job['version'], 16) & ~version_mask) | version_bits
+            header = build_header(job, extranonce1, extranonce2, ntime, int(nonce, 16), version)
+            if header_hash_value(header) > int(difficulty_to_target(self.difficulty), 16):
+                error = [23, "Low difficulty share", None]
+            else:
+                error = None
+        if error is None:
+            self._seen.add(share)
+            self.accepted.append(share)
+        else:
+            self.rejected.append(share)
+        return error
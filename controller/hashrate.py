@@ -0,0 +1,129 @@
+"""
+Hashrate Meter - EWMA and fixed-window hashrate estimation
+
+Workers report hashes as (count, seconds) samples from PROGRESS and RESULT.
+Each meter keeps an exponentially weighted rate and a sliding window of
+hash counts in fixed time buckets. Meters chain to a parent (worker -> bank
+-> fleet) so group rates stay current with O(1) work per sample.
+"""
+
+import math
+from typing import Dict, Optional
+
+
+def target_hashes(target: str) -> float:
+    """Expected number of hashes to find one share below target"""
+    return 2**256 / (int(target, 16) + 1)
+
+
+class HashrateMeter:
+    """Hashrate of one worker, or of a group when used as a parent"""
+
+    def __init__(self, window: float = 60.0, half_life: float = 30.0, buckets: int = 12,
+                 parent: Optional["HashrateMeter"] = None):
+        self.window = window
+        self.half_life = half_life
+        self.parent = parent
+
+        # Group meters hold the sum of their children's EWMAs
+        self.ewma = 0.0
+        self.samples = 0
+        self.total_hashes = 0
+        self.started: Optional[float] = None
+
+        # Ring of hash counts, one slot per window / buckets seconds
+        self._bucket_seconds = window / buckets
+        self._counts = [0] * buckets
+        self._slots = [-1] * buckets
+
+        # Work implied by verified shares, to cross-check reported counts
+        self.shares = 0
+        self.share_hashes = 0.0
+
+    @property
+    def rate(self) -> float:
+        """EWMA hashrate (H/s)"""
+        # Group sums can drift a hair below zero as members are cleared
+        return max(0.0, self.ewma)
+
+    def record(self, hashes: int, seconds: float, now: float):
+        """Add hashes computed over the last seconds (PROGRESS/RESULT)"""
+        if seconds > 0:
+            rate = hashes / seconds
+            if self.samples == 0:
+                new = rate
+            else:
+                # Weight by the time the sample covers, not one per report
+                alpha = 1.0 - math.pow(0.5, seconds / self.half_life)
+                new = self.ewma + alpha * (rate - self.ewma)
+            self.samples += 1
+            self._shift(new - self.ewma)
+        self._count(hashes, now - max(seconds, 0.0), now)
+
+    def record_share(self, target: str):
+        """Count a pool-accepted share found at target"""
+        meter: Optional[HashrateMeter] = self
+        expected = target_hashes(target)
+        while meter is not None:
+            meter.shares += 1
+            meter.share_hashes += expected
+            meter = meter.parent
+
+    def clear(self):
+        """Drop this meter's rate from its groups (worker lost)"""
+        self._shift(-self.ewma)
+        self.samples = 0
+
+    def attach(self, parent: Optional["HashrateMeter"]):
+        """Move this meter (and its current rate) under another parent"""
+        if self.parent is not None:
+            self.parent._shift(-self.ewma)
+        self.parent = parent
+        if parent is not None:
+            parent._shift(self.ewma)
+
+    def _shift(self, delta: float):
+        meter: Optional[HashrateMeter] = self
+        while meter is not None:
+            meter.ewma += delta
+            meter = meter.parent
+
+    def _count(self, hashes: int, since: float, now: float):
+        meter: Optional[HashrateMeter] = self
+        while meter is not None:
+            if meter.started is None or since < meter.started:
+                meter.started = since
+            meter.total_hashes += hashes
+            slot = int(now // meter._bucket_seconds)
+            idx = slot % len(meter._counts)
+            if meter._slots[idx] != slot:
+                meter._slots[idx] = slot
+                meter._counts[idx] = 0
+            meter._counts[idx] += hashes
+            meter = meter.parent
+
+    def window_rate(self, now: float) -> float:
+        """Hashes per second over the last window seconds"""
+        if self.started is None:
+            return 0.0
+        oldest = int(now // self._bucket_seconds) - len(self._counts)
+        hashes = sum(count for count, slot in zip(self._counts, self._slots) if slot > oldest)
+        span = min(self.window, now - self.started)
+        return hashes / span if span > 0 else 0.0
+
+    def share_rate(self, now: float) -> float:
+        """Hashrate implied by accepted shares since the first sample"""
+        if self.started is None or now <= self.started:
+            return 0.0
+        return self.share_hashes / (now - self.started)
+
+    def as_dict(self, now: float) -> Dict:
+        """Rates for stats output"""
+        return {
+            'ewma': self.rate,
+            'window': self.window_rate(now),
+            'window_seconds': self.window,
+            'total_hashes': self.total_hashes,
+            'shares': self.shares,
+            'share_rate': self.share_rate(now)
+        }
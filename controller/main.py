@@ -6,7 +6,7 @@ Manages work distribution to Pico workers via USB
 
 import asyncio
 import logging
-from typing import List
+from typing import Dict, List
 from datetime import datetime
 import os
 import sys
@@ -45,14 +45,41 @@ class BitcoinMinerController:
         # Initialize components with config
         workers_per_bank = self.config.get('worker_settings', {}).get('workers_per_bank', 4)
         number_of_banks = self.config.get('worker_settings', {}).get('number_of_banks', 3)
+        progress_ms = self.config.get('worker_settings', {}).get('progress_interval_ms', 5000)
+        max_concurrent = self.config.get('worker_settings', {}).get('max_concurrent_connects', 8)
+        handshake_timeout = self.config.get('worker_settings', {}).get('handshake_timeout', 1.0)
+        handshake_retries = self.config.get('worker_settings', {}).get('handshake_retries', 3)
+        reconnect_timeout = self.config.get('worker_settings', {}).get('reconnect_timeout', 10)
+        scan_interval = self.config.get('worker_settings', {}).get('port_scan_interval', 2.0)
+        heartbeat_interval = self.config.get('worker_settings', {}).get('heartbeat_interval', 5.0)
+        heartbeat_timeout = self.config.get('worker_settings', {}).get('heartbeat_timeout', 5.0)
+        max_missed = self.config.get('worker_settings', {}).get('max_missed_heartbeats', 3)
+        bench_ms = self.config.get('worker_settings', {}).get('bench_ms', 1000)
         
-        self.worker_manager = WorkerManager(workers_per_bank, number_of_banks)
-        self.mining_coordinator = MiningCoordinator()
-        self.pool_client = PoolClient(config_path)
+        self.worker_manager = WorkerManager(workers_per_bank, number_of_banks, progress_ms,
+                                            max_concurrent, handshake_timeout, handshake_retries,
+                                            reconnect_timeout, scan_interval,
+                                            heartbeat_interval, heartbeat_timeout, max_missed,
+                                            bench_ms)
+        lease_seconds = self.config.get('mining_settings', {}).get('lease_seconds', 10.0)
+        self.work_timeout = self.config.get('mining_settings', {}).get('work_timeout', 30)
+        ntime_roll = self.config.get('mining_settings', {}).get('ntime_roll', 60)
+        
+        request_timeout = self.config.get('mining_settings', {}).get('pool_request_timeout', 10.0)
+        max_pending = self.config.get('mining_settings', {}).get('max_pending_submits', 32)
+        self.pool_client = PoolClient(config_path, request_timeout, max_pending)
+        # Share-implied hashrate only counts what the pool accepted
+        self.pool_client.on_accepted = self._credit_share
+        # Headers are built locally from the pool's job, so a used-up nonce
+        # space rolls to the next extranonce2 without a pool round trip
+        self.mining_coordinator = MiningCoordinator(lease_seconds, meter=self.worker_manager.fleet_meter,
+                                                    work_source=self.pool_client.next_work,
+                                                    ntime_roll=ntime_roll)
         self.dashboard = Dashboard()
         
         self.is_running = False
         self.start_time = None
+        self.background_tasks: List[asyncio.Task] = []
     
     def _load_config(self, config_path: str):
         """Load mining configuration"""
@@ -66,18 +93,62 @@ class BitcoinMinerController:
         
     async def initialize(self):
         """Initialize all components"""
+        # Fetch a job first so each worker can start hashing as soon as its
+        # own handshake completes
+        logger.info("Connecting to mining pool...")
+        await self.pool_client.connect()
+        work = await self.pool_client.get_work()
+        if work:
+            self.mining_coordinator.set_work(work)
+        
         logger.info("Discovering and connecting to Pico workers...")
-        await self.worker_manager.discover_workers()
+        await self.worker_manager.discover_workers(on_ready=self._start_worker)
         
         bank_count = self.worker_manager.get_bank_count()
         logger.info(f"Found {self.worker_manager.worker_count} workers across {bank_count} banks")
         
-        logger.info("Connecting to mining pool...")
-        await self.pool_client.connect()
+        # Keep watching for boards being unplugged, plugged back in or hung,
+        # and handle their messages as they arrive
+        self.background_tasks = [
+            asyncio.create_task(self.mining_coordinator.process_messages(self._submit_share)),
+            asyncio.create_task(
+                self.worker_manager.monitor(on_ready=self._start_worker, on_lost=self._release_worker)
+            ),
+            asyncio.create_task(
+                self.worker_manager.heartbeat(on_ready=self._start_worker, on_lost=self._release_worker)
+            )
+        ]
         
         logger.info("Starting dashboard...")
         await self.dashboard.start()
         
+    async def _start_worker(self, worker):
+        """Give a freshly connected worker leases from the current job"""
+        worker.on_message = self._on_worker_message
+        await self.mining_coordinator.add_worker(worker)
+    
+    def _on_worker_message(self, worker, message):
+        """Pass a worker's RESULT/PROGRESS to the coordinator (event loop)"""
+        self.mining_coordinator.post_message(worker, message)
+    
+    async def _submit_share(self, share: Dict):
+        """Submit a verified share to the pool as soon as it is found"""
+        logger.info(f"Valid share found by worker {share['worker_id']}")
+        # The pool's reply is counted when it arrives; only a full pipeline
+        # of unanswered shares makes this wait
+        await self.pool_client.submit(share)
+        
+    def _credit_share(self, share: Dict):
+        """Count an accepted share on its worker's meter (and bank and fleet)"""
+        for worker in self.worker_manager.workers:
+            if worker.worker_id == share['worker_id']:
+                worker.meter.record_share(share['target'])
+                return
+        
+    async def _release_worker(self, worker):
+        """Return a dropped worker's unfinished range to the coordinator"""
+        self.mining_coordinator.release_worker(worker)
+        
     async def run(self):
         """Main mining loop"""
         self.is_running = True
@@ -87,31 +158,27 @@ class BitcoinMinerController:
         
         try:
             while self.is_running:
-                # Get work from mining pool
-                work = await self.pool_client.get_work()
+                # Switch every worker to a new header when the pool sent a
+                # job or the current one is older than work_timeout
+                if (self.pool_client.new_job.is_set() or
+                        self.mining_coordinator.needs_work(self.work_timeout)):
+                    work = await self.pool_client.get_work()
+                    if work:
+                        # Workers lease ranges of the new job from here on
+                        await self.mining_coordinator.distribute_work(
+                            work, 
+                            self.worker_manager.get_active_workers()
+                        )
+                
+                # Leases of workers that went silent go to the others
+                await self.mining_coordinator.reissue_expired()
                 
-                if work:
-                    # Distribute work to Pico workers
-                    await self.mining_coordinator.distribute_work(
-                        work, 
-                        self.worker_manager.get_active_workers()
-                    )
-                    
-                    # Collect results from workers
-                    results = await self.mining_coordinator.collect_results(timeout=5.0)
-                    
-                    # Submit any valid solutions
-                    for result in results:
-                        if result['valid']:
-                            logger.info(f"Valid share found by worker {result['worker_id']}")
-                            await self.pool_client.submit_work(result)
-                    
-                    # Update dashboard
-                    await self.dashboard.update_stats(
-                        workers=self.worker_manager.get_worker_stats(),
-                        hashrate=self.mining_coordinator.get_total_hashrate(),
-                        shares=self.pool_client.get_share_stats()
-                    )
+                # Update dashboard
+                await self.dashboard.update_stats(
+                    workers=self.worker_manager.get_worker_stats(),
+                    hashrate=self.mining_coordinator.get_total_hashrate(),
+                    shares=self.pool_client.get_share_stats()
+                )
                 
                 await asyncio.sleep(0.1)  # Small delay to prevent CPU spinning
                 
@@ -127,6 +194,8 @@ class BitcoinMinerController:
         logger.info("Shutting down mining controller...")
         self.is_running = False
         
+        for task in self.background_tasks:
+            task.cancel()
         await self.mining_coordinator.stop_all_workers()
         await self.pool_client.disconnect()
         await self.dashboard.stop()
@@ -4,22 +4,71 @@ Mining Coordinator - Distributes work and coordinates mining operations
 
 import asyncio
 import logging
-from typing import List, Dict
-import hashlib
-import struct
+import time
+from typing import Any, Awaitable, Callable, List, Dict, Optional, Tuple
+
+try:
+    from .hashrate import HashrateMeter
+    from .nonce_scheduler import NonceLease, NonceScheduler
+    from .share_verifier import DUPLICATE, DuplicateFilter, ShareVerifier
+except ImportError:
+    from hashrate import HashrateMeter  # type: ignore
+    from nonce_scheduler import NonceLease, NonceScheduler  # type: ignore
+    from share_verifier import DUPLICATE, DuplicateFilter, ShareVerifier  # type: ignore
 
 logger = logging.getLogger(__name__)
 
+# Nonces behind a worker's last PROGRESS frontier that may still be in
+# flight (one scan slice per core) and are re-mined after a drop
+RESUME_MARGIN = 512
+
+ShareCallback = Callable[[Dict], Awaitable[Any]]
+WorkSource = Callable[[], Optional[Dict]]
+
 
 class MiningCoordinator:
     """Coordinates mining work distribution and result collection"""
     
-    def __init__(self):
-        self.current_work = None
-        self.nonce_ranges = []
-        self.results = []
+    def __init__(self, lease_seconds: float = 10.0, min_lease: int = 256, max_lease: int = 2**24,
+                 steal_margin: float = 5.0, meter: Optional[HashrateMeter] = None,
+                 work_source: Optional[WorkSource] = None, ntime_roll: int = 0):
+        self.current_work: Optional[Dict] = None
+        self.scheduler: Optional[NonceScheduler] = None
+        self.workers: Dict[int, Any] = {}
+        # Every worker's RESULT/PROGRESS fans in here, in arrival order
+        self.inbox: "asyncio.Queue[Tuple[Any, Dict]]" = asyncio.Queue()
+        # Shares are checked against the verifier of the job each lease was
+        # cut from (target and midstate parsed once per job) and its bounds
+        self.verifier: Optional[ShareVerifier] = None
+        self.lease_verifiers: Dict[int, Tuple[ShareVerifier, int, int]] = {}
+        # Shares already submitted for recent jobs; a reissued lease or a
+        # reconnected worker may find the same share again
+        self.duplicates = DuplicateFilter()
+        self.shares_found = 0
+        self.shares_invalid = 0
+        self.rejected: Dict[str, int] = {}
+        # Fleet-wide hashrate (the worker manager's meter when given one)
+        self.meter = meter if meter is not None else HashrateMeter()
         self.total_hashes = 0
-        self.start_time = None
+        self.start_time: Optional[float] = None
+        self.job_started: Optional[float] = None
+        
+        # Each WORK/QUEUE is a lease sized to last about lease_seconds at
+        # the worker's hashrate
+        self.lease_seconds = lease_seconds
+        self.min_lease = min_lease
+        self.max_lease = max_lease
+        # Queued leases are only split if their holder stays busy this long
+        self.steal_margin = steal_margin
+        # Builds the next header of the current job (new extranonce2) once
+        # every nonce of this one is leased, instead of waiting on the pool
+        self.work_source = work_source
+        # Seconds a worker may move ntime forward to keep hashing after its
+        # range runs out with nothing queued
+        self.ntime_roll = ntime_roll
+        # One feed per worker at a time; a restart waits for the one in
+        # flight instead of being dropped
+        self._feed_locks: Dict[int, asyncio.Lock] = {}
         
     async def distribute_work(self, work: Dict, workers: List):
         """Distribute mining work across all workers"""
@@ -27,56 +76,344 @@ class MiningCoordinator:
             logger.warning("No workers available for work distribution")
             return
         
+        self.set_work(work)
+        
+        for worker in workers:
+            await self.add_worker(worker)
+    
+    def set_work(self, work: Dict) -> NonceScheduler:
+        """Make work the current job with a fresh nonce pool (returned)"""
+        # Shares still in flight for the outgoing job can be verified, those
+        # for older jobs are stale anyway
+        self.lease_verifiers = {lease_id: entry for lease_id, entry in self.lease_verifiers.items()
+                                if entry[0] is self.verifier}
         self.current_work = work
-        num_workers = len(workers)
+        self.verifier = ShareVerifier.for_work(work, self.ntime_roll)
+        self.duplicates.start_job(work.get('job_id'))
+        self.job_started = time.monotonic()
+        self.scheduler = NonceScheduler(work.get('job_id'), self.lease_seconds,
+                                        self.min_lease, self.max_lease)
+        return self.scheduler
+    
+    def needs_work(self, max_age: float) -> bool:
+        """True without a job, once it is exhausted, or after max_age seconds"""
+        if self.scheduler is None or self.job_started is None:
+            return True
+        return self.scheduler.exhausted or time.monotonic() - self.job_started >= max_age
+    
+    async def add_worker(self, worker) -> bool:
+        """Start a worker on the current job with a lease to mine and one queued"""
+        self.workers[worker.worker_id] = worker
+        if self.scheduler is None:
+            return False
+        return await self._feed(worker, restart=True)
+    
+    async def refill_worker(self, worker) -> bool:
+        """Queue the worker's next lease if its prefetch slot is empty"""
+        if not worker.needs_prefetch:
+            return False
+        return await self._feed(worker)
+    
+    async def _feed(self, worker, restart: bool = False) -> bool:
+        """Send WORK to an idle worker (or on restart), then prefetch behind it"""
+        lock = self._feed_locks.get(worker.worker_id)
+        if lock is None:
+            lock = self._feed_locks[worker.worker_id] = asyncio.Lock()
+        if lock.locked() and not restart:
+            # The feed in flight tops the worker up anyway
+            return False
+        async with lock:
+            if self.scheduler is None:
+                return False
+            if restart:
+                # Anything it held before (e.g. ahead of a reconnect, or leased
+                # by the feed this one waited on) is replaced
+                self.scheduler.release_worker(worker.worker_id)
+            if restart or worker.active_work is None:
+                work_packet = await self._next_packet(worker)
+                if work_packet is None:
+                    return False
+                if not await worker.send_work(work_packet):
+                    self._cancel(work_packet['lease'])
+                    logger.warning(f"Failed to send work to worker {worker.worker_id}")
+                    return False
+                logger.debug(f"Sent work to worker {worker.worker_id}: nonce range "
+                             f"{work_packet['start_nonce']}-{work_packet['end_nonce']}")
+            
+            # Prefetch the next lease so the worker never waits on the controller
+            if not worker.needs_prefetch:
+                return True
+            work_packet = await self._next_packet(worker, steal=False)
+            if work_packet is None:
+                return restart
+            if not await worker.queue_work(work_packet):
+                self._cancel(work_packet['lease'])
+                return False
+            return True
+    
+    def _cancel(self, lease_id: int):
+        """Return an undelivered lease to the pool"""
+        if self.scheduler is not None:
+            self.scheduler.cancel(lease_id)
+    
+    async def _next_packet(self, worker, steal: bool = True) -> Optional[Dict]:
+        """Lease the next range for a worker, rolling or stealing once the pool is dry"""
+        if self.scheduler is None or self.current_work is None:
+            return None
+        lease = self.scheduler.issue(worker.worker_id, self.worker_rate(worker), time.monotonic())
+        if lease is None and self.work_source is not None:
+            lease = self._roll_work(worker)
+        if lease is None and steal:
+            # Only an idle worker steals; a prefetch slot can wait
+            lease = await self._steal(worker)
+        if lease is None:
+            return None
+        return self._packet(lease)
+    
+    def _roll_work(self, worker) -> Optional[NonceLease]:
+        """Switch to a fresh header from work_source and lease from it"""
+        work = self.work_source() if self.work_source is not None else None
+        if work is None:
+            return None
+        logger.debug(f"Nonce space used up, rolling job {work.get('job_id')} to "
+                     f"extranonce2 {work.get('extranonce2')}")
+        scheduler = self.set_work(work)
+        return scheduler.issue(worker.worker_id, self.worker_rate(worker), time.monotonic())
+    
+    def _packet(self, lease: NonceLease) -> Optional[Dict]:
+        """Build the WORK/QUEUE payload for a lease, None without a current job"""
+        work, verifier = self.current_work, self.verifier
+        if work is None or verifier is None:
+            return None
+        self.lease_verifiers[lease.lease_id] = (verifier, lease.start, lease.end)
+        return {
+            'block_header': work['block_header'],
+            'target': work['target'],
+            'start_nonce': lease.start,
+            'end_nonce': lease.end,
+            'lease': lease.lease_id,
+            'ntime_roll': self.ntime_roll,
+            # Version bits the worker may roll (BIP 310); its nonce range is
+            # its own, so every lease can use the whole negotiated mask
+            'version_mask': verifier.version_mask,
+            'timestamp': work.get('timestamp')
+        }
+    
+    async def _steal(self, thief) -> Optional[NonceLease]:
+        """Split the largest lease another busy worker has queued but not started"""
+        scheduler = self.scheduler
+        if scheduler is None:
+            return None
+        best = None
+        for victim in self.workers.values():
+            if victim is thief or not victim.is_connected or not victim.queued_work:
+                continue
+            lease = scheduler.leases.get(victim.queued_work.get('lease'))
+            if lease is None or self._busy_for(victim) < self.steal_margin:
+                continue
+            if best is None or lease.size > best[1].size:
+                best = (victim, lease)
+        if best is None:
+            return None
         
-        # Calculate nonce ranges for each worker
-        # Bitcoin nonce is 32-bit (0 to 4,294,967,295)
-        total_nonce_space = 2**32
-        nonce_per_worker = total_nonce_space // num_workers
+        victim, lease = best
+        parts = scheduler.split(lease.lease_id, thief.worker_id, self.worker_rate(thief), time.monotonic())
+        if parts is None:
+            return None
+        front, back = parts
         
-        self.nonce_ranges = []
+        # The victim's queue slot is overwritten with the part it keeps
+        packet = self._packet(front)
+        if packet is None or not await victim.queue_work(packet):
+            scheduler.cancel(front.lease_id)
+        logger.debug(f"Worker {thief.worker_id} stole nonces {back.start}-{back.end} "
+                     f"from worker {victim.worker_id}")
+        return back
+    
+    def _busy_for(self, worker) -> float:
+        """Estimated seconds until a worker finishes its active lease"""
+        active = worker.active_work
+        if not active:
+            return 0.0
+        frontier = active['start_nonce']
+        last_nonce = getattr(worker, 'last_nonce', None)
+        if last_nonce is not None and active['start_nonce'] <= last_nonce <= active['end_nonce']:
+            frontier = last_nonce
+        rate = self.worker_rate(worker)
+        return float(active['end_nonce'] - frontier) / rate
+    
+    def worker_rate(self, worker) -> float:
+        """Hashrate used to size a worker's leases (H/s)"""
+        # Live PROGRESS figure first, then the BENCH calibration; a board
+        # with neither is assumed to match the rest of the fleet
+        rate = worker.hashrate or getattr(worker, 'calibrated_hashrate', None)
+        if rate:
+            return float(rate)
+        rates = (w.hashrate or getattr(w, 'calibrated_hashrate', None) for w in self.workers.values())
+        known = [float(r) for r in rates if r]
+        if known:
+            return sum(known) / len(known)
+        return self.scheduler.default_hashrate if self.scheduler else 100.0
+    
+    @staticmethod
+    def _held_leases(worker) -> List[int]:
+        """Lease IDs loaded on a worker (active and queued)"""
+        return [work['lease'] for work in (worker.active_work, worker.queued_work)
+                if work and 'lease' in work]
+    
+    async def handle_message(self, worker, message: Dict):
+        """Account for a worker message and keep the worker supplied"""
+        if self.scheduler is None:
+            return
+        self.scheduler.renew(self._held_leases(worker), time.monotonic())
+        if message.get('type') != 'RESULT':
+            return
         
-        for idx, worker in enumerate(workers):
-            start_nonce = idx * nonce_per_worker
-            end_nonce = start_nonce + nonce_per_worker if idx < num_workers - 1 else total_nonce_space
-            
-            work_packet = {
-                'block_header': work['block_header'],
-                'target': work['target'],
-                'start_nonce': start_nonce,
-                'end_nonce': end_nonce,
-                'timestamp': work.get('timestamp')
-            }
+        # Scanned nonces are covered, the rest of the lease goes back
+        if message.get('lease') is not None:
+            self.lease_verifiers.pop(message['lease'], None)
+            self.scheduler.complete(message['lease'], message.get('hashes', 0))
+        await self._feed(worker)
+    
+    async def reissue_expired(self):
+        """Reclaim leases of silent workers and restart idle ones"""
+        if self.scheduler is None:
+            return
+        expired = self.scheduler.expire(time.monotonic())
+        if expired:
+            logger.warning(f"Reissuing {len(expired)} expired nonce leases")
+        
+        for worker in self.workers.values():
+            if worker.is_connected and getattr(worker, 'is_responsive', True):
+                if worker.active_work is None or worker.needs_prefetch:
+                    await self._feed(worker)
+    
+    def release_worker(self, worker) -> List[NonceLease]:
+        """Hand a lost worker's unfinished nonces back for reassignment"""
+        released: List[NonceLease] = []
+        if self.scheduler is not None:
+            # PROGRESS tells how far the active lease got, less a margin for
+            # slices still in flight on either core
+            frontier = None
+            last_nonce = getattr(worker, 'last_nonce', None)
+            if last_nonce is not None:
+                frontier = last_nonce - RESUME_MARGIN
+            active_id = worker.active_work.get('lease') if worker.active_work else None
+            released = self.scheduler.release_worker(worker.worker_id, active_id, frontier)
+            if released:
+                logger.info(f"Released {len(released)} leases from worker {worker.worker_id}")
+        worker.active_work = None
+        worker.queued_work = None
+        return released
+    
+    def post_message(self, worker, message: Dict):
+        """Queue a worker message for process_messages (worker on_message hook)"""
+        self.inbox.put_nowait((worker, message))
+    
+    async def process_messages(self, on_share: ShareCallback):
+        """Consume worker messages, passing each verified share to on_share at once
+        
+        on_share is awaited in order, so it should hand the share off (e.g.
+        PoolClient.submit) rather than wait for the pool's verdict.
+        """
+        while True:
+            batch = [await self.inbox.get()]
+            # Whatever else has arrived meanwhile is verified in one pass
+            while not self.inbox.empty():
+                batch.append(self.inbox.get_nowait())
             
-            self.nonce_ranges.append({
-                'worker_id': worker.worker_id,
-                'start': start_nonce,
-                'end': end_nonce
-            })
+            try:
+                # Shares go out before lease bookkeeping, which may have to
+                # wait on serial writes to refill the worker
+                for share in self.check_shares(batch):
+                    await on_share(share)
+            except Exception as e:
+                logger.error(f"Error submitting shares: {e}", exc_info=True)
             
-            # Send work to worker
-            success = await worker.send_work(work_packet)
-            if success:
-                logger.debug(f"Sent work to worker {worker.worker_id}: nonce range {start_nonce}-{end_nonce}")
-            else:
-                logger.warning(f"Failed to send work to worker {worker.worker_id}")
+            for worker, message in batch:
+                try:
+                    await self.handle_message(worker, message)
+                except Exception as e:
+                    logger.error(f"Error handling message from worker {worker.worker_id}: {e}", exc_info=True)
+                finally:
+                    self.inbox.task_done()
     
-    async def collect_results(self, timeout: float = 5.0) -> List[Dict]:
-        """Collect mining results from all workers"""
-        self.results = []
-        
-        # This would collect results from workers
-        # In practice, workers would send results asynchronously when found
-        # This is a simplified polling approach
+    def check_shares(self, batch: List[Tuple[Any, Dict]]) -> List[Dict]:
+        """Verify the shares among (worker, message) pairs, grouped per job"""
+        pending: Dict[int, Tuple[ShareVerifier, List[Tuple[Any, Dict, int, int]]]] = {}
+        for worker, message in batch:
+            if message.get('type') not in ('RESULT', 'SHARE') or not message.get('valid'):
+                continue
+            if message.get('lease') is not None:
+                entry = self.lease_verifiers.get(message['lease'])
+            elif self.verifier is not None:
+                entry = (self.verifier, 0, 2**32)
+            else:
+                entry = None
+            if entry is None:
+                self._reject(worker, message, 'stale job')
+                continue
+            verifier, start, end = entry
+            pending.setdefault(id(verifier), (verifier, []))[1].append((worker, message, start, end))
         
-        return self.results
+        shares = []
+        for verifier, candidates in pending.values():
+            # Every verifier here comes from ShareVerifier.for_work, which keeps its job
+            work = verifier.work or {}
+            checked = verifier.verify_batch((message.get('nonce', 0), start, end,
+                                             self._hex_field(message, 'ntime'), self._hex_field(message, 'version'))
+                                            for _, message, start, end in candidates)
+            for (worker, message, _, _), (reason, digest) in zip(candidates, checked):
+                if reason is None and not self._first_submission(work, message):
+                    reason = DUPLICATE
+                if reason is not None:
+                    self._reject(worker, message, reason)
+                    continue
+                shares.append(self._share(worker, message, work, digest))
+        return shares
+    
+    @staticmethod
+    def _hex_field(message: Dict, field: str) -> Optional[int]:
+        """ntime or version a share was mined at, None if the worker did not say"""
+        value = message.get(field)
+        return int(value, 16) if value else None
+    
+    def _first_submission(self, work: Dict, message: Dict) -> bool:
+        """Record a verified share, False if it was already submitted"""
+        return self.duplicates.check(work.get('job_id'), work.get('extranonce2'),
+                                     message.get('ntime', work.get('ntime')), message.get('nonce', 0),
+                                     message.get('version'))
+    
+    def _reject(self, worker, message: Dict, reason: str):
+        self.shares_invalid += 1
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        logger.warning(f"Rejected share from worker {worker.worker_id} "
+                       f"(nonce {message.get('nonce')}, lease {message.get('lease')}): {reason}")
+    
+    def _share(self, worker, message: Dict, work: Dict, digest: bytes) -> Dict:
+        """Pool submission for a verified share"""
+        self.shares_found += 1
+        return {
+            'valid': True,
+            'worker_id': worker.worker_id,
+            'job_id': work.get('job_id'),
+            'extranonce2': work.get('extranonce2'),
+            'ntime': message.get('ntime', work.get('ntime')),
+            'nonce': message.get('nonce', 0),
+            'version': message.get('version'),
+            'hash': digest[::-1].hex(),
+            'block_header': work['block_header'],
+            'target': work['target'],
+            'lease': message.get('lease')
+        }
     
     def get_total_hashrate(self) -> float:
         """Calculate total hashrate across all workers (H/s)"""
-        # This would calculate based on worker reports
-        # For now, return estimated value
-        return 0.0
+        return self.meter.rate
+    
+    def get_hashrate_stats(self) -> Dict:
+        """Fleet EWMA, windowed and share-implied hashrates"""
+        return self.meter.as_dict(time.monotonic())
     
     async def stop_all_workers(self):
         """Send stop command to all workers"""
@@ -86,19 +423,7 @@ class MiningCoordinator:
     def verify_nonce(self, block_header: bytes, nonce: int, target: str) -> bool:
         """Verify if a nonce produces a valid hash"""
         try:
-            # Reconstruct block header with nonce
-            header_with_nonce = block_header[:76] + struct.pack('<I', nonce)
-            
-            # Double SHA-256 hash
-            hash1 = hashlib.sha256(header_with_nonce).digest()
-            hash2 = hashlib.sha256(hash1).digest()
-            
-            # Convert to integer for comparison
-            hash_int = int.from_bytes(hash2[::-1], 'big')
-            target_int = int(target, 16)
-            
-            return hash_int < target_int
-            
+            return ShareVerifier(block_header, target).meets_target(nonce)
         except Exception as e:
             logger.error(f"Error verifying nonce: {e}")
             return False
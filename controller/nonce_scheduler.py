@@ -0,0 +1,227 @@
+"""
+Nonce Scheduler - Lease-based allocation of a job's nonce space
+
+Workers borrow small, time-sized nonce ranges (leases) from a per-job pool
+instead of owning a fixed share of the 2^32 space. Finished leases are
+recorded as covered, unfinished parts go back to the pool, leases whose
+worker goes silent expire and are reissued, and idle workers can split
+a range that another worker has queued but not started.
+"""
+
+import itertools
+import logging
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+NONCE_SPACE = 2**32
+
+# Lease IDs travel in WORK/RESULT as u32 and are never reused across jobs
+_lease_ids = itertools.count(1)
+
+
+def next_lease_id() -> int:
+    """Allocate a lease ID (non-zero, fits in 32 bits)"""
+    return next(_lease_ids) % 0xffffffff + 1
+
+
+class RangeSet:
+    """Sorted, non-overlapping set of half-open integer ranges"""
+
+    def __init__(self, ranges: Optional[List[Tuple[int, int]]] = None):
+        self.ranges: List[List[int]] = []
+        self.total = 0
+        for start, end in ranges or []:
+            self.add(start, end)
+
+    def add(self, start: int, end: int) -> int:
+        """Add [start, end) and return how many values were already present"""
+        if end <= start:
+            return 0
+        overlap = 0
+        merged = [start, end]
+        kept: List[List[int]] = []
+        for current in self.ranges:
+            if current[1] < merged[0] or current[0] > merged[1]:
+                kept.append(current)
+                continue
+            # Touching or overlapping: count the shared part, then merge
+            overlap += max(0, min(current[1], end) - max(current[0], start))
+            merged = [min(merged[0], current[0]), max(merged[1], current[1])]
+            self.total -= current[1] - current[0]
+        kept.append(merged)
+        kept.sort()
+        self.ranges = kept
+        self.total += merged[1] - merged[0]
+        return overlap
+
+    def take(self, size: int) -> Optional[Tuple[int, int]]:
+        """Remove and return up to size values from the lowest range"""
+        if not self.ranges or size <= 0:
+            return None
+        first = self.ranges[0]
+        start = first[0]
+        end = min(first[1], start + size)
+        if end == first[1]:
+            self.ranges.pop(0)
+        else:
+            first[0] = end
+        self.total -= end - start
+        return start, end
+
+    def __bool__(self) -> bool:
+        return bool(self.ranges)
+
+
+class NonceLease:
+    """A contiguous nonce range lent to one worker"""
+
+    def __init__(self, lease_id: int, worker_id: int, start: int, end: int, deadline: float):
+        self.lease_id = lease_id
+        self.worker_id = worker_id
+        self.start = start
+        self.end = end
+        self.deadline = deadline
+
+    @property
+    def size(self) -> int:
+        """Number of nonces in the lease"""
+        return self.end - self.start
+
+
+class NonceScheduler:
+    """Hands out time-sized nonce leases for one job and tracks coverage"""
+
+    def __init__(self, job_id: Optional[str] = None, lease_seconds: float = 10.0,
+                 min_lease: int = 256, max_lease: int = 2**24,
+                 default_hashrate: float = 100.0, lease_timeout: Optional[float] = None):
+        self.job_id = job_id
+        self.lease_seconds = lease_seconds
+        self.min_lease = min_lease
+        self.max_lease = max_lease
+        self.default_hashrate = default_hashrate
+        # Deadlines are pushed back whenever the holder is heard from, so
+        # this is how long a worker may stay silent before losing its leases
+        self.lease_timeout = lease_timeout if lease_timeout is not None else 2 * lease_seconds
+
+        self.free = RangeSet([(0, NONCE_SPACE)])
+        self.done = RangeSet()
+        self.leases: Dict[int, NonceLease] = {}
+        # Expired or split leases, kept so late RESULTs still count as coverage
+        self.retired: Dict[int, NonceLease] = {}
+        self.duplicate_nonces = 0
+
+    def lease_size(self, hashrate: float) -> int:
+        """Nonces a worker at hashrate gets through in lease_seconds"""
+        rate = hashrate if hashrate and hashrate > 0 else self.default_hashrate
+        return max(self.min_lease, min(self.max_lease, int(rate * self.lease_seconds)))
+
+    def issue(self, worker_id: int, hashrate: float, now: float) -> Optional[NonceLease]:
+        """Lease the next free range to a worker, or None if the pool is empty"""
+        span = self.free.take(self.lease_size(hashrate))
+        if span is None:
+            return None
+        return self._lease(worker_id, span[0], span[1], now)
+
+    def _lease(self, worker_id: int, start: int, end: int, now: float) -> NonceLease:
+        lease = NonceLease(next_lease_id(), worker_id, start, end, now + self.lease_timeout)
+        self.leases[lease.lease_id] = lease
+        return lease
+
+    def complete(self, lease_id: int, hashed: int) -> Optional[NonceLease]:
+        """Record a finished lease; nonces it did not reach go back to the pool"""
+        lease = self.leases.pop(lease_id, None)
+        if lease is None:
+            # Late result for a lease that was already given away
+            lease = self.retired.pop(lease_id, None)
+            if lease is not None:
+                self._cover(lease.start, lease.start + max(0, min(hashed, lease.size)))
+            return None
+
+        frontier = lease.start + max(0, min(hashed, lease.size))
+        self._cover(lease.start, frontier)
+        if frontier < lease.end:
+            self.free.add(frontier, lease.end)
+        return lease
+
+    def _cover(self, start: int, end: int):
+        """Mark nonces as hashed, counting any that were hashed before"""
+        duplicates = self.done.add(start, end)
+        if duplicates:
+            logger.warning(f"{duplicates} nonces hashed twice in job {self.job_id}")
+            self.duplicate_nonces += duplicates
+
+    def renew(self, lease_ids, now: float):
+        """Push back the deadlines of leases whose holder was just heard from"""
+        # Only leases the worker still has loaded are renewed, so one whose
+        # RESULT was lost on the wire expires instead of being held forever
+        for lease_id in lease_ids:
+            lease = self.leases.get(lease_id)
+            if lease is not None:
+                lease.deadline = now + self.lease_timeout
+
+    def cancel(self, lease_id: int):
+        """Return a lease that never reached its worker to the pool"""
+        lease = self.leases.get(lease_id)
+        if lease is not None:
+            self._retire(lease, lease.start)
+
+    def expire(self, now: float) -> List[NonceLease]:
+        """Return leases past their deadline to the pool for reissue"""
+        expired = [lease for lease in self.leases.values() if lease.deadline < now]
+        for lease in expired:
+            self._retire(lease, lease.start)
+        return expired
+
+    def release_worker(self, worker_id: int, active_id: Optional[int] = None,
+                       frontier: Optional[int] = None) -> List[NonceLease]:
+        """Return all of a worker's leases; nonces of active_id below frontier count as hashed"""
+        released = [lease for lease in self.leases.values() if lease.worker_id == worker_id]
+        for lease in released:
+            resume = lease.start
+            # Only the lease being hashed got anywhere; a queued one (even one
+            # below it) was never started
+            if frontier is not None and lease.lease_id == active_id:
+                resume = min(max(lease.start, frontier), lease.end)
+            self._retire(lease, resume)
+        return released
+
+    def _retire(self, lease: NonceLease, resume: int):
+        """Take a lease back, covering [start, resume) and freeing the rest"""
+        del self.leases[lease.lease_id]
+        self.retired[lease.lease_id] = lease
+        self._cover(lease.start, resume)
+        self.free.add(resume, lease.end)
+
+    def split(self, lease_id: int, thief_id: int, hashrate: float,
+              now: float) -> Optional[Tuple[NonceLease, NonceLease]]:
+        """Steal the back of an unstarted lease; returns (kept front, stolen back)"""
+        lease = self.leases.get(lease_id)
+        if lease is None or lease.size < 2 * self.min_lease:
+            return None
+        take = min(self.lease_size(hashrate), lease.size // 2)
+        split_at = lease.end - take
+
+        del self.leases[lease_id]
+        self.retired[lease_id] = lease
+        front = self._lease(lease.worker_id, lease.start, split_at, now)
+        back = self._lease(thief_id, split_at, lease.end, now)
+        return front, back
+
+    @property
+    def exhausted(self) -> bool:
+        """True once every nonce has been hashed and no lease is outstanding"""
+        return not self.free and not self.leases
+
+    def get_coverage(self) -> Dict:
+        """Coverage statistics for the job"""
+        leased = sum(lease.size for lease in self.leases.values())
+        return {
+            'job_id': self.job_id,
+            'hashed': self.done.total,
+            'leased': leased,
+            'free': self.free.total,
+            'duplicates': self.duplicate_nonces,
+            'active_leases': len(self.leases),
+            'fraction': self.done.total / NONCE_SPACE
+        }
@@ -5,33 +5,59 @@ Mining Pool Client - Handles communication with Bitcoin mining pools
 import asyncio
 import json
 import logging
-from typing import Dict, Optional, Any, TYPE_CHECKING
+import time
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional
 from datetime import datetime
+from urllib.parse import urlparse
 
-if TYPE_CHECKING:
-    import aiohttp
-else:
-    try:
-        import aiohttp
-    except ImportError:
-        aiohttp = None  # type: ignore
+try:
+    from .stratum import VERSION_ROLLING_MASK, StratumError, StratumJob, difficulty_to_target, parse_notify
+except ImportError:
+    from stratum import (VERSION_ROLLING_MASK, StratumError, StratumJob,  # type: ignore
+                         difficulty_to_target, parse_notify)
 
 logger = logging.getLogger(__name__)
 
+USER_AGENT = 'pi-bitcoin-miner/1.1'
+
 
 class PoolClient:
     """Client for communicating with mining pools using Stratum protocol"""
     
-    def __init__(self, config_path: str):
+    def __init__(self, config_path: str, request_timeout: float = 10.0, max_pending_submits: int = 32):
         self.config = self._load_config(config_path)
-        self.session: Optional["aiohttp.ClientSession"] = None
-        self.ws = None
         self.connected = False
         self.message_id = 0
         
+        # Stratum v1 over a plain TCP stream: newline-delimited JSON-RPC,
+        # replies matched to requests by id, notifications by method
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.request_timeout = request_timeout
+        self.pending: Dict[int, "asyncio.Future[Any]"] = {}
+        self._listener: Optional[asyncio.Task] = None
+        
+        # Shares are sent without waiting for earlier replies; submit()
+        # only waits once max_pending_submits are unanswered
+        self.max_pending_submits = max_pending_submits
+        self._submit_slots = asyncio.Semaphore(max_pending_submits)
+        
+        # Session state from mining.subscribe / set_difficulty / notify
+        self.extranonce1 = ''
+        self.extranonce2_size = 4
+        self.difficulty = 1.0
+        # Version bits the pool lets us roll (BIP 310), 0 if it did not agree
+        self.version_mask = 0
+        self.job: Optional[StratumJob] = None
+        self.new_job = asyncio.Event()
+        
         self.shares_submitted = 0
         self.shares_accepted = 0
         self.shares_rejected = 0
+        # Called with each share the pool accepts (e.g. to credit the
+        # worker's share-implied hashrate)
+        self.on_accepted: Optional[Callable[[Dict], None]] = None
         
     def _load_config(self, config_path: str) -> Dict[str, Any]:
         """Load mining pool configuration"""
@@ -58,18 +84,153 @@ class PoolClient:
             return True
         
         try:
-            # In production, implement actual Stratum protocol connection
-            # This would use websockets or raw TCP sockets
-            self.session = aiohttp.ClientSession()
-            # TODO: Implement real Stratum protocol
+            url = urlparse(self.config.get('pool_url', ''))
+            if url.scheme not in ('stratum+tcp', 'tcp') or not url.hostname:
+                raise ValueError(f"unsupported pool URL {self.config.get('pool_url')!r}")
+            self.reader, self.writer = await asyncio.wait_for(
+                asyncio.open_connection(url.hostname, url.port or 3333), self.request_timeout)
             self.connected = True
-            logger.info("Connected to mining pool")
-            return True
+            self._listener = asyncio.ensure_future(self._listen())
             
+            await self._configure()
+            subscription = await self._request('mining.subscribe', [USER_AGENT])
+            self.extranonce1 = subscription[1]
+            self.extranonce2_size = int(subscription[2])
+            
+            authorized = await self._request('mining.authorize', [self.config.get('username', ''),
+                                                                  self.config.get('password', 'x')])
+            if not authorized:
+                raise StratumError(24, "Unauthorized worker")
+            
+            logger.info(f"Connected to mining pool (extranonce1 {self.extranonce1}, "
+                        f"extranonce2 size {self.extranonce2_size})")
+            return True
+        
         except Exception as e:
             logger.error(f"Failed to connect to pool: {e}")
+            await self.disconnect()
             return False
     
+    async def _configure(self):
+        """Negotiate version rolling (BIP 310 mining.configure)"""
+        if not self.config.get('version_rolling', True):
+            return
+        try:
+            reply = await self._request('mining.configure', [
+                ['version-rolling'],
+                {'version-rolling.mask': format(VERSION_ROLLING_MASK, '08x'),
+                 'version-rolling.min-bit-count': 2}
+            ])
+        except StratumError as e:
+            # Pools without BIP 310 reject or ignore the method
+            logger.info(f"Pool does not support version rolling: {e}")
+            return
+        if isinstance(reply, dict) and reply.get('version-rolling'):
+            self.version_mask = int(reply.get('version-rolling.mask', '0'), 16) & VERSION_ROLLING_MASK
+            logger.info(f"Version rolling enabled (mask {self.version_mask:08x})")
+    
+    async def _request(self, method: str, params: List) -> Any:
+        """Send a JSON-RPC request and wait for its result"""
+        waiter = self._call(method, params)
+        await self._drain()
+        return await waiter
+    
+    def _call(self, method: str, params: List) -> "asyncio.Future[Any]":
+        """Send a JSON-RPC request; the future resolves when its reply arrives"""
+        if self.writer is None or not self.connected:
+            raise StratumError(-1, "Not connected")
+        
+        self.message_id += 1
+        request_id = self.message_id
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        self.pending[request_id] = waiter
+        timer = loop.call_later(self.request_timeout, self._expire, request_id, method)
+        waiter.add_done_callback(partial(self._forget, request_id, timer))
+        self._send({'id': request_id, 'method': method, 'params': params})
+        return waiter
+    
+    def _forget(self, request_id: int, timer: asyncio.TimerHandle, waiter: "asyncio.Future[Any]"):
+        """Drop a finished request and its timeout"""
+        timer.cancel()
+        self.pending.pop(request_id, None)
+    
+    def _expire(self, request_id: int, method: str):
+        """Fail a request the pool has not answered within request_timeout"""
+        waiter = self.pending.get(request_id)
+        if waiter is not None and not waiter.done():
+            waiter.set_exception(StratumError(-2, f"No reply to {method}"))
+    
+    async def _drain(self):
+        """Wait for the socket buffer to flush (TCP flow control)"""
+        if self.writer is None:
+            return
+        try:
+            await self.writer.drain()
+        except (ConnectionError, OSError) as e:
+            # Pending requests are failed by the listener
+            logger.warning(f"Pool write failed: {e}")
+    
+    @staticmethod
+    def _resolve(waiter: "asyncio.Future[Any]", reply: Dict):
+        """Complete a request future from its JSON-RPC reply"""
+        error = reply.get('error')
+        if not error:
+            waiter.set_result(reply.get('result'))
+        elif isinstance(error, (list, tuple)) and len(error) >= 2:
+            waiter.set_exception(StratumError(int(error[0]), str(error[1])))
+        else:
+            waiter.set_exception(StratumError(-3, str(error)))
+    
+    def _send(self, message: Dict):
+        """Write one JSON-RPC line"""
+        if self.writer is None:
+            raise StratumError(-1, "Not connected")
+        self.writer.write(json.dumps(message).encode() + b'\n')
+    
+    async def _listen(self):
+        """Read pool messages until the connection closes"""
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    logger.warning(f"Ignoring malformed pool message: {line[:80]!r}")
+                    continue
+                
+                if message.get('method'):
+                    self._handle_notification(message['method'], message.get('params') or [])
+                else:
+                    waiter = self.pending.get(message.get('id'))
+                    if waiter is not None and not waiter.done():
+                        self._resolve(waiter, message)
+        except (ConnectionError, asyncio.IncompleteReadError) as e:
+            logger.warning(f"Pool connection lost: {e}")
+        finally:
+            self.connected = False
+            for waiter in list(self.pending.values()):
+                if not waiter.done():
+                    waiter.set_exception(StratumError(-1, "Connection closed"))
+    
+    def _handle_notification(self, method: str, params: List):
+        """Apply a pool-initiated message"""
+        if method == 'mining.notify':
+            self.job = StratumJob(parse_notify(params), self.extranonce1, self.extranonce2_size)
+            self.new_job.set()
+            logger.info(f"New job {self.job.job_id} from pool"
+                        f"{' (clean)' if self.job.clean_jobs else ''}")
+        elif method == 'mining.set_difficulty':
+            self.difficulty = float(params[0])
+            logger.info(f"Pool difficulty set to {self.difficulty}")
+        elif method == 'mining.set_version_mask':
+            self.version_mask = int(params[0], 16) & VERSION_ROLLING_MASK
+            logger.info(f"Pool version mask set to {self.version_mask:08x}")
+        else:
+            logger.debug(f"Unhandled pool message {method}")
+    
     async def get_work(self) -> Optional[Dict]:
         """Request new work from the mining pool"""
         if not self.connected:
@@ -79,8 +240,31 @@ class PoolClient:
             # Generate test work
             return self._generate_test_work()
         
-        # TODO: Implement real Stratum getwork/mining.notify
-        return None
+        # Stratum pushes jobs; wait briefly for the first one
+        if self.job is None:
+            try:
+                await asyncio.wait_for(self.new_job.wait(), self.request_timeout)
+            except asyncio.TimeoutError:
+                return None
+        self.new_job.clear()
+        return self.next_work()
+    
+    def next_work(self) -> Optional[Dict]:
+        """Build work locally from the current job (no pool round trip)"""
+        if self.config.get('mining_mode') == 'test':
+            return self._generate_test_work() if self.connected else None
+        if self.job is None:
+            return None
+        
+        # Each call rolls extranonce2, giving a new merkle root and a fresh
+        # 2^32 nonce space from the same job
+        work = self.job.next_work(difficulty_to_target(self.difficulty))
+        if work is None:
+            logger.warning(f"extranonce2 space of job {self.job.job_id} used up")
+            return None
+        work['timestamp'] = datetime.now().isoformat()
+        work['version_mask'] = format(self.version_mask, '08x')
+        return work
     
     def _generate_test_work(self) -> Dict:
         """Generate simulated mining work for testing"""
@@ -100,24 +284,69 @@ class PoolClient:
         }
     
     async def submit_work(self, result: Dict) -> bool:
-        """Submit a valid share to the mining pool"""
+        """Submit a valid share to the mining pool and wait for the verdict"""
+        return await (await self.submit(result))
+    
+    async def submit(self, result: Dict) -> "asyncio.Future[bool]":
+        """Send a share without waiting for the reply; the future gets the verdict"""
         self.shares_submitted += 1
+        verdict = asyncio.get_running_loop().create_future()
         
         if self.config.get('mining_mode') == 'test':
             # Simulate acceptance
             logger.info(f"TEST MODE: Simulating share submission")
-            self.shares_accepted += 1
-            return True
+            self._accepted(result)
+            verdict.set_result(True)
+            return verdict
         
+        params = [
+            self.config.get('username', ''),
+            result['job_id'],
+            result['extranonce2'],
+            result['ntime'],
+            format(result['nonce'], '08x')
+        ]
+        if self.version_mask and result.get('version'):
+            # BIP 310: the rolled version bits go in a sixth parameter
+            params.append(format(int(result['version'], 16) & self.version_mask, '08x'))
+        # Backpressure: wait while too many shares are unanswered
+        await self._submit_slots.acquire()
         try:
-            # TODO: Implement real Stratum mining.submit
-            self.shares_accepted += 1
-            return True
-            
-        except Exception as e:
+            reply = self._call('mining.submit', params)
+        except StratumError as e:
+            self._submit_slots.release()
             logger.error(f"Failed to submit work: {e}")
             self.shares_rejected += 1
-            return False
+            verdict.set_result(False)
+            return verdict
+        
+        reply.add_done_callback(partial(self._submitted, result, verdict, time.monotonic()))
+        await self._drain()
+        return verdict
+    
+    def _submitted(self, result: Dict, verdict: "asyncio.Future[bool]", started: float,
+                   reply: "asyncio.Future[Any]"):
+        """Count the pool's answer to a mining.submit"""
+        self._submit_slots.release()
+        error = StratumError(-1, "Cancelled") if reply.cancelled() else reply.exception()
+        accepted = error is None and bool(reply.result())
+        if accepted:
+            self._accepted(result)
+            logger.info(f"Share accepted in {(time.monotonic() - started) * 1000:.0f} ms")
+        else:
+            self.shares_rejected += 1
+            logger.error(f"Share rejected: {error or 'pool returned false'}")
+        if not verdict.done():
+            verdict.set_result(accepted)
+    
+    def _accepted(self, result: Dict):
+        """Count a share the pool accepted and pass it to on_accepted"""
+        self.shares_accepted += 1
+        if self.on_accepted is not None:
+            try:
+                self.on_accepted(result)
+            except Exception as e:
+                logger.error(f"Error handling accepted share: {e}")
     
     def get_share_stats(self) -> Dict:
         """Get share submission statistics"""
@@ -134,8 +363,17 @@ class PoolClient:
     
     async def disconnect(self):
         """Disconnect from the mining pool"""
-        if self.session:
-            await self.session.close()
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+            self.writer = None
+            self.reader = None
         
         self.connected = False
         logger.info("Disconnected from mining pool")
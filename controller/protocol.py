@@ -0,0 +1,234 @@
+"""
+Serial Protocol - Binary framing for the controller <-> Pico link
+
+Frames are negotiated during HELLO and coexist with the original
+``CMD:{json}\\n`` text lines, which stay in use for the handshake and as
+a fallback for older firmware.
+
+Frame layout (little-endian)::
+
+    magic (1) | type (1) | length (2) | payload (length) | crc32 (4)
+
+The CRC covers type, length and payload.
+"""
+
+import binascii
+import json
+import logging
+import struct
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+FRAME_MAGIC = 0xA5
+FRAME_HEADER = struct.Struct('<BBH')
+FRAME_OVERHEAD = FRAME_HEADER.size + 4
+
+# Controller -> Pico
+MSG_WORK = 0x10
+MSG_QUEUE = 0x11
+MSG_STOP = 0x12
+MSG_PING = 0x13
+
+# Pico -> controller
+MSG_RESULT = 0x20
+MSG_PROGRESS = 0x21
+MSG_PONG = 0x22
+MSG_SHARE = 0x23
+
+COMMAND_TYPES = {'WORK': MSG_WORK, 'QUEUE': MSG_QUEUE, 'STOP': MSG_STOP, 'PING': MSG_PING}
+
+# header (80) + target (32, big-endian) + start/end nonce + lease ID +
+# seconds the Pico may roll ntime by + version bits it may roll
+WORK_PAYLOAD = struct.Struct('<80s32sQQIII')
+# flags, worker_id, nonce, hashes, elapsed ms, hash, lease ID, ntime, version
+RESULT_PAYLOAD = struct.Struct('<BHIII32sIII')
+# RESULT from older firmware, without the trailing ntime and version
+RESULT_PAYLOAD_V1_SIZE = RESULT_PAYLOAD.size - 8
+# worker_id, hashes, delta, ms, nonce (u64: the frontier of a finished
+# pass is the range end, which can be 2**32)
+PROGRESS_PAYLOAD = struct.Struct('<HIIIQ')
+# heartbeat sequence number
+PING_PAYLOAD = struct.Struct('<I')
+# worker_id, echoed sequence number
+PONG_PAYLOAD = struct.Struct('<HI')
+# worker_id, nonce, hash, lease ID, ntime, version (extra hits of a range)
+SHARE_PAYLOAD = struct.Struct('<HI32sIII')
+
+RESULT_VALID = 0x01
+RESULT_ABORTED = 0x02
+
+# Payload sizes a Pico frame of each type can have; a header announcing
+# anything else is noise (RESULT grew a trailing ntime, then version)
+FRAME_SIZES = {
+    MSG_RESULT: (RESULT_PAYLOAD_V1_SIZE, RESULT_PAYLOAD_V1_SIZE + 4, RESULT_PAYLOAD.size),
+    MSG_PROGRESS: (PROGRESS_PAYLOAD.size,),
+    MSG_PONG: (PONG_PAYLOAD.size,),
+    MSG_SHARE: (SHARE_PAYLOAD.size,)
+}
+
+
+def encode_frame(msg_type: int, payload: bytes = b'') -> bytes:
+    """Wrap a payload in a frame with length and CRC"""
+    header = FRAME_HEADER.pack(FRAME_MAGIC, msg_type, len(payload))
+    crc = binascii.crc32(header[1:] + payload) & 0xffffffff
+    return header + payload + struct.pack('<I', crc)
+
+
+def encode_command(command: str, data: Optional[Dict] = None) -> bytes:
+    """Encode a WORK, QUEUE, STOP or PING command as a binary frame"""
+    msg_type = COMMAND_TYPES[command]
+    if msg_type == MSG_STOP:
+        return encode_frame(msg_type)
+    if msg_type == MSG_PING:
+        return encode_frame(msg_type, PING_PAYLOAD.pack((data or {}).get('seq', 0)))
+
+    data = data or {}
+    payload = WORK_PAYLOAD.pack(
+        bytes.fromhex(data['block_header']),
+        int(data['target'], 16).to_bytes(32, 'big'),
+        data['start_nonce'],
+        data['end_nonce'],
+        data.get('lease', 0),
+        data.get('ntime_roll', 0),
+        data.get('version_mask', 0)
+    )
+    return encode_frame(msg_type, payload)
+
+
+def decode_payload(msg_type: int, payload: bytes) -> Optional[Dict]:
+    """Turn a Pico frame payload into the same dict as its JSON form"""
+    if msg_type == MSG_RESULT and RESULT_PAYLOAD_V1_SIZE <= len(payload) < RESULT_PAYLOAD.size:
+        payload += bytes(RESULT_PAYLOAD.size - len(payload))
+    if msg_type == MSG_RESULT and len(payload) == RESULT_PAYLOAD.size:
+        (flags, worker_id, nonce, hashes, elapsed_ms, hash_bytes, lease,
+         ntime, version) = RESULT_PAYLOAD.unpack(payload)
+        result = {
+            'type': 'RESULT',
+            'valid': bool(flags & RESULT_VALID),
+            'aborted': bool(flags & RESULT_ABORTED),
+            'hashes': hashes,
+            'ms': elapsed_ms,
+            'hashrate': hashes * 1000.0 / elapsed_ms if elapsed_ms else 0,
+            'worker_id': worker_id,
+            'lease': lease
+        }
+        if ntime:
+            result['ntime'] = format(ntime, '08x')
+        if version:
+            result['version'] = format(version, '08x')
+        if result['valid']:
+            result['nonce'] = nonce
+            result['hash'] = hash_bytes.hex()
+        return result
+
+    if msg_type == MSG_PROGRESS and len(payload) == PROGRESS_PAYLOAD.size:
+        worker_id, hashes, delta, elapsed_ms, nonce = PROGRESS_PAYLOAD.unpack(payload)
+        return {
+            'type': 'PROGRESS',
+            'worker_id': worker_id,
+            'hashes': hashes,
+            'delta': delta,
+            'ms': elapsed_ms,
+            'nonce': nonce
+        }
+
+    if msg_type == MSG_PONG and len(payload) == PONG_PAYLOAD.size:
+        worker_id, seq = PONG_PAYLOAD.unpack(payload)
+        return {'type': 'PONG', 'worker_id': worker_id, 'seq': seq}
+
+    if msg_type == MSG_SHARE and len(payload) == SHARE_PAYLOAD.size:
+        worker_id, nonce, hash_bytes, lease, ntime, version = SHARE_PAYLOAD.unpack(payload)
+        share = {
+            'type': 'SHARE',
+            'valid': True,
+            'nonce': nonce,
+            'hash': hash_bytes.hex(),
+            'worker_id': worker_id,
+            'lease': lease
+        }
+        if ntime:
+            share['ntime'] = format(ntime, '08x')
+        if version:
+            share['version'] = format(version, '08x')
+        return share
+
+    logger.warning(f"Unknown frame type 0x{msg_type:02x} ({len(payload)} bytes)")
+    return None
+
+
+class FrameDecoder:
+    """
+    Incremental decoder for a serial byte stream
+    Accepts any mix of binary frames and JSON text lines, keeps partial
+    data between feed() calls and resynchronises on the next magic byte
+    after a bad header or CRC, so one damaged frame costs no others.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.crc_errors = 0
+
+    def feed(self, data: bytes) -> List[Dict]:
+        """Add received bytes and return every complete message"""
+        self.buffer += data
+        messages: List[Dict] = []
+
+        while self.buffer:
+            if self.buffer[0] == FRAME_MAGIC:
+                if len(self.buffer) < FRAME_HEADER.size:
+                    break
+                _, msg_type, length = FRAME_HEADER.unpack_from(self.buffer)
+                if length not in FRAME_SIZES.get(msg_type, ()):
+                    # Not a real frame header, skip the magic byte
+                    del self.buffer[0]
+                    continue
+                total = length + FRAME_OVERHEAD
+                if len(self.buffer) < total:
+                    break
+
+                body = bytes(self.buffer[1:FRAME_HEADER.size + length])
+                (crc,) = struct.unpack_from('<I', self.buffer, FRAME_HEADER.size + length)
+                if binascii.crc32(body) & 0xffffffff != crc:
+                    # The header itself may be damaged, so only the magic
+                    # byte is dropped and the next frame is searched for
+                    self.crc_errors += 1
+                    del self.buffer[0]
+                    continue
+
+                del self.buffer[:total]
+                message = decode_payload(msg_type, body[FRAME_HEADER.size - 1:])
+                if message is not None:
+                    messages.append(message)
+                continue
+
+            end = self.buffer.find(b'\n')
+            magic = self.buffer.find(FRAME_MAGIC)
+            if magic > 0 and (end < 0 or magic < end):
+                # Text lines are ASCII: this is the rest of a damaged frame
+                del self.buffer[:magic]
+                continue
+            if end < 0:
+                break
+            line = bytes(self.buffer[:end]).strip()
+            del self.buffer[:end + 1]
+            if not line:
+                continue
+            result = self._parse_line(line)
+            if isinstance(result, dict):
+                messages.append(result)
+
+        return messages
+
+    @staticmethod
+    def _parse_line(line: bytes) -> Any:
+        """JSON from a text line, skipping leftovers of a damaged frame"""
+        start = 0
+        while start >= 0:
+            try:
+                return json.loads(line[start:].decode('utf-8'))
+            except ValueError:
+                start = line.find(b'{', start + 1)
+        # Debug prints from the Pico share the serial port
+        logger.debug(f"Ignoring non-JSON line: {line!r}")
+        return None
@@ -0,0 +1,129 @@
+"""
+Share Verifier - Checks worker shares before they are submitted
+
+One verifier is built per job. It parses the target once and hashes the
+header's first 64-byte block once (the SHA-256 midstate), so checking a
+nonce only hashes the last 16 header bytes and the second pass. Since
+ntime lives in those bytes, shares mined at a rolled ntime reuse the same
+midstate. The version is in the first block, so a share at rolled
+version bits (BIP 310) is hashed from a fresh midstate. Shares outside
+the lease they were mined in, at an ntime outside the allowed window,
+with version bits outside the mask, or with hashes above the target are
+rejected; DuplicateFilter catches shares that were already submitted.
+"""
+
+import hashlib
+import struct
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+
+NONCE_SPACE = 2**32
+
+# Rejection reasons
+OUT_OF_RANGE = 'out of range'
+DUPLICATE = 'duplicate'
+ABOVE_TARGET = 'above target'
+BAD_NTIME = 'ntime out of window'
+BAD_VERSION = 'version outside mask'
+
+
+class ShareVerifier:
+    """Verifies candidate nonces for one job"""
+
+    def __init__(self, block_header: bytes, target: str, work: Optional[Dict] = None,
+                 ntime_roll: int = 0, version_mask: int = 0):
+        self.work = work
+        self.target = int(target, 16)
+        self._midstate = hashlib.sha256(block_header[:64])
+        self._head = block_header[4:64]
+        self._tail = block_header[64:76]
+        # Workers may move ntime forward by up to ntime_roll seconds and
+        # change the version bits in version_mask
+        self.ntime = struct.unpack('<I', block_header[68:72])[0]
+        self.ntime_roll = ntime_roll
+        self.version = struct.unpack('<I', block_header[0:4])[0]
+        self.version_mask = version_mask
+
+    @classmethod
+    def for_work(cls, work: Dict, ntime_roll: int = 0) -> "ShareVerifier":
+        """Verifier for a pool job (hex header and target)"""
+        return cls(bytes.fromhex(work['block_header']), work['target'], work, ntime_roll,
+                   int(work.get('version_mask') or '0', 16))
+
+    def hash_nonce(self, nonce: int, ntime: Optional[int] = None, version: Optional[int] = None) -> bytes:
+        """Double SHA-256 of the header with nonce (and ntime, version), as the raw digest"""
+        if version is None or version == self.version:
+            inner = self._midstate.copy()
+        else:
+            inner = hashlib.sha256(struct.pack('<I', version) + self._head)
+        if ntime is None:
+            inner.update(self._tail + struct.pack('<I', nonce))
+        else:
+            inner.update(self._tail[:4] + struct.pack('<I', ntime) + self._tail[8:] + struct.pack('<I', nonce))
+        return hashlib.sha256(inner.digest()).digest()
+
+    def meets_target(self, nonce: int) -> bool:
+        """True if the header hash with nonce is below the target"""
+        return int.from_bytes(self.hash_nonce(nonce)[::-1], 'big') < self.target
+
+    def verify_batch(self, candidates: Iterable[Tuple]) -> List[Tuple[Optional[str], bytes]]:
+        """Check (nonce, start, end[, ntime[, version]]) candidates; returns (reason or None, hash) each"""
+        results: List[Tuple[Optional[str], bytes]] = []
+        for candidate in candidates:
+            nonce, start, end = candidate[:3]
+            ntime = candidate[3] if len(candidate) > 3 else None
+            version = candidate[4] if len(candidate) > 4 else None
+            if not start <= nonce < end:
+                results.append((OUT_OF_RANGE, b''))
+                continue
+            if ntime is not None and not self.ntime <= ntime <= self.ntime + self.ntime_roll:
+                results.append((BAD_NTIME, b''))
+                continue
+            if version is not None and (version ^ self.version) & ~self.version_mask & 0xffffffff:
+                results.append((BAD_VERSION, b''))
+                continue
+            digest = self.hash_nonce(nonce, ntime, version)
+            if int.from_bytes(digest[::-1], 'big') >= self.target:
+                results.append((ABOVE_TARGET, digest))
+                continue
+            results.append((None, digest))
+        return results
+
+    def verify(self, nonce: int, start: int = 0, end: int = NONCE_SPACE) -> Optional[str]:
+        """Check one nonce; returns the rejection reason or None if valid"""
+        return self.verify_batch([(nonce, start, end)])[0][0]
+
+
+class DuplicateFilter:
+    """Shares already submitted, per job, for the most recent jobs only"""
+
+    def __init__(self, max_jobs: int = 4, max_per_job: int = 65536):
+        self.max_jobs = max_jobs
+        self.max_per_job = max_per_job
+        # job_id -> share keys in submission order (dict as an ordered set)
+        self.jobs: "OrderedDict[Any, Dict[Hashable, None]]" = OrderedDict()
+
+    def start_job(self, job_id: Any):
+        """Track a new job, forgetting the oldest once over max_jobs"""
+        self.jobs.setdefault(job_id, {})
+        self.jobs.move_to_end(job_id)
+        while len(self.jobs) > self.max_jobs:
+            self.jobs.popitem(last=False)
+
+    def check(self, job_id: Any, extranonce2: Any, ntime: Any, nonce: int, version: Any = None) -> bool:
+        """Record a share; False if the same share was seen before"""
+        seen = self.jobs.get(job_id)
+        if seen is None:
+            # Shares of untracked (stale) jobs are screened out elsewhere
+            self.start_job(job_id)
+            seen = self.jobs[job_id]
+        key = (extranonce2, ntime, nonce, version)
+        if key in seen:
+            return False
+        seen[key] = None
+        if len(seen) > self.max_per_job:
+            del seen[next(iter(seen))]
+        return True
+
+    def __len__(self) -> int:
+        return sum(len(seen) for seen in self.jobs.values())
@@ -0,0 +1,136 @@
+"""
+Stratum v1 helpers - Job parsing, header assembly and share targets
+
+Shared by the pool client and the fake pool server used in tests. Stratum
+jobs arrive in `mining.notify` as hex strings; block headers are built from
+them by completing the coinbase with extranonce1/extranonce2 and folding its
+hash through the merkle branch. StratumJob does this per extranonce2 with
+everything that does not depend on it prepared once per job.
+"""
+
+import hashlib
+import struct
+from typing import Dict, Iterator, List, Optional, Sequence
+
+# Target of a difficulty 1 share (the pool difficulty scale)
+DIFF1_TARGET = 0xffff * 2**208
+
+# Version bits BIP 320 leaves free for rolling (BIP 310 version-rolling)
+VERSION_ROLLING_MASK = 0x1fffe000
+
+
+class StratumError(Exception):
+    """Error reply from the pool, or a request that got no reply"""
+
+    def __init__(self, code: int, message: str):
+        super().__init__(f"[{code}] {message}")
+        self.code = code
+        self.message = message
+
+
+def double_sha256(data: bytes) -> bytes:
+    """SHA-256d as used for block headers, transactions and the merkle tree"""
+    return hashlib.sha256(hashlib.sha256(data).digest()).digest()
+
+
+def difficulty_to_target(difficulty: float) -> str:
+    """Share target for a pool difficulty, as 64 hex digits (big-endian)"""
+    target = int(DIFF1_TARGET / difficulty) if difficulty > 0 else DIFF1_TARGET
+    return format(min(target, 2**256 - 1), '064x')
+
+
+def parse_notify(params: Sequence) -> Dict:
+    """Job dict from mining.notify parameters"""
+    job_id, prevhash, coinb1, coinb2, merkle_branch, version, nbits, ntime, clean_jobs = params[:9]
+    return {
+        'job_id': job_id,
+        'prevhash': prevhash,
+        'coinb1': coinb1,
+        'coinb2': coinb2,
+        'merkle_branch': list(merkle_branch),
+        'version': version,
+        'nbits': nbits,
+        'ntime': ntime,
+        'clean_jobs': bool(clean_jobs)
+    }
+
+
+def merkle_root(coinbase_hash: bytes, branch: List[str]) -> bytes:
+    """Fold the coinbase hash through the job's merkle branch"""
+    root = coinbase_hash
+    for step in branch:
+        root = double_sha256(root + bytes.fromhex(step))
+    return root
+
+
+def build_header(job: Dict, extranonce1: str, extranonce2: str, ntime: Optional[str] = None,
+                 nonce: int = 0, version: Optional[int] = None) -> bytes:
+    """80-byte block header for a job and extranonce2"""
+    coinbase = bytes.fromhex(job['coinb1'] + extranonce1 + extranonce2 + job['coinb2'])
+    root = merkle_root(double_sha256(coinbase), job['merkle_branch'])
+    # Stratum sends prevhash as eight 32-bit words in reversed order
+    prevhash = bytes.fromhex(job['prevhash'])
+    prevhash = b''.join(prevhash[i:i + 4][::-1] for i in range(0, 32, 4))
+    version = int(job['version'], 16) if version is None else version
+    return (struct.pack('<I', version) + prevhash + root +
+            struct.pack('<II', int(ntime or job['ntime'], 16), int(job['nbits'], 16)) +
+            struct.pack('<I', nonce))
+
+
+def header_hash_value(header: bytes) -> int:
+    """Header hash as the integer compared against targets"""
+    return int.from_bytes(double_sha256(header)[::-1], 'big')
+
+
+class StratumJob:
+    """Header factory for one mining.notify job and extranonce1"""
+
+    def __init__(self, job: Dict, extranonce1: str, extranonce2_size: int = 4):
+        self.job = job
+        self.job_id = job['job_id']
+        self.ntime = job['ntime']
+        self.clean_jobs = job['clean_jobs']
+        self.extranonce1 = extranonce1
+        self.extranonce2_size = extranonce2_size
+
+        # SHA-256 state after coinb1 + extranonce1, so each header only
+        # hashes extranonce2 + coinb2 for the coinbase
+        self._coinbase_prefix = hashlib.sha256(bytes.fromhex(job['coinb1'] + extranonce1))
+        self._coinbase_suffix = bytes.fromhex(job['coinb2'])
+        self._branch = [bytes.fromhex(step) for step in job['merkle_branch']]
+
+        # Header fields around the merkle root
+        prevhash = bytes.fromhex(job['prevhash'])
+        self._head = struct.pack('<I', int(job['version'], 16)) + \
+            b''.join(prevhash[i:i + 4][::-1] for i in range(0, 32, 4))
+        self._time_bits = struct.pack('<II', int(job['ntime'], 16), int(job['nbits'], 16))
+
+        self._counter: Iterator[int] = iter(range(2**(8 * extranonce2_size)))
+
+    def extranonce2(self, value: int) -> str:
+        """extranonce2 as sent to the pool (fixed-width hex)"""
+        return value.to_bytes(self.extranonce2_size, 'big').hex()
+
+    def header(self, extranonce2: str, nonce: int = 0) -> bytes:
+        """80-byte block header for one extranonce2"""
+        inner = self._coinbase_prefix.copy()
+        inner.update(bytes.fromhex(extranonce2) + self._coinbase_suffix)
+        root = hashlib.sha256(inner.digest()).digest()
+        for step in self._branch:
+            root = double_sha256(root + step)
+        return self._head + root + self._time_bits + struct.pack('<I', nonce)
+
+    def next_work(self, target: str) -> Optional[Dict]:
+        """Work for the next unused extranonce2, or None once all are used"""
+        value = next(self._counter, None)
+        if value is None:
+            return None
+        extranonce2 = self.extranonce2(value)
+        return {
+            'block_header': self.header(extranonce2).hex(),
+            'target': target,
+            'job_id': self.job_id,
+            'extranonce2': extranonce2,
+            'ntime': self.ntime,
+            'clean_jobs': self.clean_jobs
+        }
@@ -3,8 +3,12 @@ Worker Manager - Handles USB communication with Pico workers
 """
 
 import asyncio
+import json
 import logging
-from typing import List, Dict, Optional, TYPE_CHECKING, Any
+import threading
+import time
+from bisect import bisect_left
+from typing import Awaitable, Callable, List, Dict, Optional, Set, Tuple, TYPE_CHECKING, Any
 import struct
 
 if TYPE_CHECKING:
@@ -17,65 +21,247 @@ else:
     except ImportError:
         serial = None  # type: ignore
 
+try:
+    from .hashrate import HashrateMeter
+    from .protocol import COMMAND_TYPES, FrameDecoder, encode_command
+except ImportError:
+    from hashrate import HashrateMeter  # type: ignore
+    from protocol import COMMAND_TYPES, FrameDecoder, encode_command  # type: ignore
+
 logger = logging.getLogger(__name__)
 
+WorkerCallback = Callable[["PicoWorker"], Awaitable[None]]
+
+
+class LatencyHistogram:
+    """Round-trip times counted in fixed millisecond buckets"""
+    
+    BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+    
+    def __init__(self) -> None:
+        # One extra bucket for anything slower than the last bound
+        self.counts = [0] * (len(self.BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+    
+    def record(self, rtt_ms: float):
+        """Add one round-trip measurement"""
+        self.counts[bisect_left(self.BUCKETS_MS, rtt_ms)] += 1
+        self.count += 1
+        self.total_ms += rtt_ms
+        self.max_ms = max(self.max_ms, rtt_ms)
+    
+    def merge(self, other: "LatencyHistogram") -> "LatencyHistogram":
+        """Fold another histogram into this one (for bank totals)"""
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total_ms += other.total_ms
+        self.max_ms = max(self.max_ms, other.max_ms)
+        return self
+    
+    def percentile(self, fraction: float) -> Optional[float]:
+        """Upper bucket bound below which fraction of samples fall"""
+        if not self.count:
+            return None
+        wanted = fraction * self.count
+        seen = 0
+        for idx, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= wanted and bucket_count:
+                return float(self.BUCKETS_MS[idx]) if idx < len(self.BUCKETS_MS) else self.max_ms
+        return self.max_ms
+    
+    def as_dict(self) -> Dict:
+        """Summary and bucket counts for stats output"""
+        buckets = {f"<={bound}ms": n for bound, n in zip(self.BUCKETS_MS, self.counts)}
+        buckets[f">{self.BUCKETS_MS[-1]}ms"] = self.counts[-1]
+        return {
+            'count': self.count,
+            'mean_ms': self.total_ms / self.count if self.count else None,
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'max_ms': self.max_ms,
+            'buckets': buckets
+        }
+
 
 class PicoWorker:
     """Represents a single Pico mining worker"""
     
-    def __init__(self, port: str, worker_id: int):
+    def __init__(self, port: str, worker_id: int, progress_ms: int = 5000, bench_ms: int = 1000):
         self.port = port
         self.worker_id = worker_id
+        self.progress_ms = progress_ms
         self.serial: Optional[Any] = None
         self.is_connected = False
-        self.hashrate = 0
+        # hashrate is the meter's EWMA, fed by PROGRESS and RESULT hash counts
+        self.hashrate = 0.0
+        self.meter = HashrateMeter()
+        self._range_hashes = 0
+        self._range_ms = 0
+        # BENCH result from connect; hashrate takes over once PROGRESS arrives
+        self.bench_ms = bench_ms
+        self.calibrated_hashrate: Optional[float] = None
+        self._bench: Optional["asyncio.Future[Dict]"] = None
         self.shares_found = 0
         self.errors = 0
         
-    async def connect(self, baudrate: int = 115200):
+        # Double-buffered assignments: the range being mined and the one
+        # already queued on the Pico behind it
+        self.active_work: Optional[Dict] = None
+        self.queued_work: Optional[Dict] = None
+        # Scan frontier from the latest PROGRESS, used to resume a lost range
+        self.last_nonce: Optional[int] = None
+        
+        # Liveness: any message refreshes last_seen; PINGs that go
+        # unanswered too often mark the worker unresponsive
+        self.last_seen: Optional[float] = None
+        self.is_responsive = True
+        self.missed_heartbeats = 0
+        self.total_missed_heartbeats = 0
+        self.rtt = LatencyHistogram()
+        self._ping_seq = 0
+        self._pongs: Dict[int, "asyncio.Future[None]"] = {}
+        
+        # Binary frames are used once the Pico accepts them in HELLO
+        self.binary = False
+        self.decoder = FrameDecoder()
+        
+        # A dedicated I/O thread blocks on the port and hands decoded
+        # messages to the event loop: handshake replies go to responses,
+        # RESULT/SHARE/PROGRESS go to on_message (or the messages queue)
+        self.on_message: Optional[Callable[["PicoWorker", Dict], None]] = None
+        self.responses: "asyncio.Queue[Dict]" = asyncio.Queue()
+        self.messages: "asyncio.Queue[Dict]" = asyncio.Queue()
+        self._reader: Optional[threading.Thread] = None
+        self._reader_stop = threading.Event()
+        self._write_lock = asyncio.Lock()
+        
+    async def connect(self, baudrate: int = 115200, timeout: float = 1.0, retries: int = 3):
         """Establish serial connection to the Pico"""
         if serial is None:
             logger.error("pyserial not installed. Install with: pip install pyserial")
             return False
         
         try:
-            self.serial = serial.Serial(
-                port=self.port,
-                baudrate=baudrate,
-                timeout=1,
-                write_timeout=1
-            )
-            
-            # Wait for Pico to initialize
-            await asyncio.sleep(2)
+            # Opening a port can block for a while on a busy USB hub
+            loop = asyncio.get_running_loop()
+            self.serial = await loop.run_in_executor(None, self._open_port, baudrate)
+            # Start clean when reconnecting after a drop
+            self.binary = False
+            self.decoder = FrameDecoder()
+            self.start_reader()
             
-            # Send handshake
-            await self.send_command('HELLO', {'id': self.worker_id})
-            response = await self.read_response(timeout=3)
-            
-            if response and response.get('status') == 'READY':
-                self.is_connected = True
-                logger.info(f"Worker {self.worker_id} connected on {self.port}")
+            if await self.handshake(timeout, retries):
+                logger.info(f"Worker {self.worker_id} connected on {self.port}"
+                            f" ({'binary' if self.binary else 'JSON'} protocol)")
+                if self.bench_ms > 0:
+                    await self.calibrate(self.bench_ms)
                 return True
-            else:
-                logger.error(f"Worker {self.worker_id} handshake failed")
-                return False
+            
+            logger.error(f"Worker {self.worker_id} handshake failed")
+            self.disconnect()
+            return False
                 
         except Exception as e:
             logger.error(f"Failed to connect to worker {self.worker_id}: {e}")
+            self.disconnect()
             return False
     
+    def _open_port(self, baudrate: int):
+        """Open the serial port (blocking, runs in an executor)"""
+        return serial.Serial(
+            port=self.port,
+            baudrate=baudrate,
+            timeout=1,
+            write_timeout=1
+        )
+    
+    async def handshake(self, timeout: float = 1.0, retries: int = 3) -> bool:
+        """Send HELLO until the Pico answers READY or the retries run out"""
+        # A board that is still booting ignores HELLO, so resend it instead
+        # of sleeping a fixed time before the first attempt
+        hello = {'id': self.worker_id, 'progress_ms': self.progress_ms, 'binary': True}
+        for attempt in range(retries + 1):
+            await self._write(f"HELLO:{json.dumps(hello)}\n".encode('utf-8'))
+            response = await self._next_response(timeout)
+            if response and response.get('status') == 'READY':
+                self.is_connected = True
+                self.is_responsive = True
+                self.missed_heartbeats = 0
+                self.binary = bool(response.get('binary'))
+                return True
+            logger.debug(f"Worker {self.worker_id} did not answer HELLO (attempt {attempt + 1})")
+        return False
+    
+    def start_reader(self):
+        """Start the I/O thread reading this worker's serial port"""
+        if self._reader is not None and self._reader.is_alive() and not self._reader_stop.is_set():
+            return
+        loop = asyncio.get_running_loop()
+        # Each thread gets its own stop event and port: a reader that
+        # disconnect() stopped may still be blocked in read() when a
+        # reconnect starts its replacement
+        self._reader_stop = threading.Event()
+        self._reader = threading.Thread(
+            target=self._reader_loop,
+            args=(loop, self.serial, self._reader_stop),
+            name=f"pico-reader-{self.worker_id}",
+            daemon=True
+        )
+        self._reader.start()
+    
+    def _reader_loop(self, loop: asyncio.AbstractEventLoop, port: Any, stop: threading.Event):
+        """Block on the port (I/O thread) and pass bytes to the event loop"""
+        while not stop.is_set():
+            try:
+                # Blocks for up to the port timeout waiting for the first byte
+                data = port.read(port.in_waiting or 1) if port else b''
+            except Exception as e:
+                if not stop.is_set():
+                    loop.call_soon_threadsafe(self._on_reader_error, e)
+                return
+            if data and not stop.is_set():
+                loop.call_soon_threadsafe(self._on_data, data)
+    
+    def _on_data(self, data: bytes):
+        """Frame received bytes and dispatch messages (event loop)"""
+        for message in self.decoder.feed(data):
+            self.last_seen = time.monotonic()
+            if 'type' in message:
+                self.handle_message(message)
+                if self.on_message is not None:
+                    self.on_message(self, message)
+                else:
+                    self.messages.put_nowait(message)
+            else:
+                self.responses.put_nowait(message)
+    
+    def _on_reader_error(self, error: Exception):
+        """Mark the worker dead after a serial read failure (event loop)"""
+        logger.error(f"Serial read failed for worker {self.worker_id}: {error}")
+        self.errors += 1
+        self.is_connected = False
+    
+    async def _write(self, data: bytes):
+        """Write to the port from a worker thread, one write at a time"""
+        async with self._write_lock:
+            if self.serial:
+                await asyncio.get_running_loop().run_in_executor(None, self.serial.write, data)
+    
     async def send_command(self, command: str, data: Optional[Dict] = None) -> bool:
         """Send a command to the Pico worker"""
         if not self.is_connected:
             return False
         
         try:
-            # Simple protocol: CMD:JSON_DATA\n
-            import json
-            message = f"{command}:{json.dumps(data or {})}\n"
-            if self.serial:
-                self.serial.write(message.encode('utf-8'))
+            if self.binary and command in COMMAND_TYPES:
+                message = encode_command(command, data)
+            else:
+                # Text protocol: CMD:JSON_DATA\n
+                message = f"{command}:{json.dumps(data or {})}\n".encode('utf-8')
+            await self._write(message)
             return True
         except Exception as e:
             logger.error(f"Failed to send command to worker {self.worker_id}: {e}")
@@ -86,46 +272,182 @@ class PicoWorker:
         """Read a response from the Pico worker"""
         if not self.is_connected:
             return None
-        
+        return await self._next_response(timeout)
+    
+    async def _next_response(self, timeout: float) -> Optional[Dict]:
+        """Wait for the next handshake/command reply from the reader"""
         try:
-            import json
-            # Non-blocking read with timeout
-            start_time = asyncio.get_event_loop().time()
-            buffer = b""
-            
-            while True:
-                if self.serial and self.serial.in_waiting:
-                    buffer += self.serial.read(self.serial.in_waiting)
-                    
-                    if b'\n' in buffer:
-                        line, buffer = buffer.split(b'\n', 1)
-                        result = json.loads(line.decode('utf-8'))
-                        return result if isinstance(result, dict) else None
-                
-                if asyncio.get_event_loop().time() - start_time > timeout:
-                    return None
-                
-                await asyncio.sleep(0.01)
-                
-        except Exception as e:
-            logger.error(f"Failed to read from worker {self.worker_id}: {e}")
-            self.errors += 1
+            return await asyncio.wait_for(self.responses.get(), timeout)
+        except asyncio.TimeoutError:
             return None
     
     async def send_work(self, work_data: Dict) -> bool:
-        """Send mining work to the worker"""
-        return await self.send_command('WORK', work_data)
+        """Send mining work to the worker, replacing anything it is mining"""
+        if not await self.send_command('WORK', work_data):
+            return False
+        self.active_work = work_data
+        self.queued_work = None
+        self.last_nonce = None
+        return True
+    
+    async def queue_work(self, work_data: Dict) -> bool:
+        """Queue the next range so the Pico starts it without a round trip"""
+        if self.active_work is None:
+            return await self.send_work(work_data)
+        if not await self.send_command('QUEUE', work_data):
+            return False
+        self.queued_work = work_data
+        return True
+    
+    @property
+    def needs_prefetch(self) -> bool:
+        """True when the worker is mining with an empty queue slot"""
+        return self.active_work is not None and self.queued_work is None
+    
+    async def calibrate(self, duration_ms: int = 1000) -> Optional[float]:
+        """Run BENCH on the Pico and use the result as its starting hashrate"""
+        loop = asyncio.get_running_loop()
+        self._bench = loop.create_future()
+        try:
+            if not await self.send_command('BENCH', {'ms': duration_ms}):
+                return None
+            result = await asyncio.wait_for(self._bench, duration_ms / 1000.0 + 2.0)
+        except asyncio.TimeoutError:
+            logger.warning(f"Worker {self.worker_id} did not answer BENCH")
+            return None
+        finally:
+            self._bench = None
+        
+        self.calibrated_hashrate = float(result.get('hashrate', 0))
+        if not self.hashrate:
+            self.hashrate = self.calibrated_hashrate
+        logger.info(f"Worker {self.worker_id} benchmarked at {self.calibrated_hashrate:.2f} H/s "
+                    f"on {result.get('cores', 1)} core(s)")
+        return self.calibrated_hashrate
+    
+    async def ping(self, timeout: float = 5.0) -> Optional[float]:
+        """Send PING and return the round trip in seconds, or None if unanswered"""
+        if not self.is_connected:
+            return None
+        
+        self._ping_seq = (self._ping_seq + 1) & 0xffffffff
+        seq = self._ping_seq
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        self._pongs[seq] = waiter
+        sent = loop.time()
+        try:
+            if not await self.send_command('PING', {'seq': seq}):
+                return None
+            await asyncio.wait_for(waiter, timeout)
+            return loop.time() - sent
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self._pongs.pop(seq, None)
+    
+    def record_heartbeat(self, rtt: Optional[float], max_missed: int = 3):
+        """Update liveness from one heartbeat (rtt in seconds, None if missed)"""
+        if rtt is None:
+            self.missed_heartbeats += 1
+            self.total_missed_heartbeats += 1
+            if self.is_responsive and self.missed_heartbeats >= max_missed:
+                logger.warning(f"Worker {self.worker_id} missed {self.missed_heartbeats} heartbeats, "
+                               f"marking inactive")
+                self.is_responsive = False
+            return
+        
+        self.rtt.record(rtt * 1000.0)
+        self.missed_heartbeats = 0
+        if not self.is_responsive:
+            logger.info(f"Worker {self.worker_id} is responding again")
+            self.is_responsive = True
+    
+    def handle_message(self, message: Dict):
+        """Update worker state from a message sent by the Pico"""
+        if message.get('type') == 'PONG':
+            waiter = self._pongs.get(message.get('seq', -1))
+            if waiter is not None and not waiter.done():
+                waiter.set_result(None)
+            return
+        if message.get('type') == 'BENCH':
+            if self._bench is not None and not self._bench.done():
+                self._bench.set_result(message)
+            return
+        if message.get('type') == 'PROGRESS':
+            # One record per interval: hashes done and milliseconds taken
+            if message.get('ms', 0) > 0:
+                self.meter.record(message.get('delta', 0), message['ms'] / 1000.0, time.monotonic())
+                self.hashrate = self.meter.ewma
+                self._range_hashes = message.get('hashes', self._range_hashes)
+                self._range_ms += message['ms']
+            if 'nonce' in message:
+                self.last_nonce = message['nonce']
+            return
+        if message.get('type') == 'SHARE':
+            # Extra hit ahead of its range's RESULT; the range goes on
+            self.shares_found += 1
+            return
+        if message.get('type') != 'RESULT':
+            return
+        # The range's hashes since its last PROGRESS
+        if message.get('ms') is not None:
+            tail = max(0, message.get('hashes', 0) - self._range_hashes)
+            tail_ms = max(0, message['ms'] - self._range_ms)
+            self.meter.record(tail, tail_ms / 1000.0, time.monotonic())
+            self.hashrate = self.meter.ewma
+        self._range_hashes = 0
+        self._range_ms = 0
+        if message.get('valid'):
+            self.shares_found += 1
+        finished = message.get('lease')
+        active_lease = self.active_work.get('lease') if self.active_work else None
+        if finished and active_lease:
+            # Leased work: match the RESULT to the range it reports on, so
+            # one for an already replaced range changes nothing
+            if finished == active_lease:
+                self._promote_queued()
+            elif self.queued_work and finished == self.queued_work.get('lease'):
+                # The active range's RESULT was lost; both are finished
+                self.active_work = None
+                self.queued_work = None
+        elif not message.get('aborted'):
+            # Aborted ranges were replaced by the controller itself; otherwise
+            # the Pico has moved on to its queued range
+            self._promote_queued()
+    
+    def reset_hashrate(self):
+        """Forget the measured rate (worker lost); BENCH seeds it again"""
+        self.meter.clear()
+        self.hashrate = 0.0
+        self._range_hashes = 0
+        self._range_ms = 0
+    
+    def _promote_queued(self):
+        """The Pico moved on from its active range to the queued one"""
+        self.active_work = self.queued_work
+        self.queued_work = None
+        self.last_nonce = None
     
     async def get_result(self, timeout: float = 5.0) -> Optional[Dict]:
-        """Get mining result from the worker"""
-        return await self.read_response(timeout)
+        """Get the next RESULT from the worker (when no on_message is set)"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            try:
+                message = await asyncio.wait_for(self.messages.get(), deadline - loop.time())
+            except asyncio.TimeoutError:
+                return None
+            if message.get('type') == 'RESULT':
+                return message
     
     def disconnect(self):
         """Close the serial connection"""
+        self._reader_stop.set()
+        self.is_connected = False
         if self.serial:
             try:
                 self.serial.close()
-                self.is_connected = False
                 logger.info(f"Worker {self.worker_id} disconnected")
             except Exception as e:
                 logger.error(f"Error disconnecting worker {self.worker_id}: {e}")
@@ -134,13 +456,46 @@ class PicoWorker:
 class WorkerManager:
     """Manages all Pico workers organized into banks"""
     
-    def __init__(self, workers_per_bank: int = 4, number_of_banks: int = 3):
+    def __init__(self, workers_per_bank: int = 4, number_of_banks: int = 3, progress_ms: int = 5000,
+                 max_concurrent_connects: int = 8, handshake_timeout: float = 1.0, handshake_retries: int = 3,
+                 reconnect_timeout: float = 10.0, scan_interval: float = 2.0,
+                 heartbeat_interval: float = 5.0, heartbeat_timeout: float = 5.0, max_missed_heartbeats: int = 3,
+                 bench_ms: int = 1000):
         self.workers: List[PicoWorker] = []
         self.workers_per_bank = workers_per_bank
         self.number_of_banks = number_of_banks
+        self.progress_ms = progress_ms
         self.expected_total = workers_per_bank * number_of_banks
         
-    async def discover_workers(self):
+        # Ports are opened and handshaken in parallel, a few at a time
+        self.max_concurrent_connects = max_concurrent_connects
+        self.handshake_timeout = handshake_timeout
+        self.handshake_retries = handshake_retries
+        
+        # Hot-plug monitoring: ports are rescanned every scan_interval and
+        # failed connects are retried with exponential backoff capped at
+        # reconnect_timeout seconds
+        self.reconnect_timeout = reconnect_timeout
+        self.scan_interval = scan_interval
+        self.port_ids: Dict[str, int] = {}
+        self.lost_workers: Set[int] = set()
+        self.backoff: Dict[str, Tuple[int, float]] = {}
+        
+        # Heartbeats: every connected worker is pinged each interval and
+        # taken out of rotation after max_missed_heartbeats in a row
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.max_missed_heartbeats = max_missed_heartbeats
+        
+        # Length of the BENCH run each worker does after its handshake
+        # (0 skips calibration)
+        self.bench_ms = bench_ms
+        
+        # Worker meters feed their bank's, which feed the fleet's
+        self.fleet_meter = HashrateMeter()
+        self.bank_meters: Dict[int, HashrateMeter] = {}
+        
+    async def discover_workers(self, on_ready: Optional[WorkerCallback] = None):
         """Auto-discover connected Pico boards via USB"""
         if serial is None:
             logger.error("pyserial not installed. Install with: pip install pyserial")
@@ -148,24 +503,151 @@ class WorkerManager:
         
         logger.info(f"Scanning for Pico devices (expecting {self.expected_total} workers in {self.number_of_banks} banks)...")
         
-        # List all serial ports
-        ports = serial.tools.list_ports.comports()
+        pico_ports = self.find_pico_ports()
+        for port in pico_ports:
+            logger.info(f"Found potential Pico on {port}")
+        
+        await self.connect_ports(pico_ports, on_ready)
+        
+        logger.info(f"Successfully connected to {len(self.workers)} workers across {self.get_bank_count()} banks")
+    
+    def find_pico_ports(self) -> List[str]:
+        """List serial ports that look like Pico boards"""
         pico_ports = []
         
-        for port in ports:
+        for port in serial.tools.list_ports.comports():
             # Pico typically shows up as "USB Serial Device" or similar
             # You may need to adjust VID/PID for your specific setup
             if 'USB Serial' in port.description or '2E8A' in str(port.hwid):
                 pico_ports.append(port.device)
-                logger.info(f"Found potential Pico on {port.device}")
         
-        # Connect to each discovered port
-        for idx, port in enumerate(pico_ports):
-            worker = PicoWorker(port, idx)
-            if await worker.connect():
-                self.workers.append(worker)
+        return pico_ports
+    
+    def worker_id_for(self, port: str) -> int:
+        """Stable worker ID for a port, assigned the first time it is seen"""
+        if port not in self.port_ids:
+            self.port_ids[port] = len(self.port_ids)
+        return self.port_ids[port]
+    
+    async def connect_ports(self, ports: List[str], on_ready: Optional[WorkerCallback] = None):
+        """Connect to all ports concurrently, calling on_ready per worker"""
+        semaphore = asyncio.Semaphore(self.max_concurrent_connects)
+        # Worker IDs follow port order so bank assignment stays stable
+        workers = [PicoWorker(port, self.worker_id_for(port), self.progress_ms, self.bench_ms) for port in ports]
+        await asyncio.gather(*(self._bring_up(worker, semaphore, on_ready) for worker in workers))
+    
+    async def _bring_up(self, worker: PicoWorker, semaphore: asyncio.Semaphore,
+                        on_ready: Optional[WorkerCallback]) -> bool:
+        """Connect one worker and hand it out, or schedule a retry"""
+        async with semaphore:
+            connected = await worker.connect(timeout=self.handshake_timeout,
+                                             retries=self.handshake_retries)
+        loop = asyncio.get_running_loop()
+        if not connected:
+            attempts, _ = self.backoff.get(worker.port, (0, 0.0))
+            delay = min(2.0 ** attempts, self.reconnect_timeout)
+            self.backoff[worker.port] = (attempts + 1, loop.time() + delay)
+            return False
+        
+        self.backoff.pop(worker.port, None)
+        self.lost_workers.discard(worker.worker_id)
+        if worker not in self.workers:
+            worker.meter.attach(self.get_bank_meter(self.get_bank_id(worker.worker_id)))
+            self.workers.append(worker)
+            self.workers.sort(key=lambda w: w.worker_id)
         
-        logger.info(f"Successfully connected to {len(self.workers)} workers across {self.get_bank_count()} banks")
+        # Hand the worker out right away rather than after the slowest port
+        if on_ready is not None:
+            try:
+                await on_ready(worker)
+            except Exception as e:
+                logger.error(f"Failed to start worker {worker.worker_id}: {e}")
+        return True
+    
+    async def monitor(self, on_ready: Optional[WorkerCallback] = None,
+                      on_lost: Optional[WorkerCallback] = None):
+        """Watch for Pico ports appearing and disappearing until cancelled"""
+        while True:
+            try:
+                await self.check_ports(on_ready, on_lost)
+            except Exception as e:
+                logger.error(f"Port scan failed: {e}")
+            await asyncio.sleep(self.scan_interval)
+    
+    async def check_ports(self, on_ready: Optional[WorkerCallback] = None,
+                          on_lost: Optional[WorkerCallback] = None):
+        """Reconcile workers with the serial ports currently present"""
+        loop = asyncio.get_running_loop()
+        ports = set(await loop.run_in_executor(None, self.find_pico_ports))
+        now = loop.time()
+        
+        for worker in self.workers:
+            if worker.is_connected and worker.port in ports:
+                continue
+            if worker.worker_id not in self.lost_workers:
+                # Report the drop once; its unfinished range goes back
+                logger.warning(f"Worker {worker.worker_id} lost on {worker.port}")
+                self.lost_workers.add(worker.worker_id)
+                self.backoff.setdefault(worker.port, (0, now))
+                worker.disconnect()
+                worker.reset_hashrate()
+                if on_lost is not None:
+                    try:
+                        await on_lost(worker)
+                    except Exception as e:
+                        logger.error(f"Failed to release worker {worker.worker_id}: {e}")
+        
+        # Reconnect dropped workers and bring up new ports whose backoff expired
+        known = {w.port: w for w in self.workers}
+        due = []
+        for port in sorted(ports):
+            existing = known.get(port)
+            if existing is not None and existing.worker_id not in self.lost_workers:
+                continue
+            if self.backoff.get(port, (0, 0.0))[1] > now:
+                continue
+            if existing is None:
+                logger.info(f"New Pico port {port}")
+                existing = PicoWorker(port, self.worker_id_for(port), self.progress_ms, self.bench_ms)
+            due.append(existing)
+        
+        if due:
+            semaphore = asyncio.Semaphore(self.max_concurrent_connects)
+            await asyncio.gather(*(self._bring_up(worker, semaphore, on_ready) for worker in due))
+    
+    async def heartbeat(self, on_ready: Optional[WorkerCallback] = None,
+                        on_lost: Optional[WorkerCallback] = None):
+        """Ping all workers every heartbeat_interval until cancelled"""
+        while True:
+            try:
+                await self.check_heartbeats(on_ready, on_lost)
+            except Exception as e:
+                logger.error(f"Heartbeat failed: {e}")
+            await asyncio.sleep(self.heartbeat_interval)
+    
+    async def check_heartbeats(self, on_ready: Optional[WorkerCallback] = None,
+                               on_lost: Optional[WorkerCallback] = None):
+        """Ping connected workers concurrently and update their liveness"""
+        workers = [w for w in self.workers if w.is_connected]
+        rtts = await asyncio.gather(*(w.ping(self.heartbeat_timeout) for w in workers))
+        
+        for worker, rtt in zip(workers, rtts):
+            was_responsive = worker.is_responsive
+            worker.record_heartbeat(rtt, self.max_missed_heartbeats)
+            
+            # A hung board gives its range back; it gets work again once
+            # it answers
+            callback = None
+            if was_responsive and not worker.is_responsive:
+                worker.reset_hashrate()
+                callback = on_lost
+            elif worker.is_responsive and not was_responsive:
+                callback = on_ready
+            if callback is not None:
+                try:
+                    await callback(worker)
+                except Exception as e:
+                    logger.error(f"Heartbeat callback failed for worker {worker.worker_id}: {e}")
     
     def get_bank_id(self, worker_id: int) -> int:
         """Get bank ID for a given worker ID"""
@@ -178,6 +660,12 @@ class WorkerManager:
             return bank_names[bank_id]
         return f"Bank-{bank_id}"
     
+    def get_bank_meter(self, bank_id: int) -> HashrateMeter:
+        """Hashrate meter aggregating a bank's workers"""
+        if bank_id not in self.bank_meters:
+            self.bank_meters[bank_id] = HashrateMeter(parent=self.fleet_meter)
+        return self.bank_meters[bank_id]
+    
     def get_workers_by_bank(self, bank_id: int) -> List[PicoWorker]:
         """Get all workers in a specific bank"""
         return [w for w in self.workers if self.get_bank_id(w.worker_id) == bank_id]
@@ -191,36 +679,53 @@ class WorkerManager:
     
     def get_active_workers(self) -> List[PicoWorker]:
         """Get list of currently active workers"""
-        return [w for w in self.workers if w.is_connected]
+        return [w for w in self.workers if w.is_connected and w.is_responsive]
     
     def get_worker_stats(self) -> List[Dict]:
         """Get statistics for all workers"""
+        now = time.monotonic()
         return [{
             'id': w.worker_id,
             'bank_id': self.get_bank_id(w.worker_id),
             'bank_name': self.get_bank_name(self.get_bank_id(w.worker_id)),
             'port': w.port,
             'connected': w.is_connected,
+            'responsive': w.is_responsive,
             'hashrate': w.hashrate,
+            'hashrate_window': w.meter.window_rate(now),
+            'calibrated_hashrate': w.calibrated_hashrate,
             'shares': w.shares_found,
-            'errors': w.errors
+            'errors': w.errors,
+            'last_seen_s': now - w.last_seen if w.last_seen is not None else None,
+            'missed_heartbeats': w.total_missed_heartbeats,
+            'rtt': w.rtt.as_dict()
         } for w in self.workers]
     
     def get_bank_stats(self) -> List[Dict]:
         """Get aggregated statistics by bank"""
         banks = []
+        now = time.monotonic()
         for bank_id in range(self.get_bank_count()):
             bank_workers = self.get_workers_by_bank(bank_id)
-            active_workers = [w for w in bank_workers if w.is_connected]
+            active_workers = [w for w in bank_workers if w.is_connected and w.is_responsive]
+            rtt = LatencyHistogram()
+            for w in bank_workers:
+                rtt.merge(w.rtt)
+            seen = [w.last_seen for w in bank_workers if w.last_seen is not None]
+            meter = self.get_bank_meter(bank_id)
             
             banks.append({
                 'bank_id': bank_id,
                 'bank_name': self.get_bank_name(bank_id),
                 'total_workers': len(bank_workers),
                 'active_workers': len(active_workers),
-                'total_hashrate': sum(w.hashrate for w in active_workers),
+                'total_hashrate': meter.rate,
+                'hashrate': meter.as_dict(now),
                 'total_shares': sum(w.shares_found for w in bank_workers),
-                'total_errors': sum(w.errors for w in bank_workers)
+                'total_errors': sum(w.errors for w in bank_workers),
+                'missed_heartbeats': sum(w.total_missed_heartbeats for w in bank_workers),
+                'last_seen_s': now - max(seen) if seen else None,
+                'rtt': rtt.as_dict()
             })
         return banks
     
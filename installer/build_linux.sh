@@ -46,7 +46,7 @@ Version: 1.0.0
 Section: utils
 Priority: optional
 Architecture: armhf
-Depends: python3 (>= 3.8), python3-serial, python3-aiohttp
+Depends: python3 (>= 3.8), python3-serial
 Maintainer: Pi Bitcoin Miner Team <your.email@example.com>
 Description: Distributed Bitcoin mining using Raspberry Pi
  This is an educational project for learning about Bitcoin mining
@@ -14,10 +14,50 @@ import json
 import struct
 import hashlib
 
+# CRC for binary frames; without it only the JSON protocol is offered
+try:
+    from binascii import crc32
+except ImportError:
+    crc32 = None  # type: ignore
+
+# Second RP2040 core, started through _thread when the port provides it
+try:
+    import _thread
+except ImportError:
+    _thread = None  # type: ignore
+
+
+class HashlibNonceScanner:
+    """Fallback nonce scanner hashing the full header with sha256_double"""
+    
+    def __init__(self, header, target):
+        self.header = bytearray(80)
+        self.header[0:76] = header[0:76]
+        self.target = target
+    
+    def check(self, nonce):
+        """Return the hash if it meets the target, otherwise None"""
+        hits, _ = self.scan(nonce, 1)
+        return hits[0][1] if hits else None
+    
+    def scan(self, start_nonce, count):
+        """Hash count nonces from start_nonce, return (hits, hashed)"""
+        end_nonce = min(start_nonce + count, 0x100000000)
+        header = self.header
+        hits = []
+        for nonce in range(start_nonce, end_nonce):
+            struct.pack_into('<I', header, 76, nonce)
+            hash_result = sha256_double(header)
+            if int.from_bytes(hash_result[::-1], 'big') < self.target:
+                hits.append((nonce, hash_result))
+        return hits, end_nonce - start_nonce
+
+
 # Try to use optimized SHA-256, fallback to hashlib
 if not TYPE_CHECKING:
     try:
         from sha256_optimized import double_sha256 as sha256_double  # type: ignore
+        from sha256_optimized import NonceScanner  # type: ignore
         USE_OPTIMIZED = True
         print("Using optimized SHA-256")
     except ImportError:
@@ -25,6 +65,7 @@ if not TYPE_CHECKING:
             """Fallback double SHA-256 using hashlib"""
             h1 = hashlib.sha256(data).digest()
             return hashlib.sha256(h1).digest()
+        NonceScanner = HashlibNonceScanner
         USE_OPTIMIZED = False
         print("Using hashlib SHA-256")
 else:
@@ -33,6 +74,7 @@ else:
         """Fallback double SHA-256 using hashlib"""
         h1 = hashlib.sha256(data).digest()
         return hashlib.sha256(h1).digest()
+    NonceScanner = HashlibNonceScanner
     USE_OPTIMIZED = False
 
 # MicroPython time functions compatibility
@@ -49,6 +91,62 @@ else:
         """Fallback tick difference"""
         return end - start
 
+# The UART is polled and protocol bookkeeping runs between scan() calls
+# (slices). Slices are sized from the measured rate to last about
+# SLICE_MS, which bounds STOP/WORK/PING latency on slow and fast boards
+SLICE_MS = 50
+FIRST_SLICE = 16
+MAX_SLICE = 8192
+# Fixed slice size when time-based sizing is off (slice_ms = 0)
+SCAN_SLICE = 256
+
+# Default PROGRESS interval, overridden by 'progress_ms' in HELLO
+PROGRESS_MS = 5000
+# Default BENCH duration
+BENCH_MS = 1000
+
+# Mine on both RP2040 cores (only meaningful on the board itself)
+DUAL_CORE = _thread is not None and machine is not None
+
+
+class NullLock:
+    """Stand-in for _thread locks when running single-threaded"""
+    
+    def acquire(self):
+        return True
+    
+    def release(self):
+        pass
+
+
+# Binary framing (see controller/protocol.py):
+# magic (1) | type (1) | length (2) | payload | crc32 (4), little-endian
+FRAME_MAGIC = 0xA5
+MSG_WORK = 0x10
+MSG_QUEUE = 0x11
+MSG_STOP = 0x12
+MSG_PING = 0x13
+MSG_RESULT = 0x20
+MSG_PROGRESS = 0x21
+MSG_PONG = 0x22
+MSG_SHARE = 0x23
+FRAME_COMMANDS = {MSG_WORK: 'WORK', MSG_QUEUE: 'QUEUE', MSG_STOP: 'STOP', MSG_PING: 'PING'}
+RESULT_VALID = 0x01
+RESULT_ABORTED = 0x02
+# Payload sizes a controller frame of each type can have (WORK grew a
+# trailing ntime window, then version mask); anything else is noise
+WORK_SIZES = (132, 136, 140)
+FRAME_SIZES = {MSG_WORK: WORK_SIZES, MSG_QUEUE: WORK_SIZES, MSG_STOP: (0,), MSG_PING: (4,)}
+TEXT_COMMANDS = (b'HELLO:', b'WORK:', b'QUEUE:', b'STOP:', b'PING:', b'BENCH:')
+
+
+def encode_frame(msg_type, payload):
+    """Wrap a payload in a binary frame"""
+    header = struct.pack('<BBH', FRAME_MAGIC, msg_type, len(payload))
+    crc = crc32(header[1:] + payload) & 0xffffffff
+    return header + payload + struct.pack('<I', crc)
+
+
 # UART for USB communication with Pi 4
 if machine is not None:
     uart = machine.UART(0, baudrate=115200)
@@ -59,6 +157,7 @@ else:
     uart = None  # type: ignore
     led = None  # type: ignore
 
+
 class BitcoinMiner:
     """Bitcoin mining worker for Raspberry Pi Pico"""
     
@@ -68,6 +167,23 @@ class BitcoinMiner:
         self.current_work = None
         self.hashes_computed = 0
         self.start_time = 0
+        self.pending_work = None
+        self.next_work = None
+        self.progress_ms = PROGRESS_MS
+        self.binary = False
+        self.rx = b''
+        
+        # Shared between core 0 and core 1 while a range is mined
+        self.use_second_core = DUAL_CORE
+        self.lock = _thread.allocate_lock() if _thread is not None else NullLock()
+        self.next_nonce = 0
+        self.end_nonce = 0
+        self.slice_ms = SLICE_MS
+        self.slice_size = FIRST_SLICE
+        self.hits = []
+        self.core1_active = False
+        # Passes over the current range at a rolled version or ntime
+        self.rolled = 0
         
     def blink_led(self, times=1):
         """Blink LED for status indication"""
@@ -79,14 +195,37 @@ class BitcoinMiner:
             led.value(0)
             time.sleep(0.1)
     
+    def encode_message(self, message):
+        """Encode a message as a binary frame when negotiated, else JSON"""
+        msg_type = message.get('type')
+        if self.binary and msg_type == 'RESULT':
+            flags = RESULT_VALID if message['valid'] else 0
+            if message.get('aborted'):
+                flags |= RESULT_ABORTED
+            hash_bytes = bytes.fromhex(message['hash']) if 'hash' in message else b''
+            return encode_frame(MSG_RESULT, struct.pack(
+                '<BHIII32sIII', flags, self.worker_id or 0, message.get('nonce', 0),
+                message['hashes'], message.get('ms', 0), hash_bytes, message.get('lease', 0),
+                int(message.get('ntime', '0'), 16), int(message.get('version', '0'), 16)))
+        if self.binary and msg_type == 'PROGRESS':
+            return encode_frame(MSG_PROGRESS, struct.pack(
+                '<HIIIQ', self.worker_id or 0, message['hashes'], message['delta'],
+                message['ms'], message['nonce']))
+        if self.binary and msg_type == 'PONG':
+            return encode_frame(MSG_PONG, struct.pack('<HI', self.worker_id or 0, message['seq']))
+        if self.binary and msg_type == 'SHARE':
+            return encode_frame(MSG_SHARE, struct.pack(
+                '<HI32sIII', self.worker_id or 0, message['nonce'], bytes.fromhex(message['hash']),
+                message.get('lease', 0), int(message.get('ntime', '0'), 16), int(message.get('version', '0'), 16)))
+        return (json.dumps(message) + '\n').encode('utf-8')
+    
     def send_message(self, message):
-        """Send JSON message to controller"""
+        """Send message to controller"""
         if uart is None:
             print("Mock send: {}".format(message))
             return
         try:
-            msg = json.dumps(message) + '\n'
-            uart.write(msg.encode('utf-8'))
+            uart.write(self.encode_message(message))
         except Exception as e:
             print("Send error: {}".format(e))
     
@@ -94,123 +233,416 @@ class BitcoinMiner:
         """Read command from controller (non-blocking)"""
         if uart is None:
             return None, None
-        if uart.any():
+        pending = uart.any()
+        if pending:
+            self.rx += uart.read(pending)
+        return self.next_command()
+    
+    def next_command(self):
+        """Take one complete command (text line or binary frame) from rx"""
+        rx = self.rx
+        while rx:
+            if rx[0] == FRAME_MAGIC:
+                if len(rx) < 4:
+                    break
+                msg_type = rx[1]
+                length = rx[2] | (rx[3] << 8)
+                if length not in FRAME_SIZES.get(msg_type, ()) or crc32 is None:
+                    rx = rx[1:]
+                    continue
+                total = 8 + length
+                if len(rx) < total:
+                    break
+                crc = struct.unpack('<I', rx[4 + length:total])[0]
+                if crc32(rx[1:4 + length]) & 0xffffffff != crc:
+                    # The header may be the corrupt part: drop only the
+                    # magic byte and look for the next frame
+                    rx = rx[1:]
+                    continue
+                payload = rx[4:4 + length]
+                self.rx = rx[total:]
+                return self.decode_frame(msg_type, payload)
+            
+            end = rx.find(b'\n')
+            magic = rx.find(bytes([FRAME_MAGIC]))
+            if magic > 0 and (end < 0 or magic < end):
+                # Rest of a damaged frame ahead of the next one
+                rx = rx[magic:]
+                continue
+            if end < 0:
+                break
+            line = rx[:end]
+            rx = rx[end + 1:]
+            # Skip leftovers of a damaged frame in front of the command
+            starts = [line.find(name) for name in TEXT_COMMANDS if name in line]
+            if starts:
+                line = line[min(starts):]
             try:
-                line = uart.readline()
-                if line:
-                    data = line.decode('utf-8').strip()
-                    if ':' in data:
-                        cmd, json_data = data.split(':', 1)
-                        return cmd, json.loads(json_data)
+                data = line.decode('utf-8').strip()
+                if ':' in data:
+                    cmd, json_data = data.split(':', 1)
+                    self.rx = rx
+                    return cmd, json.loads(json_data)
             except Exception as e:
                 print("Read error: {}".format(e))
+        self.rx = rx
         return None, None
     
+    def decode_frame(self, msg_type, payload):
+        """Turn a binary command frame into (cmd, data)"""
+        cmd = FRAME_COMMANDS.get(msg_type)
+        if cmd is None:
+            print("Unknown frame type: {}".format(msg_type))
+            return None, None
+        if msg_type == MSG_STOP:
+            return cmd, {}
+        if msg_type == MSG_PING:
+            return cmd, {'seq': struct.unpack('<I', payload[0:4])[0]}
+        # Raw header and integer target: no hex or JSON parsing needed
+        start_nonce, end_nonce, lease = struct.unpack('<QQI', payload[112:132])
+        # The ntime window and version mask were appended later; shorter
+        # frames do not roll
+        ntime_roll = struct.unpack('<I', payload[132:136])[0] if len(payload) >= 136 else 0
+        version_mask = struct.unpack('<I', payload[136:140])[0] if len(payload) >= 140 else 0
+        return cmd, {
+            'block_header': bytes(payload[0:80]),
+            'target': int.from_bytes(payload[80:112], 'big'),
+            'start_nonce': start_nonce,
+            'end_nonce': end_nonce,
+            'lease': lease,
+            'ntime_roll': ntime_roll,
+            'version_mask': version_mask
+        }
+    
     def double_sha256(self, data):
         """Compute double SHA-256 (Bitcoin block hash)"""
         return sha256_double(data)
     
-    def mine_block(self, block_header, target, start_nonce, end_nonce):
-        """Mine with given nonce range"""
+    def claim_slice(self):
+        """Claim the next slice of the current range (either core)"""
+        self.lock.acquire()
+        try:
+            start = self.next_nonce
+            if start >= self.end_nonce:
+                return None
+            size = self.slice_size if self.slice_ms > 0 else SCAN_SLICE
+            count = min(size, self.end_nonce - start)
+            self.next_nonce = start + count
+            return start, count
+        finally:
+            self.lock.release()
+    
+    def fit_slice(self, hashed, ms):
+        """Size the next slices to take about slice_ms on one core"""
+        if self.slice_ms <= 0:
+            return
+        # Too quick to measure: grow until it is not
+        size = hashed * 2 if ms <= 0 else hashed * self.slice_ms // ms
+        self.slice_size = max(1, min(MAX_SLICE, size))
+    
+    def scan_slice(self, scanner, span):
+        """Scan a claimed slice on core 0 and resize slices from its time"""
+        started = ticks_ms()
+        hits, hashed = scanner.scan(span[0], span[1])
+        self.record_slice(hits, hashed)
+        self.fit_slice(hashed, ticks_diff(ticks_ms(), started))
+    
+    def poll_commands(self):
+        """Handle every command that arrived during the last slice"""
+        # Stops once one ends the range, so later commands are handled
+        # by the next range or the idle loop
+        while self.is_mining:
+            cmd, data = self.read_command()
+            if cmd is None:
+                return
+            self.handle_command(cmd, data)
+    
+    def record_slice(self, hits, hashed):
+        """Merge a scanned slice into the shared counters (either core)"""
+        self.lock.acquire()
+        self.hashes_computed += hashed
+        if hits:
+            self.hits.extend(hits)
+        self.lock.release()
+    
+    def keep_scanning(self):
+        """True while the current pass should go on (either core)"""
+        # A rolled pass is only filler: queued work takes over at once
+        return self.is_mining and not self.hits and not (self.rolled and self.next_work is not None)
+    
+    def core1_loop(self, scanner):
+        """Scan slices on the second core until the range is done"""
+        try:
+            while self.keep_scanning():
+                span = self.claim_slice()
+                if span is None:
+                    break
+                hits, hashed = scanner.scan(span[0], span[1])
+                self.record_slice(hits, hashed)
+        except Exception as e:
+            print("Core 1 error: {}".format(e))
+        finally:
+            self.core1_active = False
+    
+    def send_progress(self, now, since_ms, since_hashes):
+        """Send one compact PROGRESS record covering the last interval"""
+        self.send_message({
+            'type': 'PROGRESS',
+            'worker_id': self.worker_id,
+            'hashes': self.hashes_computed,
+            'delta': self.hashes_computed - since_hashes,
+            'ms': ticks_diff(now, since_ms),
+            # Once rolling, the leased range itself is fully hashed
+            'nonce': self.end_nonce if self.rolled else self.next_nonce
+        })
+    
+    def mine_block(self, block_header, target, start_nonce, end_nonce, ntime_roll=0, version_mask=0):
+        """Mine with given nonce range, rolling version bits and up to ntime_roll seconds of ntime"""
         self.is_mining = True
         self.start_time = ticks_ms()
         
         # Convert hex block header to bytes
-        header_bytes = bytes.fromhex(block_header)
-        target_int = int(target, 16)
+        # (binary frames already carry raw bytes and an integer target)
+        header_bytes = block_header if isinstance(block_header, bytes) else bytes.fromhex(block_header)
+        target_int = target if isinstance(target, int) else int(target, 16)
+        ntime = struct.unpack('<I', header_bytes[68:72])[0]
+        version = struct.unpack('<I', header_bytes[0:4])[0]
+        start_bits = version & version_mask
+        ntime_rolled = 0
         
-        # Mine through nonce range
-        for nonce in range(start_nonce, end_nonce):
-            if not self.is_mining:
-                break
-            
-            # Build block header with current nonce
-            # Block header is 80 bytes: version(4) + prev_hash(32) + merkle(32) 
-            #                          + timestamp(4) + bits(4) + nonce(4)
-            header_with_nonce = header_bytes[:76] + struct.pack('<I', nonce)
-            
-            # Compute double SHA-256
-            hash_result = self.double_sha256(header_with_nonce)
-            
-            # Convert hash to integer (little-endian for Bitcoin)
-            hash_int = int.from_bytes(hash_result[::-1], 'big')
+        self.end_nonce = end_nonce
+        self.hits = []
+        self.rolled = 0
+        last_progress = 0
+        last_progress_ms = self.start_time
+        
+        while True:
+            # Both cores claim slices from the same range
+            self.next_nonce = start_nonce
             
-            self.hashes_computed += 1
+            # Midstate, constant rounds and padding are precomputed per job;
+            # each core gets its own scanner (they hold schedule buffers)
+            scanner = NonceScanner(header_bytes, target_int)
+            if self.use_second_core:
+                self.core1_active = True
+                _thread.start_new_thread(self.core1_loop, (NonceScanner(header_bytes, target_int),))
             
-            # Check if hash meets target difficulty
-            if hash_int < target_int:
-                # Valid solution found!
-                elapsed = ticks_diff(ticks_ms(), self.start_time)
-                hashrate = self.hashes_computed / (elapsed / 1000.0) if elapsed > 0 else 0
+            # Mine through nonce range one slice at a time
+            while self.keep_scanning():
+                span = self.claim_slice()
+                if span is None:
+                    break
+                self.scan_slice(scanner, span)
                 
-                self.send_message({
-                    'type': 'RESULT',
-                    'valid': True,
-                    'nonce': nonce,
-                    'hash': hash_result.hex(),
-                    'hashes': self.hashes_computed,
-                    'hashrate': hashrate,
-                    'worker_id': self.worker_id
-                })
+                # Stay responsive: STOP or a newer WORK ends this range
+                self.poll_commands()
                 
-                self.blink_led(3)  # Blink 3 times for valid share
-                return
+                # Progress is reported on elapsed time, checked once per slice
+                now = ticks_ms()
+                if ticks_diff(now, last_progress_ms) >= self.progress_ms:
+                    self.send_progress(now, last_progress_ms, last_progress)
+                    last_progress_ms = now
+                    last_progress = self.hashes_computed
             
-            # Send periodic progress updates (every 10000 hashes)
-            if self.hashes_computed % 10000 == 0:
-                elapsed = ticks_diff(ticks_ms(), self.start_time)
-                hashrate = self.hashes_computed / (elapsed / 1000.0) if elapsed > 0 else 0
-                
-                self.send_message({
-                    'type': 'PROGRESS',
-                    'hashes': self.hashes_computed,
-                    'hashrate': hashrate,
-                    'current_nonce': nonce,
-                    'worker_id': self.worker_id
-                })
+            # Wait for core 1 to finish its slice so hash counts are merged
+            while self.core1_active:
+                time.sleep(0.001)
+            
+            # Range done and nothing queued: scan it again under the next
+            # permitted version bits (BIP 310), then one second later, instead
+            # of idling until the controller sends a new header
+            if self.hits or not self.is_mining or self.next_nonce < end_nonce or self.next_work is not None:
+                break
+            bits = ((version | (~version_mask & 0xffffffff)) + 1) & version_mask
+            if bits == start_bits:
+                if ntime_rolled >= ntime_roll:
+                    break
+                ntime_rolled += 1
+            version = (version & ~version_mask & 0xffffffff) | bits
+            self.rolled += 1
+            header_bytes = (struct.pack('<I', version) + header_bytes[4:68] +
+                            struct.pack('<I', ntime + ntime_rolled) + header_bytes[72:])
         
-        # Completed range without finding solution
         elapsed = ticks_diff(ticks_ms(), self.start_time)
         hashrate = self.hashes_computed / (elapsed / 1000.0) if elapsed > 0 else 0
+        # Echo the controller's lease ID so it can match this RESULT
+        lease = self.current_work.get('lease', 0) if self.current_work else 0
         
-        self.send_message({
-            'type': 'RESULT',
-            'valid': False,
-            'hashes': self.hashes_computed,
-            'hashrate': hashrate,
-            'worker_id': self.worker_id
-        })
+        # Shares are checked and submitted with the version and ntime they
+        # were mined at
+        ntime_hex = '{:08x}'.format(ntime + ntime_rolled)
+        version_hex = '{:08x}'.format(version)
+        
+        # Check if any hash met the target difficulty
+        if self.hits:
+            # Valid solution found! Both cores may have hit in the same
+            # pass; every hit but the lowest goes out as a SHARE first
+            hits = sorted(self.hits)
+            for hit_nonce, hash_result in hits[1:]:
+                self.send_message({
+                    'type': 'SHARE',
+                    'valid': True,
+                    'nonce': hit_nonce,
+                    'hash': hash_result.hex(),
+                    'worker_id': self.worker_id,
+                    'lease': lease,
+                    'ntime': ntime_hex,
+                    'version': version_hex
+                })
+            hit_nonce, hash_result = hits[0]
+            self.send_message({
+                'type': 'RESULT',
+                'valid': True,
+                'nonce': hit_nonce,
+                'hash': hash_result.hex(),
+                'hashes': self.hashes_computed,
+                'hashrate': hashrate,
+                'ms': elapsed,
+                'worker_id': self.worker_id,
+                'lease': lease,
+                'ntime': ntime_hex,
+                'version': version_hex
+            })
+            
+            self.blink_led(3)  # Blink 3 times for valid share
+        else:
+            # Completed (or interrupted) range without finding solution
+            self.send_message({
+                'type': 'RESULT',
+                'valid': False,
+                'aborted': not self.rolled and self.next_nonce < self.end_nonce,
+                'hashes': self.hashes_computed,
+                'hashrate': hashrate,
+                'ms': elapsed,
+                'worker_id': self.worker_id,
+                'lease': lease,
+                'ntime': ntime_hex,
+                'version': version_hex
+            })
         
         self.is_mining = False
     
     def handle_hello(self, data):
         """Handle HELLO handshake from controller"""
         self.worker_id = data.get('id', 0)
-        self.send_message({'status': 'READY', 'worker_id': self.worker_id})
+        self.progress_ms = data.get('progress_ms', PROGRESS_MS)
+        # Switch to binary frames if the controller offers them
+        self.binary = bool(data.get('binary')) and crc32 is not None
+        self.send_message({'status': 'READY', 'worker_id': self.worker_id, 'binary': self.binary})
         self.blink_led(2)
         print("Worker {} initialized".format(self.worker_id))
     
     def handle_work(self, data):
         """Handle new work assignment"""
-        self.current_work = data
-        self.hashes_computed = 0
-        
-        print("Received work: nonce range {}-{}".format(
-            data['start_nonce'], data['end_nonce']))
-        
-        # Start mining
-        self.mine_block(
-            data['block_header'],
-            data['target'],
-            data['start_nonce'],
-            data['end_nonce']
-        )
+        while data is not None:
+            self.current_work = data
+            self.pending_work = None
+            self.hashes_computed = 0
+            
+            print("Received work: nonce range {}-{}".format(
+                data['start_nonce'], data['end_nonce']))
+            
+            # Start mining; a WORK received meanwhile preempts this one
+            self.mine_block(
+                data['block_header'],
+                data['target'],
+                data['start_nonce'],
+                data['end_nonce'],
+                data.get('ntime_roll', 0),
+                data.get('version_mask', 0)
+            )
+            
+            # Preempting WORK wins, otherwise start the queued job at once
+            if self.pending_work is not None:
+                data = self.pending_work
+            else:
+                data = self.next_work
+                self.next_work = None
     
     def handle_stop(self, data):
         """Handle STOP command"""
         self.is_mining = False
+        self.pending_work = None
+        self.next_work = None
         print("Mining stopped")
     
+    def benchmark(self, duration_ms):
+        """Hash a dummy header on all mining cores for duration_ms"""
+        # Same kernel and slice claiming as mine_block; target 0 never hits
+        header = bytes(range(80))
+        self.is_mining = True
+        self.next_nonce = 0
+        self.end_nonce = 0x100000000
+        self.hits = []
+        self.hashes_computed = 0
+        self.rolled = 0
+        start = ticks_ms()
+        scanner = NonceScanner(header, 0)
+        if self.use_second_core:
+            self.core1_active = True
+            _thread.start_new_thread(self.core1_loop, (NonceScanner(header, 0),))
+        
+        while ticks_diff(ticks_ms(), start) < duration_ms:
+            span = self.claim_slice()
+            if span is None:
+                break
+            # Also sizes the slices of the first range
+            self.scan_slice(scanner, span)
+        
+        self.is_mining = False
+        while self.core1_active:
+            time.sleep(0.001)
+        elapsed = ticks_diff(ticks_ms(), start)
+        hashes = self.hashes_computed
+        self.hashes_computed = 0
+        return hashes, elapsed
+    
+    def handle_bench(self, data):
+        """Measure and report hashes/sec (BENCH)"""
+        if self.is_mining:
+            # Busy: the current range is a live measurement already
+            hashes = self.hashes_computed
+            elapsed = ticks_diff(ticks_ms(), self.start_time)
+        else:
+            hashes, elapsed = self.benchmark(data.get('ms', BENCH_MS))
+        self.send_message({
+            'type': 'BENCH',
+            'worker_id': self.worker_id,
+            'hashes': hashes,
+            'ms': elapsed,
+            'hashrate': hashes * 1000.0 / elapsed if elapsed > 0 else 0,
+            'cores': 2 if self.use_second_core else 1
+        })
+    
+    def handle_ping(self, data):
+        """Answer a heartbeat PING (idle or between scan slices)"""
+        self.send_message({'type': 'PONG', 'worker_id': self.worker_id, 'seq': data.get('seq', 0)})
+    
+    def handle_command(self, cmd, data):
+        """Dispatch a controller command (idle or between scan slices)"""
+        if cmd == 'HELLO':
+            self.handle_hello(data)
+        elif cmd == 'WORK':
+            if self.is_mining:
+                # Newer work replaces the current range immediately
+                self.pending_work = data
+                self.next_work = None
+                self.is_mining = False
+            else:
+                self.handle_work(data)
+        elif cmd == 'QUEUE':
+            if self.is_mining:
+                # Double buffer: mined as soon as the current range ends
+                self.next_work = data
+            else:
+                self.handle_work(data)
+        elif cmd == 'STOP':
+            self.handle_stop(data)
+        elif cmd == 'PING':
+            self.handle_ping(data)
+        elif cmd == 'BENCH':
+            self.handle_bench(data)
+    
     def run(self):
         """Main worker loop"""
         print("Pico Bitcoin Miner starting...")
@@ -219,13 +651,7 @@ class BitcoinMiner:
         while True:
             # Check for commands from controller
             cmd, data = self.read_command()
-            
-            if cmd == 'HELLO':
-                self.handle_hello(data)
-            elif cmd == 'WORK':
-                self.handle_work(data)
-            elif cmd == 'STOP':
-                self.handle_stop(data)
+            self.handle_command(cmd, data)
             
             time.sleep(0.01)  # Small delay
 
@@ -4,6 +4,8 @@ This module provides a faster SHA-256 implementation than hashlib
 for MicroPython on RP2040.
 """
 
+import struct
+from array import array
 from typing import TYPE_CHECKING
 
 if TYPE_CHECKING:
@@ -15,6 +17,18 @@ if TYPE_CHECKING:
         time_module.ticks_ms = ticks_ms  # type: ignore
         time_module.ticks_diff = ticks_diff  # type: ignore
 
+# Use the inlined compression path (set False to debug with sha256_block)
+USE_INLINE = True
+
+# Compile hot functions to machine code when running on MicroPython
+try:
+    import micropython  # type: ignore
+    native = micropython.native
+except (ImportError, AttributeError):
+    def native(f):  # type: ignore
+        """No-op decorator outside MicroPython"""
+        return f
+
 # SHA-256 constants
 K = (
     0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5,
@@ -82,6 +96,13 @@ def sigma1(x):
     return rotr(x, 17) ^ rotr(x, 19) ^ shr(x, 10)
 
 
+# Preallocated buffers reused by every call so hashing does not churn the
+# heap (the module-level functions are not reentrant across threads)
+_W = array('I', [0] * 64)
+_STATE = array('I', H0)
+_PAD = bytearray(128)
+
+
 def sha256_block(block, h):
     """
     Process a single 512-bit (64-byte) block
@@ -90,7 +111,7 @@ def sha256_block(block, h):
     Returns: new h tuple
     """
     # Message schedule
-    w = [0] * 64
+    w = _W
     
     # First 16 words are the block bytes
     for i in range(16):
@@ -124,8 +145,127 @@ def sha256_block(block, h):
         a = (temp1 + temp2) & 0xffffffff
     
     # Add compressed chunk to current hash value
-    return tuple((h[i] + v) & 0xffffffff for i, v in 
-                 enumerate([a, b, c, d, e, f, g, h_val]))
+    return ((h[0] + a) & 0xffffffff, (h[1] + b) & 0xffffffff,
+            (h[2] + c) & 0xffffffff, (h[3] + d) & 0xffffffff,
+            (h[4] + e) & 0xffffffff, (h[5] + f) & 0xffffffff,
+            (h[6] + g) & 0xffffffff, (h[7] + h_val) & 0xffffffff)
+
+
+def sha256_block_reference_into(state, block, offset=0):
+    """
+    In-place adapter around sha256_block() with the same interface as
+    sha256_block_into(), used when the inlined path is disabled
+    """
+    h = sha256_block(block[offset:offset + 64], state)
+    for i in range(8):
+        state[i] = h[i]
+
+
+@native
+def sha256_block_into(state, block, offset=0):
+    """
+    Process a single 512-bit (64-byte) block with all primitives inlined
+    state: array('I') of 8 hash values, updated in place
+    block: bytes, bytearray or memoryview holding the block at offset
+    
+    Same result as sha256_block(), but without a Python function call
+    per rotation/round function (which dominates the cost of
+    sha256_block() under MicroPython) and without allocating a schedule,
+    slices or a result tuple.
+    """
+    k = K
+    w = _W
+    j = offset
+    for i in range(16):
+        w[i] = ((block[j] << 24) | (block[j + 1] << 16) |
+                (block[j + 2] << 8) | block[j + 3])
+        j += 4
+    for i in range(16, 64):
+        x = w[i-15]
+        y = w[i-2]
+        w[i] = (w[i-16] + (((x >> 7) | (x << 25)) ^ ((x >> 18) | (x << 14)) ^ (x >> 3)) +
+                w[i-7] + (((y >> 17) | (y << 15)) ^ ((y >> 19) | (y << 13)) ^ (y >> 10))) & 0xffffffff
+    
+    a = state[0]
+    b = state[1]
+    c = state[2]
+    d = state[3]
+    e = state[4]
+    f = state[5]
+    g = state[6]
+    h_val = state[7]
+    for i in range(64):
+        temp1 = (h_val + (((e >> 6) | (e << 26)) ^ ((e >> 11) | (e << 21)) ^
+                          ((e >> 25) | (e << 7))) +
+                 (g ^ (e & (f ^ g))) + k[i] + w[i]) & 0xffffffff
+        temp2 = ((((a >> 2) | (a << 30)) ^ ((a >> 13) | (a << 19)) ^
+                  ((a >> 22) | (a << 10))) + ((a & b) | (c & (a | b))))
+        h_val = g
+        g = f
+        f = e
+        e = (d + temp1) & 0xffffffff
+        d = c
+        c = b
+        b = a
+        a = (temp1 + temp2) & 0xffffffff
+    
+    state[0] = (state[0] + a) & 0xffffffff
+    state[1] = (state[1] + b) & 0xffffffff
+    state[2] = (state[2] + c) & 0xffffffff
+    state[3] = (state[3] + d) & 0xffffffff
+    state[4] = (state[4] + e) & 0xffffffff
+    state[5] = (state[5] + f) & 0xffffffff
+    state[6] = (state[6] + g) & 0xffffffff
+    state[7] = (state[7] + h_val) & 0xffffffff
+
+
+def _select_compress():
+    """
+    Pick the compression function used by the rest of the module
+    The inlined path is used when USE_INLINE is set and it reproduces
+    hashlib bit-for-bit on a test block; otherwise the reference
+    sha256_block() is used.
+    """
+    if not USE_INLINE:
+        return sha256_block_reference_into
+    try:
+        import hashlib
+        block = bytes(range(64))
+        expected = hashlib.sha256(block).digest()
+    except (ImportError, AttributeError):
+        return sha256_block_into
+    # One block of data followed by the padding block for 512 bits
+    state = array('I', H0)
+    sha256_block_into(state, block)
+    sha256_block_into(state, b'\x80' + b'\x00' * 61 + b'\x02\x00')
+    if struct.pack('>8I', *state) == expected:
+        return sha256_block_into
+    print("Inline SHA-256 self-test failed, using reference path")
+    return sha256_block_reference_into
+
+
+# Compression function selected at import: compress(state, block, offset)
+compress = _select_compress()
+
+
+def _finish(state, tail, rem, msg_len):
+    """
+    Pad and compress the trailing partial block of a message
+    state: array('I') updated in place
+    tail: buffer whose first rem bytes are the unprocessed message bytes
+    msg_len: total message length in bytes
+    """
+    pad = _PAD
+    if rem:
+        pad[0:rem] = tail[0:rem]
+    pad[rem] = 0x80
+    total = 64 if rem < 56 else 128
+    for i in range(rem + 1, total - 8):
+        pad[i] = 0
+    struct.pack_into('>Q', pad, total - 8, msg_len * 8)
+    compress(state, pad, 0)
+    if total == 128:
+        compress(state, pad, 64)
 
 
 def sha256(data):
@@ -134,25 +274,21 @@ def sha256(data):
     data: bytes object
     Returns: bytes object (32 bytes)
     """
-    # Pre-processing: padding
-    msg_len = len(data)
-    data += b'\x80'  # Append bit '1' to message
+    state = _STATE
+    for i in range(8):
+        state[i] = H0[i]
     
-    # Pad with zeros until length is 448 mod 512 (56 mod 64)
-    while len(data) % 64 != 56:
-        data += b'\x00'
-    
-    # Append length in bits as 64-bit big-endian integer
-    data += (msg_len * 8).to_bytes(8, 'big')
+    # Process complete 512-bit (64-byte) chunks straight from the input
+    msg_len = len(data)
+    full = msg_len - (msg_len % 64)
+    for offset in range(0, full, 64):
+        compress(state, data, offset)
     
-    # Process message in 512-bit (64-byte) chunks
-    h = H0
-    for i in range(0, len(data), 64):
-        block = data[i:i+64]
-        h = sha256_block(block, h)
+    # Pad the remainder in the preallocated buffer
+    _finish(state, memoryview(data)[full:], msg_len - full, msg_len)
     
     # Produce final hash value (big-endian)
-    return b''.join(x.to_bytes(4, 'big') for x in h)
+    return struct.pack('>8I', *state)
 
 
 def double_sha256(data):
@@ -163,6 +299,270 @@ def double_sha256(data):
     return sha256(sha256(data))
 
 
+# Padding for the second block of an 80-byte header: the 16-byte tail is
+# followed by a '1' bit, zeros and the message length (640 bits)
+HEADER_TAIL_PADDING = b'\x80' + b'\x00' * 39 + (640).to_bytes(8, 'big')
+
+# Padding for the second pass of double SHA-256 (a 32-byte digest)
+DIGEST_PADDING = b'\x80' + b'\x00' * 23 + (256).to_bytes(8, 'big')
+
+# Second-block buffers with their padding filled in once
+_TAIL_BLOCK = bytearray(16) + HEADER_TAIL_PADDING
+_DIGEST_BLOCK = bytearray(32) + DIGEST_PADDING
+
+
+def midstate(header):
+    """
+    Compute the SHA-256 state after the first 64 bytes of a block header
+    header: bytes object of at least 64 bytes (usually the 80-byte header)
+    Returns: tuple of 8 uint32 hash values
+
+    The first block (version, previous hash and most of the merkle root)
+    does not change while scanning nonces, so it only needs to be
+    compressed once per job.
+    """
+    state = array('I', H0)
+    compress(state, header, 0)
+    return tuple(state)
+
+
+def double_sha256_midstate(state, tail):
+    """
+    Finish double SHA-256 of an 80-byte header from its midstate
+    state: tuple returned by midstate()
+    tail: last 16 bytes of the header (merkle tail, time, bits, nonce)
+    Returns: bytes object (32 bytes), same as double_sha256(header)
+    """
+    h = _STATE
+    for i in range(8):
+        h[i] = state[i]
+    _TAIL_BLOCK[0:16] = tail
+    compress(h, _TAIL_BLOCK, 0)
+    struct.pack_into('>8I', _DIGEST_BLOCK, 0, *h)
+    for i in range(8):
+        h[i] = H0[i]
+    compress(h, _DIGEST_BLOCK, 0)
+    return struct.pack('>8I', *h)
+
+
+class NonceScanner:
+    """
+    Nonce-scan kernel for a single 80-byte block header
+    Usage:
+        scanner = NonceScanner(header, target_int)
+        hits, hashed = scanner.scan(start_nonce, count)
+        digest = scanner.check(nonce)  # None unless hash < target
+
+    Everything that does not depend on the nonce is computed once here:
+    - the midstate of the first header block
+    - rounds 0-2 of the second block (the nonce is word 3)
+    - schedule words 16-17 and the constant parts of words 18-19
+    - the padding words of both second-block and outer-hash schedules
+    """
+    
+    def __init__(self, header, target):
+        """
+        header: bytes object of at least 76 bytes (nonce bytes are ignored)
+        target: target as integer
+        """
+        self.target = target
+        # Header buffer that receives winning nonces in place
+        self.header = bytearray(80)
+        self.header[0:76] = header[0:76]
+        # Highest 32 bits of the target, compared against the final word
+        self.target_top = target >> 224
+        
+        state = midstate(header)
+        self.state = state
+        
+        # Second header block: tail words, nonce, fixed padding
+        w = [0] * 64
+        for i in range(3):
+            w[i] = int.from_bytes(header[64 + i*4:68 + i*4], 'big')
+        w[4] = 0x80000000
+        w[15] = 640
+        w[16] = (w[0] + sigma0(w[1])) & 0xffffffff
+        w[17] = (w[1] + sigma0(w[2]) + sigma1(w[15])) & 0xffffffff
+        self.w = w
+        # w[18] = c18 + sigma0(w[3]), w[19] = c19 + w[3]
+        self.c18 = (w[2] + sigma1(w[16])) & 0xffffffff
+        self.c19 = (sigma0(w[4]) + sigma1(w[17])) & 0xffffffff
+        
+        # Rounds 0-2 only see the tail words, run them once
+        a, b, c, d, e, f, g, h = state
+        for i in range(3):
+            temp1 = (h + sum1(e) + ch(e, f, g) + K[i] + w[i]) & 0xffffffff
+            temp2 = (sum0(a) + maj(a, b, c)) & 0xffffffff
+            h = g
+            g = f
+            f = e
+            e = (d + temp1) & 0xffffffff
+            d = c
+            c = b
+            b = a
+            a = (temp1 + temp2) & 0xffffffff
+        self.round3 = (a, b, c, d, e, f, g, h)
+        # Round 3 without its message word
+        self.t1_base = (h + sum1(e) + ch(e, f, g) + K[3]) & 0xffffffff
+        self.t2_round3 = (sum0(a) + maj(a, b, c)) & 0xffffffff
+        
+        # Outer hash of the 32-byte digest: words 8-15 are fixed padding
+        w2 = [0] * 64
+        w2[8] = 0x80000000
+        w2[15] = 256
+        self.w2 = w2
+    
+    def check(self, nonce):
+        """
+        Hash the header with the given nonce
+        Returns: 32-byte double SHA-256 digest if it meets the target,
+        otherwise None
+        """
+        hits, _ = self.scan(nonce, 1)
+        return hits[0][1] if hits else None
+    
+    @native
+    def scan(self, start_nonce, count):
+        """
+        Hash count consecutive nonces starting at start_nonce
+        Returns: (hits, hashed) where hits is a list of (nonce, digest)
+        for every hash below the target and hashed is the number of
+        nonces processed (count, clipped at the end of the nonce space)
+        
+        The winning nonce is also written into self.header, so after a
+        hit it holds the full 80-byte solved header.
+        """
+        end_nonce = min(start_nonce + count, 0x100000000)
+        hits = []
+        k = K
+        w = self.w
+        w2 = self.w2
+        s0, s1, s2, s3, s4, s5, s6, s7 = self.state
+        r3a, r3b, r3c, r3d, r3e, r3f, r3g = self.round3[:7]
+        t1_base = self.t1_base
+        t2_round3 = self.t2_round3
+        c18 = self.c18
+        c19 = self.c19
+        target_top = self.target_top
+        iv7 = H0[7]
+        
+        for nonce in range(start_nonce, end_nonce):
+            nonce_word = (((nonce & 0xff) << 24) | ((nonce & 0xff00) << 8) |
+                          ((nonce >> 8) & 0xff00) | (nonce >> 24))
+            w[3] = nonce_word
+            w[18] = (c18 + (((nonce_word >> 7) | (nonce_word << 25)) ^
+                            ((nonce_word >> 18) | (nonce_word << 14)) ^
+                            (nonce_word >> 3))) & 0xffffffff
+            w[19] = (c19 + nonce_word) & 0xffffffff
+            for i in range(20, 64):
+                x = w[i-15]
+                y = w[i-2]
+                w[i] = (w[i-16] + (((x >> 7) | (x << 25)) ^ ((x >> 18) | (x << 14)) ^ (x >> 3)) +
+                        w[i-7] + (((y >> 17) | (y << 15)) ^ ((y >> 19) | (y << 13)) ^ (y >> 10))) & 0xffffffff
+            
+            # Round 3 from the precomputed partial sums, then rounds 4-63
+            temp1 = (t1_base + nonce_word) & 0xffffffff
+            h = r3g
+            g = r3f
+            f = r3e
+            e = (r3d + temp1) & 0xffffffff
+            d = r3c
+            c = r3b
+            b = r3a
+            a = (temp1 + t2_round3) & 0xffffffff
+            for i in range(4, 64):
+                temp1 = (h + (((e >> 6) | (e << 26)) ^ ((e >> 11) | (e << 21)) ^
+                                  ((e >> 25) | (e << 7))) +
+                         (g ^ (e & (f ^ g))) + k[i] + w[i]) & 0xffffffff
+                temp2 = ((((a >> 2) | (a << 30)) ^ ((a >> 13) | (a << 19)) ^
+                          ((a >> 22) | (a << 10))) + ((a & b) | (c & (a | b))))
+                h = g
+                g = f
+                f = e
+                e = (d + temp1) & 0xffffffff
+                d = c
+                c = b
+                b = a
+                a = (temp1 + temp2) & 0xffffffff
+            
+            # First hash feeds the outer hash directly as message words
+            w2[0] = (s0 + a) & 0xffffffff
+            w2[1] = (s1 + b) & 0xffffffff
+            w2[2] = (s2 + c) & 0xffffffff
+            w2[3] = (s3 + d) & 0xffffffff
+            w2[4] = (s4 + e) & 0xffffffff
+            w2[5] = (s5 + f) & 0xffffffff
+            w2[6] = (s6 + g) & 0xffffffff
+            w2[7] = (s7 + h) & 0xffffffff
+            for i in range(16, 64):
+                x = w2[i-15]
+                y = w2[i-2]
+                w2[i] = (w2[i-16] + (((x >> 7) | (x << 25)) ^ ((x >> 18) | (x << 14)) ^ (x >> 3)) +
+                        w2[i-7] + (((y >> 17) | (y << 15)) ^ ((y >> 19) | (y << 13)) ^ (y >> 10))) & 0xffffffff
+            
+            # The last word of the final state is settled after round 60
+            # (it is e shifted through f, g and h), so most nonces stop here
+            a, b, c, d, e, f, g, h = H0
+            for i in range(61):
+                temp1 = (h + (((e >> 6) | (e << 26)) ^ ((e >> 11) | (e << 21)) ^
+                                  ((e >> 25) | (e << 7))) +
+                         (g ^ (e & (f ^ g))) + k[i] + w2[i]) & 0xffffffff
+                temp2 = ((((a >> 2) | (a << 30)) ^ ((a >> 13) | (a << 19)) ^
+                          ((a >> 22) | (a << 10))) + ((a & b) | (c & (a | b))))
+                h = g
+                g = f
+                f = e
+                e = (d + temp1) & 0xffffffff
+                d = c
+                c = b
+                b = a
+                a = (temp1 + temp2) & 0xffffffff
+            top = (iv7 + e) & 0xffffffff
+            top = (((top & 0xff) << 24) | ((top & 0xff00) << 8) |
+                   ((top >> 8) & 0xff00) | (top >> 24))
+            if top > target_top:
+                continue
+            
+            for i in range(61, 64):
+                temp1 = (h + (((e >> 6) | (e << 26)) ^ ((e >> 11) | (e << 21)) ^
+                                  ((e >> 25) | (e << 7))) +
+                         (g ^ (e & (f ^ g))) + k[i] + w2[i]) & 0xffffffff
+                temp2 = ((((a >> 2) | (a << 30)) ^ ((a >> 13) | (a << 19)) ^
+                          ((a >> 22) | (a << 10))) + ((a & b) | (c & (a | b))))
+                h = g
+                g = f
+                f = e
+                e = (d + temp1) & 0xffffffff
+                d = c
+                c = b
+                b = a
+                a = (temp1 + temp2) & 0xffffffff
+            
+            digest = struct.pack('>8I', (H0[0] + a) & 0xffffffff,
+                                 (H0[1] + b) & 0xffffffff, (H0[2] + c) & 0xffffffff,
+                                 (H0[3] + d) & 0xffffffff, (H0[4] + e) & 0xffffffff,
+                                 (H0[5] + f) & 0xffffffff, (H0[6] + g) & 0xffffffff,
+                                 (H0[7] + h) & 0xffffffff)
+            if int.from_bytes(digest[::-1], 'big') < self.target:
+                struct.pack_into('<I', self.header, 76, nonce)
+                hits.append((nonce, digest))
+        
+        return hits, end_nonce - start_nonce
+
+
+def scan(header, target, start_nonce, count):
+    """
+    Scan a nonce range of an 80-byte header in one call
+    header: bytes object of at least 76 bytes
+    target: target as integer
+    Returns: (hits, hashed), see NonceScanner.scan()
+    
+    Builds a NonceScanner for the header, so callers scanning one job in
+    several slices should keep their own scanner instead.
+    """
+    return NonceScanner(header, target).scan(start_nonce, count)
+
+
 class SHA256:
     """
     SHA-256 hasher class compatible with hashlib interface
@@ -170,46 +570,56 @@ class SHA256:
         h = SHA256()
         h.update(data)
         digest = h.digest()
+    
+    Complete blocks are compressed straight from the caller's data; only
+    a partial block is kept in a fixed 64-byte buffer, so update() is
+    linear in the input size.
     """
     
     def __init__(self, data=None):
         """Initialize with optional data"""
-        self.h = H0
-        self.buffer = b''
+        self.h = array('I', H0)
+        self.buffer = bytearray(64)
+        self.buffered = 0
         self.msg_len = 0
         if data:
             self.update(data)
     
     def update(self, data):
         """Update hash with new data"""
-        self.msg_len += len(data)
-        self.buffer += data
+        data = memoryview(data)
+        length = len(data)
+        self.msg_len += length
+        offset = 0
+        
+        # Top up a partially filled block first
+        if self.buffered:
+            take = min(64 - self.buffered, length)
+            self.buffer[self.buffered:self.buffered + take] = data[0:take]
+            self.buffered += take
+            offset = take
+            if self.buffered < 64:
+                return
+            compress(self.h, self.buffer, 0)
+            self.buffered = 0
         
-        # Process complete blocks
-        while len(self.buffer) >= 64:
-            block = self.buffer[:64]
-            self.buffer = self.buffer[64:]
-            self.h = sha256_block(block, self.h)
+        # Process complete blocks in place
+        while length - offset >= 64:
+            compress(self.h, data, offset)
+            offset += 64
+        
+        # Keep the remainder for the next call
+        rem = length - offset
+        if rem:
+            self.buffer[0:rem] = data[offset:length]
+            self.buffered = rem
     
     def digest(self):
         """Return the digest of the data"""
-        # Create a copy of current state for final processing
-        final_buffer = self.buffer + b'\x80'
-        
-        # Pad to 56 bytes (448 bits)
-        while len(final_buffer) % 64 != 56:
-            final_buffer += b'\x00'
-        
-        # Append length
-        final_buffer += (self.msg_len * 8).to_bytes(8, 'big')
-        
-        # Process final blocks
-        h = self.h
-        for i in range(0, len(final_buffer), 64):
-            block = final_buffer[i:i+64]
-            h = sha256_block(block, h)
-        
-        return b''.join(x.to_bytes(4, 'big') for x in h)
+        # Finish on a copy of the state so update() can continue
+        h = array('I', self.h)
+        _finish(h, self.buffer, self.buffered, self.msg_len)
+        return struct.pack('>8I', *h)
     
     def hexdigest(self):
         """Return hex string of digest"""
@@ -250,6 +660,10 @@ if __name__ == '__main__':
     bitcoin_hash = double_sha256(block_header)
     print("Double SHA-256:", bitcoin_hash.hex())
     
+    # Midstate path must match the full double SHA-256
+    state = midstate(block_header)
+    assert double_sha256_midstate(state, block_header[64:]) == bitcoin_hash
+    
     # Benchmark
     print("Running benchmark...")
     hps = benchmark(100)
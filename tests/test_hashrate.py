@@ -0,0 +1,61 @@
+"""
+Tests for the hashrate meters
+"""
+
+import pytest
+
+from controller.hashrate import HashrateMeter, target_hashes
+
+
+def test_ewma_starts_at_first_sample_and_tracks_changes():
+    """Test the first sample sets the rate and later ones move it by time weight"""
+    meter = HashrateMeter(half_life=10.0)
+    
+    meter.record(500, 5.0, now=5.0)
+    assert meter.rate == 100.0
+    
+    # A sample covering one half-life moves the EWMA halfway
+    meter.record(3000, 10.0, now=15.0)
+    assert meter.rate == pytest.approx(200.0)
+
+
+def test_window_rate_forgets_old_buckets():
+    """Test the fixed window only counts recent hashes"""
+    meter = HashrateMeter(window=60.0, buckets=12)
+    
+    for second in range(5, 65, 5):
+        meter.record(500, 5.0, now=float(second))
+    assert meter.window_rate(60.0) == pytest.approx(100.0)
+    
+    # Silent for a full window: nothing left to count
+    assert meter.window_rate(130.0) == 0.0
+
+
+def test_group_meters_sum_their_members():
+    """Test worker rates roll up into bank and fleet meters"""
+    fleet = HashrateMeter()
+    bank = HashrateMeter(parent=fleet)
+    first, second = HashrateMeter(parent=bank), HashrateMeter()
+    second.record(400, 5.0, now=5.0)
+    second.attach(bank)
+    
+    first.record(500, 5.0, now=5.0)
+    assert bank.rate == fleet.rate == 180.0
+    assert fleet.total_hashes == 500
+    assert fleet.window_rate(5.0) == pytest.approx(100.0)
+    
+    second.clear()
+    assert fleet.rate == pytest.approx(100.0)
+
+
+def test_share_rate_from_target():
+    """Test verified shares give an independent hashrate estimate"""
+    target = '0000ffff' + 'f' * 56
+    meter = HashrateMeter()
+    meter.record(0, 0.0, now=0.0)
+    
+    meter.record_share(target)
+    meter.record_share(target)
+    
+    assert target_hashes(target) == pytest.approx(65536.0)
+    assert meter.share_rate(1024.0) == pytest.approx(128.0)
@@ -13,29 +13,223 @@ class MockWorker:
         self.worker_id = worker_id
         self.is_connected = True
         self.hashrate = 75.0
+        self.active_work = None
+        self.queued_work = None
+        self.last_nonce = None
         
     async def send_work(self, work_packet):
         await asyncio.sleep(0.01)
+        self.active_work = work_packet
+        self.queued_work = None
         return True
+    
+    async def queue_work(self, work_packet):
+        self.queued_work = work_packet
+        return True
+    
+    @property
+    def needs_prefetch(self):
+        return self.active_work is not None and self.queued_work is None
+
+
+WORK = {
+    'block_header': 'a' * 152,
+    'target': '0000ffff' + 'f' * 56,
+    'timestamp': '2025-01-01T00:00:00',
+    'job_id': 'job1'
+}
+
+
+def finish_active(worker, hashes=None):
+    """Simulate the Pico's RESULT for its active lease"""
+    active = worker.active_work
+    message = {
+        'type': 'RESULT',
+        'valid': False,
+        'lease': active['lease'],
+        'hashes': active['end_nonce'] - active['start_nonce'] if hashes is None else hashes
+    }
+    worker.active_work, worker.queued_work = worker.queued_work, None
+    return message
 
 
 @pytest.mark.asyncio
 async def test_distribute_work():
-    """Test work distribution across workers"""
+    """Test every worker gets a lease to mine and one queued, without overlap"""
     coordinator = MiningCoordinator()
     workers = [MockWorker(i) for i in range(4)]
     
-    work = {
-        'block_header': 'a' * 152,
-        'target': '0000ffff' + 'f' * 56,
-        'timestamp': '2025-01-01T00:00:00'
-    }
+    await coordinator.distribute_work(WORK, workers)
+    
+    spans = sorted((w.active_work['start_nonce'], w.active_work['end_nonce']) for w in workers)
+    spans += sorted((w.queued_work['start_nonce'], w.queued_work['end_nonce']) for w in workers)
+    spans.sort()
+    assert spans[0][0] == 0
+    assert all(a[1] == b[0] for a, b in zip(spans, spans[1:]))
+    assert len(coordinator.scheduler.leases) == 8
+
+
+@pytest.mark.asyncio
+async def test_leases_are_time_sized():
+    """Test lease size follows worker hashrate instead of worker count"""
+    coordinator = MiningCoordinator(lease_seconds=30)
+    fast, unknown = MockWorker(0), MockWorker(1)
+    fast.hashrate = 200.0
+    unknown.hashrate = 0
+    
+    await coordinator.distribute_work(WORK, [fast, unknown])
+    
+    assert fast.active_work['end_nonce'] - fast.active_work['start_nonce'] == 6000
+    # No measurement yet: assumed to match the rest of the fleet
+    assert unknown.active_work['end_nonce'] - unknown.active_work['start_nonce'] == 6000
+    assert fast.active_work['lease'] != fast.queued_work['lease']
+
+
+@pytest.mark.asyncio
+async def test_leases_weighted_by_calibrated_hashrate():
+    """Test BENCH calibration sizes leases until live PROGRESS arrives"""
+    coordinator = MiningCoordinator(lease_seconds=10)
+    stock, overclocked = MockWorker(0), MockWorker(1)
+    stock.hashrate = overclocked.hashrate = 0
+    stock.calibrated_hashrate = 100.0
+    overclocked.calibrated_hashrate = 150.0
+    
+    await coordinator.distribute_work(WORK, [stock, overclocked])
+    
+    sizes = [w.active_work['end_nonce'] - w.active_work['start_nonce'] for w in (stock, overclocked)]
+    assert sizes == [1000, 1500]
+    
+    # Live measurement takes over from the calibration
+    overclocked.hashrate = 120.0
+    assert coordinator.worker_rate(overclocked) == 120.0
+    
+    # Same expected finishing time for both boards
+    assert sizes[0] / 100.0 == sizes[1] / 150.0
+
+
+@pytest.mark.asyncio
+async def test_result_covers_scanned_nonces_and_refills():
+    """Test a RESULT that stopped early returns the rest of its lease"""
+    coordinator = MiningCoordinator(lease_seconds=10)
+    worker = MockWorker(0)
+    await coordinator.distribute_work(WORK, [worker])
+    first = worker.active_work
+    
+    # A share ended the lease after 512 nonces
+    await coordinator.handle_message(worker, finish_active(worker, hashes=512))
+    
+    coverage = coordinator.scheduler.get_coverage()
+    assert coverage['hashed'] == 512
+    # The unscanned tail is leased out again (lowest nonces first)
+    assert worker.queued_work['start_nonce'] == 512
+    assert worker.queued_work['end_nonce'] == first['end_nonce']
+
+
+@pytest.mark.asyncio
+async def test_expired_leases_are_reissued():
+    """Test a silent worker's leases go to the next idle worker"""
+    coordinator = MiningCoordinator(lease_seconds=10)
+    silent, idle = MockWorker(0), MockWorker(1)
+    await coordinator.distribute_work(WORK, [silent])
+    coordinator.workers[idle.worker_id] = idle
+    
+    for lease in coordinator.scheduler.leases.values():
+        lease.deadline = 0
+    silent.is_connected = False
+    await coordinator.reissue_expired()
+    
+    assert idle.active_work['start_nonce'] == 0
+    assert coordinator.scheduler.get_coverage()['duplicates'] == 0
+
+
+@pytest.mark.asyncio
+async def test_idle_worker_steals_queued_lease():
+    """Test work stealing splits a busy worker's unstarted lease"""
+    coordinator = MiningCoordinator(lease_seconds=10, min_lease=16)
+    slow, fast = MockWorker(0), MockWorker(1)
+    slow.hashrate = 10.0
+    await coordinator.distribute_work(WORK, [slow])
+    queued = slow.queued_work
+    
+    # Pool is dry; the fast worker has nothing to do
+    coordinator.scheduler.free.ranges = []
+    coordinator.scheduler.free.total = 0
+    fast.hashrate = 20.0
+    assert await coordinator.add_worker(fast) is True
     
-    await coordinator.distribute_work(work, workers)
+    assert fast.active_work['end_nonce'] == queued['end_nonce']
+    assert slow.queued_work['start_nonce'] == queued['start_nonce']
+    assert slow.queued_work['end_nonce'] == fast.active_work['start_nonce']
+    assert queued['lease'] not in coordinator.scheduler.leases
+
+
+@pytest.mark.asyncio
+async def test_dry_pool_rolls_to_next_header():
+    """Test a used-up nonce space switches to a fresh header instead of stealing"""
+    headers = iter(['b' * 152, 'c' * 152])
+    coordinator = MiningCoordinator(lease_seconds=10, min_lease=16,
+                                    work_source=lambda: dict(WORK, block_header=next(headers)))
+    slow, fast = MockWorker(0), MockWorker(1)
+    await coordinator.distribute_work(WORK, [slow])
+    queued = slow.queued_work
     
-    assert len(coordinator.nonce_ranges) == 4
-    assert coordinator.nonce_ranges[0]['start'] == 0
-    assert coordinator.nonce_ranges[-1]['end'] == 2**32
+    coordinator.scheduler.free.ranges = []
+    coordinator.scheduler.free.total = 0
+    assert await coordinator.add_worker(fast) is True
+    
+    # The busy worker keeps its queue; the new one mines the next header
+    assert slow.queued_work is queued
+    assert fast.active_work['block_header'] == 'b' * 152
+    assert fast.active_work['start_nonce'] == 0
+    assert coordinator.lease_verifiers[queued['lease']][0].work is WORK
+
+
+@pytest.mark.asyncio
+async def test_release_worker_resumes_after_reconnect():
+    """Test that a dropped worker's unfinished nonces are mined on return"""
+    coordinator = MiningCoordinator(lease_seconds=100)
+    workers = [MockWorker(i) for i in range(2)]
+    await coordinator.distribute_work(WORK, workers)
+    start = workers[0].active_work['start_nonce']
+    
+    # Worker 0 got through part of its first lease before the USB drop
+    workers[0].last_nonce = start + 2000
+    released = coordinator.release_worker(workers[0])
+    
+    assert len(released) == 2
+    assert workers[0].active_work is None
+    assert coordinator.scheduler.get_coverage()['hashed'] == 2000 - 512
+    
+    workers[0].last_nonce = None
+    assert await coordinator.add_worker(workers[0]) is True
+    assert workers[0].active_work['start_nonce'] == start + 2000 - 512
+
+
+class SlowQueueWorker(MockWorker):
+    """Mock worker whose QUEUE write takes a while"""
+    
+    async def queue_work(self, work_packet):
+        await asyncio.sleep(0.05)
+        return await super().queue_work(work_packet)
+
+
+@pytest.mark.asyncio
+async def test_new_job_waits_for_prefetch_in_flight():
+    """Test a restart for a new job is not dropped while a refill is being written"""
+    coordinator = MiningCoordinator()
+    worker = SlowQueueWorker(0)
+    await coordinator.distribute_work(WORK, [worker])
+    
+    worker.queued_work = None
+    refill = asyncio.create_task(coordinator.refill_worker(worker))
+    await asyncio.sleep(0.01)
+    
+    new_job = dict(WORK, job_id='job2', block_header='b' * 152)
+    await coordinator.distribute_work(new_job, [worker])
+    await refill
+    
+    assert worker.active_work['block_header'] == new_job['block_header']
+    assert worker.queued_work['block_header'] == new_job['block_header']
 
 
 @pytest.mark.asyncio
@@ -43,15 +237,140 @@ async def test_distribute_work_no_workers():
     """Test work distribution with no workers"""
     coordinator = MiningCoordinator()
     
-    work = {
-        'block_header': 'a' * 152,
-        'target': '0000ffff' + 'f' * 56,
-        'timestamp': '2025-01-01T00:00:00'
-    }
+    await coordinator.distribute_work(WORK, [])
+    
+    assert coordinator.scheduler is None
+
+
+@pytest.mark.asyncio
+async def test_process_messages_submits_shares_immediately():
+    """Test valid RESULTs are verified and forwarded as soon as they arrive"""
+    coordinator = MiningCoordinator()
+    worker = MockWorker(0)
+    easy = dict(WORK, target='f' * 64)
+    await coordinator.distribute_work(easy, [worker])
+    submitted = asyncio.Queue()
+    
+    consumer = asyncio.ensure_future(coordinator.process_messages(submitted.put))
+    try:
+        share_nonce = worker.active_work['start_nonce'] + 1
+        message = finish_active(worker)
+        message.update(valid=True, nonce=share_nonce)
+        coordinator.post_message(worker, message)
+        result = await asyncio.wait_for(submitted.get(), 1)
+    finally:
+        consumer.cancel()
+    
+    assert result['valid'] and result['worker_id'] == 0
+    assert result['job_id'] == 'job1'
+    assert result['nonce'] == share_nonce
+    assert coordinator.shares_found == 1
+
+
+@pytest.mark.asyncio
+async def test_process_messages_drops_invalid_shares():
+    """Test a share that does not meet the target is not submitted"""
+    coordinator = MiningCoordinator()
+    worker = MockWorker(0)
+    await coordinator.distribute_work(dict(WORK, target='0' * 64), [worker])
+    submitted = []
+    
+    async def submit(share):
+        submitted.append(share)
+    
+    consumer = asyncio.ensure_future(coordinator.process_messages(submit))
+    try:
+        message = finish_active(worker)
+        message.update(valid=True, nonce=5)
+        coordinator.post_message(worker, message)
+        await asyncio.wait_for(coordinator.inbox.join(), 1)
+    finally:
+        consumer.cancel()
+    
+    assert submitted == []
+    assert coordinator.shares_invalid == 1
+    # The lease is still accounted for
+    assert coordinator.scheduler.done.total > 0
+
+
+@pytest.mark.asyncio
+async def test_check_shares_rejects_out_of_range_and_duplicates():
+    """Test shares outside their lease or repeated are not submitted"""
+    coordinator = MiningCoordinator()
+    worker = MockWorker(0)
+    await coordinator.distribute_work(dict(WORK, target='f' * 64), [worker])
+    active = worker.active_work
+    
+    def result(nonce):
+        return (worker, {'type': 'RESULT', 'valid': True, 'nonce': nonce, 'lease': active['lease']})
+    
+    shares = coordinator.check_shares([
+        result(active['start_nonce']),
+        result(active['start_nonce']),
+        result(active['end_nonce'])
+    ])
+    
+    assert [share['nonce'] for share in shares] == [active['start_nonce']]
+    assert coordinator.rejected == {'duplicate': 1, 'out of range': 1}
+    
+    # A reissued range finding the same share again is still a duplicate
+    assert coordinator.check_shares([result(active['start_nonce'])]) == []
+    assert coordinator.rejected['duplicate'] == 2
+
+
+@pytest.mark.asyncio
+async def test_share_messages_are_checked_like_results():
+    """Test a SHARE ahead of its RESULT is submitted without ending the lease"""
+    coordinator = MiningCoordinator()
+    worker = MockWorker(0)
+    await coordinator.distribute_work(dict(WORK, target='f' * 64), [worker])
+    active = worker.active_work
+    share = {'type': 'SHARE', 'valid': True, 'nonce': active['start_nonce'] + 1, 'lease': active['lease']}
+    
+    assert [s['nonce'] for s in coordinator.check_shares([(worker, share)])] == [share['nonce']]
+    await coordinator.handle_message(worker, share)
+    assert active['lease'] in coordinator.scheduler.leases
+    assert worker.active_work is active
+
+
+@pytest.mark.asyncio
+async def test_check_shares_uses_rolled_ntime():
+    """Test a share mined at a rolled ntime is checked and submitted with it"""
+    coordinator = MiningCoordinator(ntime_roll=10)
+    worker = MockWorker(0)
+    await coordinator.distribute_work(dict(WORK, target='f' * 64, ntime='aaaaaaaa'), [worker])
+    active = worker.active_work
+    assert active['ntime_roll'] == 10
+    
+    def result(ntime):
+        return (worker, {'type': 'RESULT', 'valid': True, 'nonce': active['start_nonce'],
+                         'lease': active['lease'], 'ntime': ntime})
+    
+    shares = coordinator.check_shares([result('aaaaaaaa'), result('aaaaaab4'), result('aaaaaab5')])
+    
+    assert [share['ntime'] for share in shares] == ['aaaaaaaa', 'aaaaaab4']
+    assert shares[0]['hash'] != shares[1]['hash']
+    assert coordinator.rejected == {'ntime out of window': 1}
+
+
+@pytest.mark.asyncio
+async def test_check_shares_uses_rolled_version():
+    """Test leases carry the version mask and shares keep their rolled version"""
+    coordinator = MiningCoordinator()
+    worker = MockWorker(0)
+    await coordinator.distribute_work(dict(WORK, target='f' * 64, version_mask='1fffe000'), [worker])
+    active = worker.active_work
+    assert active['version_mask'] == 0x1fffe000
+    
+    def result(version):
+        return (worker, {'type': 'RESULT', 'valid': True, 'nonce': active['start_nonce'],
+                         'lease': active['lease'], 'version': version})
     
-    await coordinator.distribute_work(work, [])
+    shares = coordinator.check_shares([result('aaaaaaaa'), result('aaabaaaa'), result('aaabaaab')])
     
-    assert len(coordinator.nonce_ranges) == 0
+    assert [share['version'] for share in shares] == ['aaaaaaaa', 'aaabaaaa']
+    assert shares[0]['hash'] != shares[1]['hash']
+    assert coordinator.rejected == {'version outside mask': 1}
 
 
 def test_verify_nonce():
@@ -0,0 +1,100 @@
+"""
+Tests for the lease-based nonce scheduler
+"""
+
+from controller.nonce_scheduler import NONCE_SPACE, NonceScheduler, RangeSet
+
+
+def test_range_set_merges_and_counts_overlap():
+    """Test merging adjacent ranges and reporting overlap"""
+    ranges = RangeSet()
+    
+    assert ranges.add(0, 10) == 0
+    assert ranges.add(20, 30) == 0
+    assert ranges.add(10, 20) == 0
+    assert ranges.ranges == [[0, 30]]
+    assert ranges.add(25, 40) == 5
+    assert ranges.total == 40
+
+
+def test_range_set_take_from_front():
+    """Test taking values from the lowest range"""
+    ranges = RangeSet([(100, 150), (0, 10)])
+    
+    assert ranges.take(4) == (0, 4)
+    assert ranges.take(100) == (4, 10)
+    assert ranges.take(100) == (100, 150)
+    assert ranges.take(1) is None
+    assert ranges.total == 0
+
+
+def test_issue_and_complete_covers_space():
+    """Test that completed leases add up to the whole space without gaps"""
+    scheduler = NonceScheduler(lease_seconds=1, min_lease=1, max_lease=NONCE_SPACE // 4)
+    
+    leases = [scheduler.issue(i, NONCE_SPACE, 0.0) for i in range(5)]
+    
+    assert leases[-1] is None
+    for lease in leases[:-1]:
+        scheduler.complete(lease.lease_id, lease.size)
+    assert scheduler.exhausted
+    assert scheduler.get_coverage()['fraction'] == 1.0
+
+
+def test_late_result_of_expired_lease_counts_duplicates():
+    """Test that reissued work hashed twice shows up in coverage"""
+    scheduler = NonceScheduler(lease_seconds=1, min_lease=100, lease_timeout=5)
+    lost = scheduler.issue(0, 100.0, 0.0)
+    
+    assert scheduler.expire(10.0) == [lost]
+    again = scheduler.issue(1, 100.0, 10.0)
+    assert (again.start, again.end) == (lost.start, lost.end)
+    
+    scheduler.complete(again.lease_id, again.size)
+    # The original holder was only slow, not dead
+    scheduler.complete(lost.lease_id, lost.size)
+    assert scheduler.get_coverage()['duplicates'] == lost.size
+
+
+def test_release_worker_resumes_active_lease_only():
+    """Test the frontier only covers the active lease, not a queued one below it"""
+    scheduler = NonceScheduler(lease_seconds=1, min_lease=1000, max_lease=1000)
+    scheduler.issue(1, 1000.0, 0.0)
+    queued = scheduler.issue(0, 1000.0, 0.0)
+    active = scheduler.issue(0, 1000.0, 0.0)
+    assert (queued.start, active.start) == (1000, 2000)
+    
+    # Just started the active lease: the margin must not reach below it
+    scheduler.release_worker(0, active.lease_id, 2100 - 512)
+    assert scheduler.done.ranges == []
+    assert scheduler.free.ranges == [[1000, NONCE_SPACE]]
+    
+    queued = scheduler.issue(0, 1000.0, 0.0)
+    active = scheduler.issue(0, 1000.0, 0.0)
+    scheduler.release_worker(0, active.lease_id, 2700 - 512)
+    assert scheduler.done.ranges == [[2000, 2188]]
+    assert scheduler.free.ranges == [[1000, 2000], [2188, NONCE_SPACE]]
+
+
+def test_renew_keeps_loaded_leases_alive():
+    """Test that only leases the worker still holds are renewed"""
+    scheduler = NonceScheduler(lease_seconds=1, min_lease=100, lease_timeout=5)
+    held = scheduler.issue(0, 100.0, 0.0)
+    forgotten = scheduler.issue(0, 100.0, 0.0)
+    
+    scheduler.renew([held.lease_id], 4.0)
+    
+    assert scheduler.expire(6.0) == [forgotten]
+    assert held.lease_id in scheduler.leases
+
+
+def test_split_gives_thief_the_tail():
+    """Test splitting a lease between its holder and a thief"""
+    scheduler = NonceScheduler(lease_seconds=1, min_lease=10)
+    lease = scheduler.issue(0, 1000.0, 0.0)
+    
+    front, back = scheduler.split(lease.lease_id, 1, 300.0, 0.0)
+    
+    assert (front.worker_id, front.start, front.end) == (0, 0, 700)
+    assert (back.worker_id, back.start, back.end) == (1, 700, 1000)
+    assert lease.lease_id not in scheduler.leases
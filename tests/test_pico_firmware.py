@@ -0,0 +1,395 @@
+"""
+Tests for the Pico firmware mining loop
+"""
+
+import hashlib
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'pico_firmware'))
+
+import main as firmware  # noqa: E402
+
+
+class RecordingMiner(firmware.BitcoinMiner):
+    """Miner that records outgoing messages instead of writing to UART"""
+
+    def __init__(self, commands=None):
+        super().__init__()
+        # Fixed SCAN_SLICE slices keep hash counts per slice exact
+        self.slice_ms = 0
+        self.sent = []
+        self.commands = list(commands or [])
+
+    def send_message(self, message):
+        self.sent.append(message)
+
+    def read_command(self):
+        if self.commands:
+            return self.commands.pop(0)
+        return None, None
+
+
+def test_mine_block_reports_valid_share():
+    """Test that a hit is reported with the matching hash"""
+    miner = RecordingMiner()
+    header = os.urandom(80)
+
+    miner.mine_block(header.hex(), 'f' * 64, 10, 20)
+
+    result = miner.sent[-1]
+    full = header[:76] + (10).to_bytes(4, 'little')
+    assert result['type'] == 'RESULT'
+    assert result['valid'] is True
+    assert result['nonce'] == 10
+    assert result['hash'] == hashlib.sha256(hashlib.sha256(full).digest()).hexdigest()
+    assert miner.is_mining is False
+
+
+def test_every_hit_is_reported():
+    """Test hits beyond the lowest go out as SHAREs ahead of the RESULT"""
+    from controller.protocol import FrameDecoder
+
+    miner = RecordingMiner()
+    miner.worker_id = 2
+    miner.binary = True
+    header = os.urandom(80)
+
+    miner.mine_block(header.hex(), 'f' * 64, 10, 20)
+
+    # One slice scans all ten nonces, and every one meets this target
+    assert [m['type'] for m in miner.sent] == ['SHARE'] * 9 + ['RESULT']
+    assert [m['nonce'] for m in miner.sent] == list(range(11, 20)) + [10]
+    (share,) = FrameDecoder().feed(miner.encode_message(miner.sent[0]))
+    assert share['type'] == 'SHARE' and share['valid'] is True
+    assert (share['nonce'], share['worker_id']) == (11, 2)
+    assert share['hash'] == miner.sent[0]['hash']
+
+
+def test_mine_block_exhausts_range():
+    """Test that a range without hits ends with an invalid RESULT"""
+    miner = RecordingMiner()
+
+    miner.mine_block(os.urandom(80).hex(), '0' * 64, 0, firmware.SCAN_SLICE + 5)
+
+    result = miner.sent[-1]
+    assert result['type'] == 'RESULT'
+    assert result['valid'] is False
+    assert result['hashes'] == firmware.SCAN_SLICE + 5
+
+
+def test_mine_block_second_core_merges_counts():
+    """Test the two-core path (as threads on CPython) merges hash counts"""
+    miner = RecordingMiner()
+    miner.use_second_core = True
+
+    miner.mine_block(os.urandom(80).hex(), '0' * 64, 0, firmware.SCAN_SLICE * 6 + 3)
+
+    result = miner.sent[-1]
+    assert result['valid'] is False
+    assert result['hashes'] == firmware.SCAN_SLICE * 6 + 3
+    assert miner.core1_active is False
+
+
+def test_stop_interrupts_mining():
+    """Test that a STOP read between slices aborts the range"""
+    miner = RecordingMiner(commands=[('STOP', {})])
+
+    miner.mine_block(os.urandom(80).hex(), '0' * 64, 0, 2**32)
+
+    result = miner.sent[-1]
+    assert result['valid'] is False
+    assert result['aborted'] is True
+    assert result['hashes'] == firmware.SCAN_SLICE
+
+
+def test_new_work_preempts_current_range():
+    """Test that a WORK received while mining replaces the current job"""
+    new_work = {
+        'block_header': os.urandom(80).hex(),
+        'target': '0' * 64,
+        'start_nonce': 0,
+        'end_nonce': 10
+    }
+    miner = RecordingMiner(commands=[('WORK', new_work)])
+
+    miner.handle_work({
+        'block_header': os.urandom(80).hex(),
+        'target': '0' * 64,
+        'start_nonce': 0,
+        'end_nonce': 2**32
+    })
+
+    assert [m['aborted'] for m in miner.sent] == [True, False]
+    assert miner.current_work is new_work
+    assert miner.sent[-1]['hashes'] == 10
+
+
+def test_queued_work_starts_when_range_ends():
+    """Test that a QUEUE job runs right after the current range"""
+    queued = {
+        'block_header': os.urandom(80).hex(),
+        'target': '0' * 64,
+        'start_nonce': 100,
+        'end_nonce': 110,
+        'lease': 2
+    }
+    miner = RecordingMiner(commands=[('QUEUE', queued)])
+
+    miner.handle_work({
+        'block_header': os.urandom(80).hex(),
+        'target': '0' * 64,
+        'start_nonce': 0,
+        'end_nonce': firmware.SCAN_SLICE * 2,
+        'lease': 1
+    })
+
+    assert [m['aborted'] for m in miner.sent] == [False, False]
+    assert [m['lease'] for m in miner.sent] == [1, 2]
+    assert miner.sent[0]['hashes'] == firmware.SCAN_SLICE * 2
+    assert miner.current_work is queued
+    assert miner.next_work is None
+
+
+def test_exhausted_range_rolls_ntime():
+    """Test an idle Pico re-scans its range at later ntimes within the window"""
+    miner = RecordingMiner()
+    header = bytearray(os.urandom(80))
+    header[68:72] = (0x6553f100).to_bytes(4, 'little')
+
+    miner.mine_block(bytes(header).hex(), '0' * 64, 0, firmware.SCAN_SLICE, ntime_roll=2)
+
+    result = miner.sent[-1]
+    assert result['hashes'] == firmware.SCAN_SLICE * 3
+    assert result['ntime'] == '6553f102'
+    assert result['aborted'] is False
+
+
+def test_version_bits_roll_before_ntime():
+    """Test every permitted version is scanned before ntime moves on"""
+    miner = RecordingMiner()
+    header = bytearray(os.urandom(80))
+    header[0:4] = (0x20000000).to_bytes(4, 'little')
+    header[68:72] = (0x6553f100).to_bytes(4, 'little')
+
+    miner.mine_block(bytes(header).hex(), '0' * 64, 0, firmware.SCAN_SLICE, ntime_roll=1, version_mask=0x6000)
+
+    # 4 versions at each of 2 ntimes
+    result = miner.sent[-1]
+    assert result['hashes'] == firmware.SCAN_SLICE * 8
+    assert result['version'] == '20006000'
+    assert result['ntime'] == '6553f101'
+
+
+def test_queued_work_ends_ntime_rolling():
+    """Test that QUEUE work takes over from a rolled pass straight away"""
+    queued = {
+        'block_header': os.urandom(80).hex(),
+        'target': '0' * 64,
+        'start_nonce': 0,
+        'end_nonce': 10,
+        'lease': 2
+    }
+    header = bytearray(os.urandom(80))
+    header[68:72] = (0x6553f100).to_bytes(4, 'little')
+    miner = RecordingMiner(commands=[(None, None), (None, None), ('QUEUE', queued)])
+
+    miner.handle_work({
+        'block_header': bytes(header).hex(),
+        'target': '0' * 64,
+        'start_nonce': 0,
+        'end_nonce': firmware.SCAN_SLICE * 2,
+        'lease': 1,
+        'ntime_roll': 60
+    })
+
+    assert [m['lease'] for m in miner.sent] == [1, 2]
+    assert miner.sent[0]['hashes'] == firmware.SCAN_SLICE * 3
+    assert miner.sent[0]['ntime'] == '6553f101'
+    assert miner.sent[1]['hashes'] == 10
+
+
+def test_slices_are_sized_by_time(monkeypatch):
+    """Test slices shrink to slice_ms on a slow board and grow on a fast one"""
+    clock = [0]
+
+    def scan(start_nonce, count):
+        # 200 H/s per core
+        clock[0] += count * 5
+        return [], count
+
+    monkeypatch.setattr(firmware, 'ticks_ms', lambda: clock[0])
+    miner = firmware.BitcoinMiner()
+    miner.slice_ms = 50
+    miner.is_mining = True
+    miner.next_nonce, miner.end_nonce = 0, 2**32
+
+    miner.scan_slice(type('Scanner', (), {'scan': staticmethod(scan)}), miner.claim_slice())
+    assert miner.slice_size == 10
+    miner.fit_slice(10, 0)
+    assert miner.slice_size == 20
+
+
+def test_commands_drained_between_slices():
+    """Test a PING and a QUEUE that arrive together are both handled"""
+    queued = {
+        'block_header': os.urandom(80).hex(),
+        'target': '0' * 64,
+        'start_nonce': 0,
+        'end_nonce': 10,
+        'lease': 2
+    }
+    miner = RecordingMiner(commands=[('PING', {'seq': 4}), ('QUEUE', queued)])
+
+    miner.mine_block(os.urandom(80).hex(), '0' * 64, 0, firmware.SCAN_SLICE * 2)
+
+    assert miner.sent[0] == {'type': 'PONG', 'worker_id': None, 'seq': 4}
+    assert miner.next_work is queued
+
+
+def test_progress_is_time_based():
+    """Test that PROGRESS follows the HELLO interval, not hash counts"""
+    miner = RecordingMiner()
+    miner.handle_hello({'id': 3, 'progress_ms': 0})
+
+    miner.mine_block(os.urandom(80).hex(), '0' * 64, 0, firmware.SCAN_SLICE * 3)
+
+    progress = [m for m in miner.sent if m.get('type') == 'PROGRESS']
+    assert len(progress) == 3
+    assert progress[-1]['hashes'] == firmware.SCAN_SLICE * 3
+    assert all(m['delta'] == firmware.SCAN_SLICE for m in progress)
+    assert progress[0]['worker_id'] == 3
+
+
+def test_binary_work_frame_decodes_on_pico():
+    """Test a controller WORK frame parsed by the firmware"""
+    from controller.protocol import encode_command
+
+    miner = firmware.BitcoinMiner()
+    header = os.urandom(80)
+    miner.rx = encode_command('WORK', {
+        'block_header': header.hex(),
+        'target': '00ff' + 'f' * 60,
+        'start_nonce': 5,
+        'end_nonce': 2**32,
+        'lease': 12
+    }) + b'STOP:{}\n'
+
+    cmd, data = miner.next_command()
+    assert cmd == 'WORK'
+    assert data['block_header'] == header
+    assert data['target'] == int('00ff' + 'f' * 60, 16)
+    assert (data['start_nonce'], data['end_nonce']) == (5, 2**32)
+    assert data['lease'] == 12
+    assert miner.next_command() == ('STOP', {})
+    assert miner.next_command() == (None, None)
+
+
+def test_corrupt_frame_does_not_swallow_next_command():
+    """Test the firmware resyncs on the next frame after a damaged header"""
+    from controller.protocol import encode_command
+
+    miner = firmware.BitcoinMiner()
+    work = bytearray(encode_command('WORK', {
+        'block_header': os.urandom(80).hex(),
+        'target': 'f' * 64,
+        'start_nonce': 0,
+        'end_nonce': 10
+    }))
+    work[2] = 0x20
+    miner.rx = bytes(work) + encode_command('PING', {'seq': 5}) + b'STOP:{}\n'
+
+    assert miner.next_command() == ('PING', {'seq': 5})
+    assert miner.next_command() == ('STOP', {})
+    assert miner.next_command() == (None, None)
+
+
+def test_binary_result_frame_decodes_on_controller():
+    """Test a firmware RESULT frame parsed by the controller"""
+    from controller.protocol import FrameDecoder
+
+    miner = firmware.BitcoinMiner()
+    miner.handle_command('HELLO', {'id': 7, 'binary': True})
+    assert miner.binary is True
+
+    frame = miner.encode_message({
+        'type': 'RESULT',
+        'valid': True,
+        'nonce': 42,
+        'hash': 'ab' * 32,
+        'hashes': 1000,
+        'hashrate': 100.0,
+        'ms': 10000,
+        'worker_id': 7,
+        'lease': 31,
+        'ntime': '6553f100',
+        'version': '20006000'
+    })
+
+    (result,) = FrameDecoder().feed(frame)
+    assert result['valid'] is True
+    assert result['nonce'] == 42
+    assert result['hash'] == 'ab' * 32
+    assert result['hashrate'] == 100.0
+    assert result['worker_id'] == 7
+    assert result['lease'] == 31
+    assert result['ntime'] == '6553f100'
+    assert result['version'] == '20006000'
+
+
+def test_binary_progress_at_end_of_nonce_space():
+    """Test a PROGRESS frontier of 2**32 (end of the last lease) survives framing"""
+    from controller.protocol import FrameDecoder
+
+    miner = firmware.BitcoinMiner()
+    miner.handle_command('HELLO', {'id': 3, 'binary': True})
+
+    frame = miner.encode_message({'type': 'PROGRESS', 'hashes': 5000, 'delta': 500, 'ms': 5000, 'nonce': 2**32})
+
+    (progress,) = FrameDecoder().feed(frame)
+    assert progress['type'] == 'PROGRESS'
+    assert progress['worker_id'] == 3
+    assert progress['nonce'] == 2**32
+
+
+def test_ping_answered_between_slices():
+    """Test PING during mining gets a PONG before the range ends"""
+    miner = RecordingMiner(commands=[('PING', {'seq': 9})])
+    miner.worker_id = 2
+
+    miner.mine_block(os.urandom(80).hex(), '0' * 64, 0, firmware.SCAN_SLICE * 2)
+
+    assert miner.sent[0] == {'type': 'PONG', 'worker_id': 2, 'seq': 9}
+    assert miner.sent[-1]['type'] == 'RESULT'
+
+
+def test_binary_ping_pong_round_trip():
+    """Test PING frame decoded by the firmware and PONG frame by the controller"""
+    from controller.protocol import FrameDecoder, encode_command
+
+    miner = RecordingMiner()
+    miner.handle_command('HELLO', {'id': 5, 'binary': True})
+    miner.rx = encode_command('PING', {'seq': 77})
+
+    cmd, data = miner.next_command()
+    assert (cmd, data) == ('PING', {'seq': 77})
+
+    miner.handle_command(cmd, data)
+    frame = miner.encode_message(miner.sent[-1])
+    assert FrameDecoder().feed(frame) == [{'type': 'PONG', 'worker_id': 5, 'seq': 77}]
+
+
+def test_bench_reports_hashrate():
+    """Test BENCH hashes for the requested time and reports the rate"""
+    miner = RecordingMiner()
+    miner.worker_id = 3
+
+    miner.handle_command('BENCH', {'ms': 50})
+
+    report = miner.sent[-1]
+    assert report['type'] == 'BENCH'
+    assert report['worker_id'] == 3
+    assert report['hashes'] > 0
+    assert report['ms'] >= 50
+    assert report['cores'] in (1, 2)
+    assert not miner.is_mining
@@ -4,7 +4,10 @@ Tests for Pool Client
 
 import pytest
 import asyncio
+import struct
+from controller.fake_pool import FakePool
 from controller.pool_client import PoolClient
+from controller.stratum import StratumJob, build_header, header_hash_value
 import tempfile
 import json
 import os
@@ -101,3 +104,256 @@ def test_share_stats(temp_config):
     assert stats['accepted'] == 9
     assert stats['rejected'] == 1
     assert stats['acceptance_rate'] == 90.0
+
+
+def stratum_config(url):
+    """Config file pointing PoolClient at a Stratum server"""
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as f:
+        json.dump({'pool_url': url, 'username': 'wallet.rig1', 'password': 'x',
+                   'mining_mode': 'production'}, f)
+        return f.name
+
+
+def find_share(work, target, start=0):
+    """Nonce whose header hash meets target"""
+    header = bytes.fromhex(work['block_header'])
+    for nonce in range(start, start + 100000):
+        if header_hash_value(header[:76] + nonce.to_bytes(4, 'little')) <= int(target, 16):
+            return nonce
+    raise AssertionError("no share found")
+
+
+@pytest.mark.asyncio
+async def test_stratum_subscribe_authorize_and_notify():
+    """Test the Stratum handshake and header built from mining.notify"""
+    pool = FakePool(difficulty=2**-24)
+    await pool.start()
+    config_path = stratum_config(pool.url)
+    client = PoolClient(config_path, request_timeout=2.0)
+    try:
+        assert await client.connect() is True
+        work = await client.get_work()
+    finally:
+        await client.disconnect()
+        await pool.stop()
+        os.unlink(config_path)
+    
+    assert client.extranonce1 == '00000001'
+    assert client.difficulty == 2**-24
+    assert work['job_id'] == pool.job['job_id']
+    assert work['extranonce2'] == '00000000'
+    expected = build_header(pool.job, client.extranonce1, work['extranonce2'])
+    assert work['block_header'] == expected.hex()
+    assert int(work['target'], 16) == int(0xffff * 2**208 * 2**24)
+
+
+@pytest.mark.asyncio
+async def test_stratum_submit_accepted_and_rejected():
+    """Test mining.submit replies update the share counters"""
+    pool = FakePool(difficulty=2**-24)
+    await pool.start()
+    config_path = stratum_config(pool.url)
+    client = PoolClient(config_path, request_timeout=2.0)
+    credited = []
+    client.on_accepted = lambda share: credited.append(share['nonce'])
+    try:
+        await client.connect()
+        work = await client.get_work()
+        share = dict(work, nonce=find_share(work, work['target']))
+        
+        assert await client.submit_work(share) is True
+        # Same share twice, then one for a job the pool dropped
+        assert await client.submit_work(share) is False
+        pool.new_job(clean=True)
+        await asyncio.wait_for(client.new_job.wait(), 2)
+        assert await client.submit_work(dict(share, nonce=share['nonce'] + 1)) is False
+    finally:
+        await client.disconnect()
+        await pool.stop()
+        os.unlink(config_path)
+    
+    assert client.get_share_stats()['accepted'] == 1
+    assert client.shares_rejected == 2
+    assert len(pool.accepted) == 1
+    # Only the accepted share is credited
+    assert credited == [share['nonce']]
+    assert client.job.job_id == pool.job['job_id']
+
+
+def test_stratum_job_headers_match_build_header():
+    """Test the per-job header factory against the reference builder"""
+    job = FakePool().new_job(announce=False)
+    factory = StratumJob(job, 'deadbeef', 4)
+    works = [factory.next_work('ff' * 32) for _ in range(3)]
+    
+    assert [work['extranonce2'] for work in works] == ['00000000', '00000001', '00000002']
+    assert len({work['block_header'] for work in works}) == 3
+    for work in works:
+        expected = build_header(job, 'deadbeef', work['extranonce2'])
+        assert work['block_header'] == expected.hex()
+    assert factory.header('00000002', nonce=7) == build_header(job, 'deadbeef', '00000002', nonce=7)
+    
+    # A one-byte extranonce2 runs out after 256 headers
+    small = StratumJob(job, 'deadbeef', 1)
+    assert len([small.next_work('ff' * 32) for _ in range(256)]) == 256
+    assert small.next_work('ff' * 32) is None
+
+
+@pytest.mark.asyncio
+async def test_stratum_next_work_rolls_extranonce2():
+    """Test local work generation needs no pool round trip and submits cleanly"""
+    pool = FakePool(difficulty=2**-24)
+    await pool.start()
+    config_path = stratum_config(pool.url)
+    client = PoolClient(config_path, request_timeout=2.0)
+    try:
+        assert await client.connect() is True
+        await client.get_work()
+        works = [client.next_work() for _ in range(3)]
+        for work in works:
+            assert await client.submit_work(dict(work, nonce=find_share(work, work['target']))) is True
+    finally:
+        await client.disconnect()
+        await pool.stop()
+        os.unlink(config_path)
+    
+    assert [work['extranonce2'] for work in works] == ['00000001', '00000002', '00000003']
+    assert len(pool.accepted) == 3
+
+
+@pytest.mark.asyncio
+async def test_stratum_version_rolling():
+    """Test BIP 310 negotiation and a share submitted at rolled version bits"""
+    pool = FakePool(difficulty=2**-24)
+    await pool.start()
+    config_path = stratum_config(pool.url)
+    client = PoolClient(config_path, request_timeout=2.0)
+    try:
+        assert await client.connect() is True
+        work = await client.get_work()
+        header = bytes.fromhex(work['block_header'])
+        rolled = dict(work, block_header=(struct.pack('<I', 0x20002000) + header[4:]).hex())
+        share = dict(work, nonce=find_share(rolled, work['target']), version='20002000')
+        
+        assert await client.submit_work(share) is True
+        assert await client.submit_work(share) is False
+    finally:
+        await client.disconnect()
+        await pool.stop()
+        os.unlink(config_path)
+    
+    assert client.version_mask == 0x1fffe000
+    assert work['version_mask'] == '1fffe000'
+    # Sent as the sixth mining.submit parameter
+    assert pool.accepted[0][-1] == 0x2000
+    assert len(pool.rejected) == 1
+
+
+@pytest.mark.asyncio
+async def test_stratum_without_version_rolling():
+    """Test a pool without mining.configure still connects, with no mask"""
+    pool = FakePool(difficulty=2**-24, version_mask=0)
+    await pool.start()
+    config_path = stratum_config(pool.url)
+    client = PoolClient(config_path, request_timeout=2.0)
+    try:
+        assert await client.connect() is True
+        work = await client.get_work()
+        share = dict(work, nonce=find_share(work, work['target']), version='20000000')
+        assert await client.submit_work(share) is True
+    finally:
+        await client.disconnect()
+        await pool.stop()
+        os.unlink(config_path)
+    
+    assert client.version_mask == 0
+    assert work['version_mask'] == '00000000'
+
+
+@pytest.mark.asyncio
+async def test_stratum_connect_failure():
+    """Test connecting to a closed port fails cleanly"""
+    pool = FakePool()
+    await pool.start()
+    await pool.stop()
+    config_path = stratum_config(pool.url)
+    client = PoolClient(config_path, request_timeout=1.0)
+    try:
+        assert await client.connect() is False
+        assert client.connected is False
+    finally:
+        os.unlink(config_path)
+
+
+def distinct_shares(work, count):
+    """count different valid shares for one work unit"""
+    shares, nonce = [], 0
+    for _ in range(count):
+        nonce = find_share(work, work['target'], nonce)
+        shares.append(dict(work, nonce=nonce))
+        nonce += 1
+    return shares
+
+
+@pytest.mark.asyncio
+async def test_submissions_are_pipelined():
+    """Test shares go out without waiting for earlier replies"""
+    pool = FakePool(difficulty=2**-24, reply_delay=0.2)
+    await pool.start()
+    config_path = stratum_config(pool.url)
+    client = PoolClient(config_path, request_timeout=2.0)
+    try:
+        await client.connect()
+        work = await client.get_work()
+        loop = asyncio.get_running_loop()
+        
+        started = loop.time()
+        verdicts = [await client.submit(share) for share in distinct_shares(work, 5)]
+        sent = loop.time() - started
+        results = await asyncio.gather(*verdicts)
+        elapsed = loop.time() - started
+    finally:
+        await client.disconnect()
+        await pool.stop()
+        os.unlink(config_path)
+    
+    assert results == [True] * 5
+    assert sent < 0.1
+    # One pool round trip for the whole burst, not five
+    assert elapsed < 0.5
+    assert client.shares_accepted == 5
+    assert client.pending == {}
+
+
+@pytest.mark.asyncio
+async def test_submit_backpressure_and_timeout():
+    """Test submit() waits once the pipeline is full, and unanswered shares time out"""
+    pool = FakePool(difficulty=2**-24, reply_delay=0.2)
+    await pool.start()
+    config_path = stratum_config(pool.url)
+    client = PoolClient(config_path, request_timeout=1.0, max_pending_submits=2)
+    try:
+        await client.connect()
+        work = await client.get_work()
+        shares = distinct_shares(work, 3)
+        loop = asyncio.get_running_loop()
+        
+        started = loop.time()
+        await client.submit(shares[0])
+        await client.submit(shares[1])
+        assert loop.time() - started < 0.1
+        last = await client.submit(shares[2])
+        assert loop.time() - started >= 0.15
+        assert await last is True
+        
+        # A pool that stops answering: the share counts as rejected
+        client.request_timeout = 0.05
+        pool.reply_delay = 0.5
+        assert await client.submit_work(dict(shares[0], nonce=shares[2]['nonce'] + 1)) is False
+    finally:
+        await client.disconnect()
+        await pool.stop()
+        os.unlink(config_path)
+    
+    assert client.shares_accepted == 3
+    assert client.shares_rejected == 1
@@ -0,0 +1,91 @@
+"""
+Tests for the serial protocol framing
+"""
+
+from controller.protocol import (
+    FrameDecoder,
+    MSG_PONG,
+    MSG_PROGRESS,
+    PONG_PAYLOAD,
+    PROGRESS_PAYLOAD,
+    encode_command,
+    encode_frame,
+)
+
+
+def test_decoder_mixes_lines_and_frames():
+    """Test JSON lines and binary frames in one stream"""
+    decoder = FrameDecoder()
+    frame = encode_frame(MSG_PROGRESS, PROGRESS_PAYLOAD.pack(2, 1000, 500, 5000, 1024))
+    
+    messages = decoder.feed(b'{"status": "READY", "worker_id": 2}\n' + frame + b'Worker 2 initialized\n')
+    
+    assert messages[0] == {'status': 'READY', 'worker_id': 2}
+    assert messages[1] == {
+        'type': 'PROGRESS',
+        'worker_id': 2,
+        'hashes': 1000,
+        'delta': 500,
+        'ms': 5000,
+        'nonce': 1024
+    }
+    assert len(messages) == 2
+
+
+def test_decoder_keeps_partial_data():
+    """Test that bytes after a message are kept for the next feed"""
+    decoder = FrameDecoder()
+    frame = encode_frame(MSG_PROGRESS, PROGRESS_PAYLOAD.pack(0, 1, 1, 1, 1))
+    stream = b'{"a": 1}\n{"b": 2}\n' + frame
+    
+    first = decoder.feed(stream[:12])
+    rest = decoder.feed(stream[12:-3])
+    last = decoder.feed(stream[-3:])
+    
+    assert first == [{'a': 1}]
+    assert rest == [{'b': 2}]
+    assert last[0]['type'] == 'PROGRESS'
+
+
+def test_decoder_skips_corrupt_frame():
+    """Test CRC failure is counted and the stream resynchronises"""
+    decoder = FrameDecoder()
+    frame = bytearray(encode_frame(MSG_PROGRESS, PROGRESS_PAYLOAD.pack(0, 1, 1, 1, 1)))
+    frame[6] ^= 0xff
+    
+    messages = decoder.feed(bytes(frame) + b'{"ok": true}\n')
+    
+    assert decoder.crc_errors == 1
+    assert messages == [{'ok': True}]
+
+
+def test_decoder_resyncs_after_corrupt_length():
+    """Test a damaged frame header does not swallow the frames behind it"""
+    decoder = FrameDecoder()
+    pongs = b''.join(encode_frame(MSG_PONG, PONG_PAYLOAD.pack(1, seq)) for seq in range(38))
+    bad_size = bytearray(encode_frame(MSG_PONG, PONG_PAYLOAD.pack(1, 99)))
+    bad_size[3] = 0x04
+    # A plausible length (a full PROGRESS) that then fails the CRC
+    bad_crc = bytearray(encode_frame(MSG_PONG, PONG_PAYLOAD.pack(1, 98)))
+    bad_crc[1:4] = bytes([MSG_PROGRESS, PROGRESS_PAYLOAD.size, 0])
+    
+    half = len(pongs) // 2
+    messages = decoder.feed(bytes(bad_size) + pongs[:half] + bytes(bad_crc) + pongs[half:])
+    
+    assert [m['seq'] for m in messages] == list(range(38))
+    assert len(decoder.buffer) == 0
+
+
+def test_work_frame_is_compact():
+    """Test that a binary WORK is much smaller than its JSON form"""
+    work = {
+        'block_header': 'ab' * 80,
+        'target': '0000ffff' + 'f' * 56,
+        'start_nonce': 0,
+        'end_nonce': 2**32
+    }
+    
+    frame = encode_command('WORK', work)
+    
+    assert len(frame) == 8 + 140
+    assert len(encode_command('STOP')) == 8
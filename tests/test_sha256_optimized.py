@@ -0,0 +1,122 @@
+"""
+Tests for the Pico optimized SHA-256 module
+"""
+
+import hashlib
+import os
+import sys
+from array import array
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'pico_firmware'))
+
+import sha256_optimized  # noqa: E402
+
+
+def hashlib_double_sha256(data: bytes) -> bytes:
+    """Reference double SHA-256"""
+    return hashlib.sha256(hashlib.sha256(data).digest()).digest()
+
+
+def test_sha256_matches_hashlib():
+    """Test single SHA-256 against hashlib for several lengths"""
+    for length in (0, 1, 55, 56, 63, 64, 65, 80, 200):
+        data = os.urandom(length)
+        assert sha256_optimized.sha256(data) == hashlib.sha256(data).digest()
+
+
+def test_double_sha256_matches_hashlib():
+    """Test double SHA-256 of an 80-byte header"""
+    header = os.urandom(80)
+    assert sha256_optimized.double_sha256(header) == hashlib_double_sha256(header)
+
+
+def test_midstate_matches_full_hash():
+    """Test that hashing from the midstate gives the full header hash"""
+    header = os.urandom(80)
+    state = sha256_optimized.midstate(header)
+
+    assert sha256_optimized.double_sha256_midstate(state, header[64:]) == hashlib_double_sha256(header)
+
+
+def test_nonce_scanner_matches_hashlib():
+    """Test that the scan kernel returns exactly the hashes below target"""
+    header = os.urandom(80)
+    target = 0x0fffffff << 224
+
+    scanner = sha256_optimized.NonceScanner(header, target)
+
+    for nonce in range(200):
+        full = header[:76] + nonce.to_bytes(4, 'little')
+        expected = hashlib_double_sha256(full)
+        result = scanner.check(nonce)
+        if int.from_bytes(expected[::-1], 'big') < target:
+            assert result == expected
+        else:
+            assert result is None
+
+
+def test_nonce_scanner_max_target():
+    """Test that every nonce is returned with the maximum target"""
+    header = os.urandom(80)
+    scanner = sha256_optimized.NonceScanner(header, 2**256 - 1)
+
+    for nonce in (0, 1, 0x12345678, 0xffffffff):
+        full = header[:76] + nonce.to_bytes(4, 'little')
+        assert scanner.check(nonce) == hashlib_double_sha256(full)
+
+
+def test_inline_block_matches_reference():
+    """Test the flattened compression path against sha256_block"""
+    for _ in range(5):
+        block = os.urandom(64)
+        state = sha256_optimized.sha256_block(os.urandom(64), sha256_optimized.H0)
+        inline_state = array('I', state)
+        sha256_optimized.sha256_block_into(inline_state, block)
+        assert tuple(inline_state) == sha256_optimized.sha256_block(block, state)
+
+
+def test_inline_path_selected():
+    """Test that the inlined path passes its import-time self-test"""
+    assert sha256_optimized.compress is sha256_optimized.sha256_block_into
+
+
+def test_streaming_hasher_matches_hashlib():
+    """Test SHA256.update with uneven chunk sizes"""
+    data = os.urandom(1000)
+    hasher = sha256_optimized.SHA256()
+    offset = 0
+    for size in (1, 63, 64, 65, 7, 300, 500):
+        hasher.update(data[offset:offset + size])
+        offset += size
+
+    assert hasher.digest() == hashlib.sha256(data).digest()
+    # digest() must not consume the state
+    hasher.update(b'more')
+    assert hasher.hexdigest() == hashlib.sha256(data + b'more').hexdigest()
+
+
+def test_scan_returns_hits_and_count():
+    """Test batched scan against per-nonce hashlib results"""
+    header = os.urandom(80)
+    target = 0x0fffffff << 224
+
+    hits, hashed = sha256_optimized.scan(header, target, 1000, 300)
+
+    expected = []
+    for nonce in range(1000, 1300):
+        digest = hashlib_double_sha256(header[:76] + nonce.to_bytes(4, 'little'))
+        if int.from_bytes(digest[::-1], 'big') < target:
+            expected.append((nonce, digest))
+    assert hashed == 300
+    assert hits == expected
+
+
+def test_scan_stops_at_end_of_nonce_space():
+    """Test that scan never wraps past nonce 0xffffffff"""
+    scanner = sha256_optimized.NonceScanner(os.urandom(80), 2**256 - 1)
+
+    hits, hashed = scanner.scan(0xfffffffe, 10)
+
+    assert hashed == 2
+    assert [nonce for nonce, _ in hits] == [0xfffffffe, 0xffffffff]
+    assert bytes(scanner.header[76:]) == b'\xff\xff\xff\xff'
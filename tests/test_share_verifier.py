@@ -0,0 +1,101 @@
+"""
+Tests for controller-side share verification
+"""
+
+import hashlib
+import os
+import struct
+
+from controller.share_verifier import (ABOVE_TARGET, BAD_NTIME, BAD_VERSION, OUT_OF_RANGE, DuplicateFilter,
+                                       ShareVerifier)
+
+
+def full_hash(header: bytes, nonce: int) -> bytes:
+    """Reference double SHA-256 without the midstate"""
+    data = header[:76] + struct.pack('<I', nonce)
+    return hashlib.sha256(hashlib.sha256(data).digest()).digest()
+
+
+def test_midstate_hash_matches_full_hash():
+    """Test hashing from the cached midstate gives the plain double SHA-256"""
+    header = os.urandom(80)
+    verifier = ShareVerifier(header, 'f' * 64)
+    
+    for nonce in (0, 1, 12345, 0xffffffff):
+        assert verifier.hash_nonce(nonce) == full_hash(header, nonce)
+
+
+def test_verify_batch_rejects_bad_shares():
+    """Test range and target checks in one batch"""
+    header = bytes(range(80))
+    # Target exactly at the second-lowest hash: that nonce is not below it,
+    # the lowest one is
+    below, at = sorted(range(100), key=lambda n: full_hash(header, n)[::-1])[:2]
+    target = int.from_bytes(full_hash(header, at)[::-1], 'big')
+    verifier = ShareVerifier(header, format(target, '064x'))
+    
+    results = verifier.verify_batch([
+        (below, 0, 100),
+        (at, 0, 100),
+        (150, 0, 100)
+    ])
+    
+    assert [reason for reason, _ in results] == [None, ABOVE_TARGET, OUT_OF_RANGE]
+    assert results[0][1] == full_hash(header, below)
+
+
+def test_rolled_ntime_within_window():
+    """Test shares at a rolled ntime hash from the same midstate"""
+    header = bytearray(os.urandom(80))
+    header[68:72] = struct.pack('<I', 1000)
+    verifier = ShareVerifier(bytes(header), 'f' * 64, ntime_roll=5)
+    rolled = bytes(header[:68]) + struct.pack('<I', 1005) + bytes(header[72:])
+    
+    assert verifier.hash_nonce(9, 1005) == full_hash(rolled, 9)
+    results = verifier.verify_batch([(9, 0, 100, 1005), (9, 0, 100, 1006), (9, 0, 100, 999)])
+    assert [reason for reason, _ in results] == [None, BAD_NTIME, BAD_NTIME]
+    assert results[0][1] == full_hash(rolled, 9)
+
+
+def test_rolled_version_within_mask():
+    """Test shares at rolled version bits are hashed from their own midstate"""
+    header = bytearray(os.urandom(80))
+    header[0:4] = struct.pack('<I', 0x20000000)
+    verifier = ShareVerifier(bytes(header), 'f' * 64, version_mask=0x1fffe000)
+    rolled = struct.pack('<I', 0x2000e000) + bytes(header[4:])
+    
+    assert verifier.hash_nonce(3, version=0x2000e000) == full_hash(rolled, 3)
+    results = verifier.verify_batch([(3, 0, 10, None, 0x2000e000), (3, 0, 10, None, 0x20000001)])
+    assert [reason for reason, _ in results] == [None, BAD_VERSION]
+    assert results[0][1] == full_hash(rolled, 3)
+
+
+def test_for_work_parses_job_once():
+    """Test a verifier built from a pool job keeps the job for submission"""
+    work = {'block_header': os.urandom(80).hex(), 'target': '0000ffff' + 'f' * 56, 'job_id': 'j'}
+    verifier = ShareVerifier.for_work(work)
+    
+    assert verifier.work is work
+    assert verifier.target == int(work['target'], 16)
+
+
+def test_duplicate_filter_per_job_with_eviction():
+    """Test repeats are caught per job and old jobs are forgotten"""
+    duplicates = DuplicateFilter(max_jobs=2, max_per_job=3)
+    duplicates.start_job('a')
+    
+    assert duplicates.check('a', '00', 100, 5)
+    assert not duplicates.check('a', '00', 100, 5)
+    # Same nonce under another extranonce2 or ntime is a different share
+    assert duplicates.check('a', '01', 100, 5)
+    assert duplicates.check('a', '00', 101, 5)
+    assert duplicates.check('a', '00', 100, 5, '20002000')
+    
+    # Over max_per_job the oldest key goes first
+    assert duplicates.check('a', '00', 100, 6)
+    assert duplicates.check('a', '00', 100, 5)
+    
+    duplicates.start_job('b')
+    duplicates.start_job('c')
+    assert list(duplicates.jobs) == ['b', 'c']
+    assert len(duplicates) == 0
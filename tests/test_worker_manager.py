@@ -2,6 +2,9 @@
 Tests for Worker Manager
 """
 
+import asyncio
+import time
+
 import pytest
 from controller.worker_manager import PicoWorker, WorkerManager
 
@@ -51,3 +54,451 @@ def test_worker_stats_with_workers():
     assert stats[0]['id'] == 0
     assert stats[1]['id'] == 1
     assert stats[0]['connected'] is False
+
+
+@pytest.mark.asyncio
+async def test_pico_worker_queue_work():
+    """Test double-buffered WORK/QUEUE bookkeeping"""
+    worker = PicoWorker('/dev/ttyACM0', 0)
+    worker.is_connected = True
+    first = {'start_nonce': 0, 'end_nonce': 10}
+    second = {'start_nonce': 10, 'end_nonce': 20}
+    
+    # Nothing active yet, so queueing sends plain WORK
+    assert await worker.queue_work(first) is True
+    assert worker.active_work is first
+    assert worker.needs_prefetch is True
+    
+    assert await worker.queue_work(second) is True
+    assert worker.queued_work is second
+    assert worker.needs_prefetch is False
+    
+    # RESULT for the first range promotes the queued one
+    worker.handle_message({'type': 'RESULT', 'valid': False, 'aborted': False})
+    assert worker.active_work is second
+    assert worker.queued_work is None
+
+
+def test_pico_worker_progress_updates_hashrate():
+    """Test hashrate from a time-based PROGRESS record"""
+    worker = PicoWorker('/dev/ttyACM0', 0)
+    
+    worker.handle_message({'type': 'PROGRESS', 'hashes': 1500, 'delta': 500, 'ms': 5000, 'nonce': 1500})
+    
+    assert worker.hashrate == 100.0
+
+
+def test_pico_worker_result_adds_hashes_after_last_progress():
+    """Test RESULT counts only the hashes PROGRESS has not reported yet"""
+    worker = PicoWorker('/dev/ttyACM0', 0)
+    manager = WorkerManager(workers_per_bank=4, number_of_banks=1)
+    worker.meter.attach(manager.get_bank_meter(0))
+    
+    worker.handle_message({'type': 'PROGRESS', 'hashes': 500, 'delta': 500, 'ms': 5000, 'nonce': 500})
+    worker.handle_message({'type': 'RESULT', 'valid': False, 'hashes': 700, 'ms': 7000})
+    
+    assert worker.meter.total_hashes == 700
+    assert worker.hashrate == pytest.approx(100.0)
+    assert manager.fleet_meter.rate == pytest.approx(100.0)
+    
+    worker.reset_hashrate()
+    assert worker.hashrate == 0
+    assert manager.fleet_meter.rate == 0.0
+
+
+class FakeSerial:
+    """Minimal pyserial stand-in capturing writes"""
+    
+    def __init__(self, incoming: bytes = b''):
+        self.written = b''
+        self.incoming = incoming
+    
+    @property
+    def in_waiting(self):
+        return len(self.incoming)
+    
+    def read(self, size):
+        if not self.incoming:
+            # Behave like a port with a short read timeout
+            time.sleep(0.01)
+        data, self.incoming = self.incoming[:size], self.incoming[size:]
+        return data
+    
+    def write(self, data):
+        self.written += data
+        return len(data)
+    
+    def close(self):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_pico_worker_binary_work_frame():
+    """Test WORK is framed in binary once negotiated"""
+    worker = PicoWorker('/dev/ttyACM0', 0)
+    worker.is_connected = True
+    worker.binary = True
+    worker.serial = FakeSerial()
+    
+    await worker.send_work({
+        'block_header': '00' * 80,
+        'target': 'f' * 64,
+        'start_nonce': 0,
+        'end_nonce': 100
+    })
+    
+    assert worker.serial.written[0] == 0xA5
+    assert len(worker.serial.written) == 148
+
+
+@pytest.mark.asyncio
+async def test_pico_worker_reader_dispatches_messages():
+    """Test the reader thread splits replies from RESULT/PROGRESS"""
+    worker = PicoWorker('/dev/ttyACM0', 0)
+    worker.is_connected = True
+    worker.serial = FakeSerial(
+        b'{"type": "PROGRESS", "delta": 10, "ms": 1000}\n'
+        b'{"status": "READY", "worker_id": 0}\n'
+        b'{"type": "RESULT", "valid": false}\n'
+    )
+    worker.start_reader()
+    
+    try:
+        response = await worker.read_response(timeout=1)
+        result = await worker.get_result(timeout=1)
+    finally:
+        worker.disconnect()
+    
+    assert response == {'status': 'READY', 'worker_id': 0}
+    assert result == {'type': 'RESULT', 'valid': False}
+    # PROGRESS was handled on the way through
+    assert worker.hashrate == 10.0
+
+
+@pytest.mark.asyncio
+async def test_pico_worker_on_message_callback():
+    """Test that on_message receives every worker message in order"""
+    worker = PicoWorker('/dev/ttyACM0', 4)
+    received = []
+    worker.on_message = lambda w, message: received.append((w.worker_id, message['type']))
+    worker.serial = FakeSerial(b'{"type": "PROGRESS"}\n{"type": "RESULT"}\n')
+    worker.start_reader()
+    
+    try:
+        for _ in range(100):
+            if len(received) == 2:
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        worker.disconnect()
+    
+    assert received == [(4, 'PROGRESS'), (4, 'RESULT')]
+
+
+@pytest.mark.asyncio
+async def test_pico_worker_reader_restarts_after_quick_reconnect():
+    """Test a reconnect gets a live reader while the old one is still winding down"""
+    worker = PicoWorker('/dev/ttyACM0', 0)
+    worker.serial = FakeSerial()
+    worker.start_reader()
+    old_reader = worker._reader
+    worker.disconnect()
+    
+    # Reconnect before the old thread has noticed the stop
+    worker.serial = FakeSerial(b'{"status": "READY", "worker_id": 0}\n')
+    worker.is_connected = True
+    worker.start_reader()
+    
+    try:
+        assert worker._reader is not old_reader
+        assert await worker.read_response(timeout=1) == {'status': 'READY', 'worker_id': 0}
+    finally:
+        worker.disconnect()
+
+
+class HandshakeSerial(FakeSerial):
+    """FakeSerial that answers HELLO with READY after ignoring a few"""
+    
+    def __init__(self, ignore: int = 0):
+        super().__init__()
+        self.ignore = ignore
+    
+    def write(self, data):
+        if data.startswith(b'HELLO:'):
+            if self.ignore:
+                self.ignore -= 1
+            else:
+                self.incoming += b'{"status": "READY", "worker_id": 0, "binary": true}\n'
+        return super().write(data)
+
+
+@pytest.mark.asyncio
+async def test_pico_worker_handshake_retries_hello():
+    """Test that HELLO is resent until a slow-booting Pico answers"""
+    worker = PicoWorker('/dev/ttyACM0', 0)
+    worker.serial = HandshakeSerial(ignore=2)
+    worker.start_reader()
+    
+    try:
+        assert await worker.handshake(timeout=0.1, retries=3) is True
+    finally:
+        worker.disconnect()
+    
+    assert worker.serial.written.count(b'HELLO:') == 3
+    assert worker.binary is True
+
+
+@pytest.mark.asyncio
+async def test_pico_worker_handshake_gives_up():
+    """Test that handshake fails after the last retry"""
+    worker = PicoWorker('/dev/ttyACM0', 0)
+    worker.serial = HandshakeSerial(ignore=10)
+    worker.start_reader()
+    
+    try:
+        assert await worker.handshake(timeout=0.05, retries=1) is False
+    finally:
+        worker.disconnect()
+    
+    assert worker.serial.written.count(b'HELLO:') == 2
+    assert worker.is_connected is False
+
+
+@pytest.mark.asyncio
+async def test_connect_ports_concurrently(monkeypatch):
+    """Test bounded concurrent handshakes with early on_ready dispatch"""
+    in_flight = []
+    peak = []
+    
+    async def fake_connect(self, baudrate=115200, timeout=1.0, retries=3):
+        in_flight.append(self.worker_id)
+        peak.append(len(in_flight))
+        # Higher worker IDs answer faster
+        await asyncio.sleep(0.01 * (6 - self.worker_id))
+        in_flight.remove(self.worker_id)
+        self.is_connected = self.port != '/dev/ttyACM3'
+        return self.is_connected
+    
+    monkeypatch.setattr(PicoWorker, 'connect', fake_connect)
+    manager = WorkerManager(max_concurrent_connects=3)
+    ready = []
+    
+    async def on_ready(worker):
+        ready.append(worker.worker_id)
+    
+    await manager.connect_ports([f'/dev/ttyACM{i}' for i in range(6)], on_ready)
+    
+    assert max(peak) == 3
+    # Dead port skipped, IDs follow port order, dispatch follows handshakes
+    assert [w.worker_id for w in manager.workers] == [0, 1, 2, 4, 5]
+    assert ready[0] != 0
+    assert sorted(ready) == [0, 1, 2, 4, 5]
+
+
+@pytest.mark.asyncio
+async def test_check_ports_reconnects_with_backoff(monkeypatch):
+    """Test hot-plug: drop, backoff on failed reconnect, then recovery"""
+    present = ['/dev/ttyACM0', '/dev/ttyACM1']
+    answering = {'/dev/ttyACM0', '/dev/ttyACM1'}
+    attempts = []
+    
+    async def fake_connect(self, baudrate=115200, timeout=1.0, retries=3):
+        attempts.append(self.port)
+        self.is_connected = self.port in answering
+        return self.is_connected
+    
+    monkeypatch.setattr(PicoWorker, 'connect', fake_connect)
+    manager = WorkerManager(reconnect_timeout=10)
+    monkeypatch.setattr(manager, 'find_pico_ports', lambda: list(present))
+    events = []
+    
+    async def on_ready(worker):
+        events.append(('ready', worker.worker_id))
+    
+    async def on_lost(worker):
+        events.append(('lost', worker.worker_id))
+    
+    await manager.connect_ports(list(present), on_ready)
+    events.clear()
+    attempts.clear()
+    
+    # Unplugged: reported once, nothing to reconnect to yet
+    present.remove('/dev/ttyACM1')
+    await manager.check_ports(on_ready, on_lost)
+    await manager.check_ports(on_ready, on_lost)
+    assert events == [('lost', 1)]
+    assert manager.get_active_workers() == [manager.workers[0]]
+    assert attempts == []
+    
+    # Back, but not answering yet: one attempt, then wait out the backoff
+    present.append('/dev/ttyACM1')
+    answering.discard('/dev/ttyACM1')
+    await manager.check_ports(on_ready, on_lost)
+    await manager.check_ports(on_ready, on_lost)
+    assert attempts == ['/dev/ttyACM1']
+    assert manager.backoff['/dev/ttyACM1'][0] == 1
+    
+    # Backoff expired and the board answers: same worker object comes back
+    answering.add('/dev/ttyACM1')
+    manager.backoff['/dev/ttyACM1'] = (1, 0.0)
+    await manager.check_ports(on_ready, on_lost)
+    assert events == [('lost', 1), ('ready', 1)]
+    assert len(manager.workers) == 2
+    assert manager.workers[1].is_connected is True
+    assert manager.lost_workers == set()
+
+
+@pytest.mark.asyncio
+async def test_check_ports_adds_new_port(monkeypatch):
+    """Test that a newly plugged board gets the next worker ID"""
+    async def fake_connect(self, baudrate=115200, timeout=1.0, retries=3):
+        self.is_connected = True
+        return True
+    
+    monkeypatch.setattr(PicoWorker, 'connect', fake_connect)
+    manager = WorkerManager()
+    await manager.connect_ports(['/dev/ttyACM0'])
+    monkeypatch.setattr(manager, 'find_pico_ports', lambda: ['/dev/ttyACM0', '/dev/ttyACM5'])
+    
+    await manager.check_ports()
+    
+    assert [(w.worker_id, w.port) for w in manager.workers] == [(0, '/dev/ttyACM0'), (1, '/dev/ttyACM5')]
+
+
+def test_backoff_is_capped():
+    """Test exponential reconnect delay stops at reconnect_timeout"""
+    manager = WorkerManager(reconnect_timeout=5)
+    worker = PicoWorker('/dev/ttyACM0', 0)
+    
+    async def fail(self, baudrate=115200, timeout=1.0, retries=3):
+        return False
+    
+    async def run():
+        loop = asyncio.get_running_loop()
+        delays = []
+        for _ in range(5):
+            await manager._bring_up(worker, asyncio.Semaphore(1), None)
+            delays.append(round(manager.backoff[worker.port][1] - loop.time()))
+        return delays
+    
+    worker.connect = fail.__get__(worker)
+    assert asyncio.run(run()) == [1, 2, 4, 5, 5]
+
+
+class PongSerial(FakeSerial):
+    """FakeSerial that answers PING lines unless muted"""
+    
+    def __init__(self):
+        super().__init__()
+        self.muted = False
+    
+    def write(self, data):
+        if data.startswith(b'PING:') and not self.muted:
+            seq = data.split(b'"seq": ')[1].split(b'}')[0]
+            self.incoming += b'{"type": "PONG", "worker_id": 0, "seq": ' + seq + b'}\n'
+        return super().write(data)
+
+
+@pytest.mark.asyncio
+async def test_ping_measures_round_trip():
+    """Test PING/PONG correlation and RTT recording"""
+    worker = PicoWorker('/dev/ttyACM0', 0)
+    worker.is_connected = True
+    worker.serial = PongSerial()
+    worker.start_reader()
+    
+    try:
+        rtt = await worker.ping(timeout=1)
+        worker.serial.muted = True
+        missed = await worker.ping(timeout=0.05)
+    finally:
+        worker.disconnect()
+    
+    assert rtt is not None and rtt < 1
+    assert missed is None
+    assert worker.last_seen is not None
+
+
+class BenchSerial(FakeSerial):
+    """FakeSerial that answers BENCH lines with a fixed rate"""
+    
+    def write(self, data):
+        if data.startswith(b'BENCH:'):
+            self.incoming += (b'{"type": "BENCH", "worker_id": 0, "hashes": 300, '
+                              b'"ms": 2000, "hashrate": 150.0, "cores": 2}\n')
+        return super().write(data)
+
+
+@pytest.mark.asyncio
+async def test_calibrate_sets_starting_hashrate():
+    """Test BENCH calibration seeds the hashrate until PROGRESS arrives"""
+    worker = PicoWorker('/dev/ttyACM0', 0)
+    worker.is_connected = True
+    worker.serial = BenchSerial()
+    worker.start_reader()
+    
+    try:
+        rate = await worker.calibrate(50)
+    finally:
+        worker.disconnect()
+    
+    assert rate == 150.0
+    assert worker.calibrated_hashrate == 150.0
+    assert worker.hashrate == 150.0
+    assert b'BENCH:{"ms": 50}' in worker.serial.written
+
+
+@pytest.mark.asyncio
+async def test_check_heartbeats_marks_unresponsive(monkeypatch):
+    """Test that missed heartbeats take a worker out of rotation and back"""
+    manager = WorkerManager(workers_per_bank=2, max_missed_heartbeats=2)
+    workers = [PicoWorker(f'/dev/ttyACM{i}', i) for i in range(2)]
+    for worker in workers:
+        worker.is_connected = True
+    manager.workers = workers
+    replies = {0: 0.02, 1: None}
+    
+    async def fake_ping(self, timeout=5.0):
+        return replies[self.worker_id]
+    
+    monkeypatch.setattr(PicoWorker, 'ping', fake_ping)
+    events = []
+    
+    async def on_ready(worker):
+        events.append(('ready', worker.worker_id))
+    
+    async def on_lost(worker):
+        events.append(('lost', worker.worker_id))
+    
+    await manager.check_heartbeats(on_ready, on_lost)
+    assert manager.get_active_workers() == workers
+    await manager.check_heartbeats(on_ready, on_lost)
+    assert manager.get_active_workers() == [workers[0]]
+    assert events == [('lost', 1)]
+    
+    replies[1] = 0.3
+    await manager.check_heartbeats(on_ready, on_lost)
+    assert manager.get_active_workers() == workers
+    assert events == [('lost', 1), ('ready', 1)]
+    
+    (bank,) = manager.get_bank_stats()
+    assert bank['missed_heartbeats'] == 2
+    assert bank['rtt']['count'] == 4
+    assert bank['rtt']['p50_ms'] == 25.0
+    assert bank['rtt']['buckets']['<=500ms'] == 1
+    assert manager.get_worker_stats()[1]['missed_heartbeats'] == 2
+
+
+def test_latency_histogram_percentiles():
+    """Test bucketed percentiles and merging"""
+    from controller.worker_manager import LatencyHistogram
+    
+    first = LatencyHistogram()
+    for rtt_ms in (3, 8, 8, 40):
+        first.record(rtt_ms)
+    second = LatencyHistogram()
+    second.record(9000)
+    
+    assert first.percentile(0.5) == 10.0
+    assert first.merge(second).percentile(0.99) == 9000
+    assert first.as_dict()['buckets']['>5000ms'] == 1